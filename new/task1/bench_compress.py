@@ -0,0 +1,80 @@
+import os
+import json
+import time
+import random
+import socket
+import argparse
+
+from reverseTCPClient import SOURCE_FILE, split_blocks, initialize, exchange_blocks
+from framing import FrameReader, maybe_compress, FEATURE_ZLIB, ZLIB_LEVEL_SHIFT
+from bench_load import free_port, start_server, stop_server, RESULTS_DIR
+
+# === 用真实的客户端流程传一遍文件，返回 (耗时, 结果是否正确) ===
+def transfer(port, blocks, data, window, level):
+    received = []
+    s = socket.create_connection(('127.0.0.1', port))
+    try:
+        reader = FrameReader(s)
+        features = 0 if level is None else FEATURE_ZLIB | level << ZLIB_LEVEL_SHIFT
+        begin = time.perf_counter()
+        accepted, _ = initialize(s, reader, len(blocks), features)
+        if level is not None and not accepted & FEATURE_ZLIB:
+            raise RuntimeError('server did not accept zlib')
+        exchange_blocks(s, reader, blocks, len(blocks), window,
+                        lambda offset, blk: received.append(bytes(blk)), level=level)
+        elapsed = time.perf_counter() - begin
+    finally:
+        s.close()
+    return elapsed, b''.join(reversed(received)) == data[::-1]
+
+# === 线上字节数 / 原始字节数：和客户端发送时一样按帧决定是否压缩 ===
+def wire_ratio(blocks, level):
+    raw = sum(len(blk) for _, blk in blocks)
+    wire = sum(len(maybe_compress(blk, level)[1]) for _, blk in blocks)
+    return wire / raw if raw else 1.0
+
+def main():
+    parser = argparse.ArgumentParser(description='压缩基准：不同块大小下 zlib 各级别的耗时和压缩比')
+    parser.add_argument('--file', default=SOURCE_FILE, help='要传输的文件')
+    parser.add_argument('--block-sizes', default='64-256,1024-4096,16384-65536',
+                        help='逗号分隔的 Lmin-Lmax 设置')
+    parser.add_argument('--levels', default='none,1,6,9', help='逗号分隔的压缩设置，none 表示不压缩')
+    parser.add_argument('--window', type=int, default=32, help='流水线窗口')
+    parser.add_argument('--mode', choices=['thread', 'asyncio'], default='thread', help='服务器模式')
+    parser.add_argument('--seed', type=int, default=1, help='切块的随机种子')
+    parser.add_argument('--output', default=os.path.join(RESULTS_DIR, 'bench_compress.json'),
+                        help='结果写到这个 JSON 文件')
+    args = parser.parse_args()
+
+    with open(args.file, 'rb') as f:
+        data = f.read()
+
+    port = free_port()
+    proc = start_server(args.mode, port, [])
+    runs = []
+    try:
+        for setting in args.block_sizes.split(','):
+            Lmin, Lmax = (int(x) for x in setting.split('-'))
+            random.seed(args.seed)  # split_blocks 用全局 random，各级别切出完全相同的块
+            blocks = split_blocks(data, Lmin, Lmax)
+            for name in args.levels.split(','):
+                level = None if name == 'none' else int(name)
+                elapsed, ok = transfer(port, blocks, data, args.window, level)
+                runs.append({'lmin': Lmin, 'lmax': Lmax, 'blocks': len(blocks), 'level': name,
+                             'seconds': elapsed, 'mb_per_s': len(data) / elapsed / 1e6,
+                             'wire_ratio': wire_ratio(blocks, level), 'correct': ok})
+    finally:
+        stop_server(proc)
+
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump({'file': args.file, 'bytes': len(data), 'runs': runs}, f, indent=2)
+
+    print(f"{'block size':>14} {'level':>6} {'time(s)':>9} {'MB/s':>8} {'wire/raw':>9} {'ok':>4}")
+    for run in runs:
+        print(f"{run['lmin']:>6}-{run['lmax']:<7} {run['level']:>6} {run['seconds']:>9.3f} {run['mb_per_s']:>8.2f} "
+              f"{run['wire_ratio']:>9.3f} {'yes' if run['correct'] else 'NO':>4}")
+    print(f"results written to {args.output}")
+
+if __name__ == '__main__':
+    main()
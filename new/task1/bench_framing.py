@@ -0,0 +1,69 @@
+import socket
+import struct
+import threading
+import time
+import argparse
+
+from framing import FrameReader, send_frame, TYPE_REQUEST
+
+# === 旧写法：三次 sendall + recv(2)/recv(4) + 字节串累加 ===
+def old_send(sock, payload):
+    sock.sendall(struct.pack('!H', TYPE_REQUEST))  # 先发 Type
+    sock.sendall(struct.pack('!I', len(payload)))  # 再发长度
+    sock.sendall(payload)                          # 最后发数据
+
+def old_recv(sock):
+    recv_type = struct.unpack('!H', sock.recv(2))[0]  # 头部不保证收满，和原来的代码一致
+    recv_len = struct.unpack('!I', sock.recv(4))[0]
+    chunk = b''
+    while len(chunk) < recv_len:
+        chunk += sock.recv(recv_len - len(chunk))  # 每次累加都会拷贝一遍已收数据
+    return recv_type, chunk
+
+# === 新写法：framing 模块 ===
+def new_send(sock, payload):
+    send_frame(sock, TYPE_REQUEST, payload)
+
+def make_new_recv(sock):
+    reader = FrameReader(sock)
+    return lambda _sock: reader.read_frame()
+
+# === 在一对本地 socket 上单向发 count 帧，返回每秒字节数 ===
+def run_one(send_fn, recv_factory, block_size, count):
+    a, b = socket.socketpair()
+    payload = b'x' * block_size
+    recv_fn = recv_factory(b)
+
+    def receiver():
+        for _ in range(count):
+            recv_fn(b)
+
+    t = threading.Thread(target=receiver)
+    start = time.perf_counter()
+    t.start()
+    for _ in range(count):
+        send_fn(a, payload)
+    t.join()
+    elapsed = time.perf_counter() - start
+    a.close()
+    b.close()
+    return block_size * count / elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description='framing 层微基准：旧的逐字段收发 vs recv_into + sendmsg')
+    parser.add_argument('--sizes', default='8,1024,65536,1048576,16777216',
+                        help='逗号分隔的块大小（字节）')
+    parser.add_argument('--total', type=int, default=64 * 1024 * 1024,
+                        help='每种块大小大约传输多少字节')
+    parser.add_argument('--max-frames', type=int, default=100000, help='每种块大小最多传多少帧')
+    args = parser.parse_args()
+
+    print(f"{'block':>10} {'frames':>8} {'old MB/s':>10} {'new MB/s':>10} {'speedup':>8}")
+    for size in (int(x) for x in args.sizes.split(',')):
+        count = max(1, min(args.max_frames, args.total // size))
+        old = run_one(old_send, lambda _sock: old_recv, size, count)
+        new = run_one(new_send, make_new_recv, size, count)
+        print(f"{size:>10} {count:>8} {old / 1e6:>10.1f} {new / 1e6:>10.1f} {new / old:>7.2f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,244 @@
+import os
+import sys
+import json
+import time
+import shlex
+import random
+import socket
+import string
+import argparse
+import threading
+import subprocess
+
+from reverseTCPClient import initialize, exchange_blocks
+from framing import FrameReader, FEATURE_BATCH
+
+SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'reverseTCPServer.py')
+PAYLOAD_SIZE = 4 * 1024 * 1024  # 所有块都从这块随机数据里切，客户端不用为每个块单独生成内容
+RSS_POLL_INTERVAL = 0.1         # 压测期间多久采样一次服务器 RSS
+SERVER_START_TIMEOUT = 10.0     # 等服务器开始监听的最长时间
+RESULTS_DIR = 'results'         # 结果 JSON 默认写到这个目录（已在 .gitignore 里），不和源码混在一起
+
+# === 逐个记录延迟，最后精确计算百分位（exchange_blocks 只要求有 add 方法） ===
+class LatencySamples:
+    def __init__(self):
+        self.values = []
+
+    def add(self, seconds):
+        self.values.append(seconds)
+
+# === 排好序的样本里取第 p 百分位 ===
+def percentile(values, p):
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+# === 按分布生成一个客户端的块长度 ===
+# fixed: 都是 size；uniform: Lmin~Lmax 均匀；pareto: 以 Lmin 为下限的重尾分布，截断到 Lmax
+def block_sizes(args, rng):
+    if args.dist == 'fixed':
+        return [args.size] * args.blocks
+    if args.dist == 'uniform':
+        return [rng.randint(args.lmin, args.lmax) for _ in range(args.blocks)]
+    return [min(args.lmax, int(args.lmin * rng.paretovariate(args.alpha))) for _ in range(args.blocks)]
+
+# === 读 /proc 里的 RSS（KB），服务器是多进程模式时把子进程也加上；非 Linux 返回 None ===
+def read_rss_kb(pid):
+    pids = [pid]
+    try:
+        with open(f'/proc/{pid}/task/{pid}/children') as f:
+            pids += [int(x) for x in f.read().split()]
+    except OSError:
+        pass
+    total = 0
+    for p in pids:
+        try:
+            with open(f'/proc/{p}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1])
+        except OSError:
+            if p == pid:
+                return None  # 读不到主进程：不是 Linux 或者进程已经退出
+    return total
+
+# === 压测期间在后台采样服务器 RSS，记录峰值 ===
+class RssSampler:
+    def __init__(self, pid):
+        self.pid = pid
+        self.peak = None
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self):
+        while not self.stop.is_set():
+            rss = read_rss_kb(self.pid)
+            if rss is not None:
+                self.peak = max(self.peak or 0, rss)
+            self.stop.wait(RSS_POLL_INTERVAL)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop.set()
+        self.thread.join()
+
+# === 找一个空闲端口给这一轮的服务器用 ===
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+# === 在本机启动服务器，等到端口能连上再返回 ===
+def start_server(mode, port, extra_args):
+    cmd = [sys.executable, SERVER_SCRIPT, '--host', '127.0.0.1', '--port', str(port),
+           '--mode', mode] + extra_args
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"server exited with code {proc.returncode}: {' '.join(cmd)}")
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()  # 探测连接：服务器收到后读不到 Initialization 直接关闭
+            return proc
+        except OSError:
+            time.sleep(0.05)
+    proc.kill()
+    raise RuntimeError('server did not start listening in time')
+
+def stop_server(proc):
+    proc.terminate()  # SIGTERM：服务器优雅退出
+    try:
+        proc.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+
+# === 一个模拟客户端：建连、协商、流水线发完自己的块，延迟记进 latency ===
+def run_client(k, args, port, payload, latency, results):
+    rng = random.Random(args.seed + k)  # 每个客户端一个种子，不同模式下负载完全相同
+    sizes = block_sizes(args, rng)
+    view = memoryview(payload)
+    blocks = []
+    for size in sizes:
+        start = rng.randrange(len(payload) - size + 1)
+        blocks.append((start, view[start:start + size]))
+
+    def on_answer(offset, blk):
+        if args.verify and blk != view[offset:offset + len(blk)][::-1]:
+            raise ValueError(f"client {k}: wrong answer for block at {offset}")
+
+    s = socket.create_connection(('127.0.0.1', port))
+    try:
+        reader = FrameReader(s)
+        batch_bytes = args.batch_bytes
+        accepted, _ = initialize(s, reader, len(blocks), FEATURE_BATCH if batch_bytes > 0 else 0)
+        if not accepted & FEATURE_BATCH:
+            batch_bytes = 0
+        exchange_blocks(s, reader, blocks, len(blocks), args.window, on_answer, batch_bytes, latency)
+        results[k] = (len(blocks), sum(sizes))
+    finally:
+        s.close()
+
+# === 跑一种服务器模式：启动服务器，M 个客户端同时压测，返回一条结果记录 ===
+def run_mode(mode, args, payload):
+    port = free_port()
+    proc = start_server(mode, port, shlex.split(args.server_args))
+    try:
+        latencies = [LatencySamples() for _ in range(args.clients)]  # 每个客户端各记各的，不用加锁
+        results = [None] * args.clients
+        errors = []
+
+        def client(k):
+            try:
+                run_client(k, args, port, payload, latencies[k], results)
+            except Exception as e:
+                errors.append(f"client {k}: {e}")
+
+        threads = [threading.Thread(target=client, args=(k,)) for k in range(args.clients)]
+        with RssSampler(proc.pid) as rss:
+            begin = time.perf_counter()
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            elapsed = time.perf_counter() - begin
+    finally:
+        stop_server(proc)
+
+    done = [r for r in results if r]
+    blocks = sum(n for n, _ in done)
+    nbytes = sum(b for _, b in done)
+    values = sorted(v for one in latencies for v in one.values)
+    return {
+        'mode': mode,
+        'server_args': args.server_args,
+        'clients': args.clients,
+        'blocks_per_client': args.blocks,
+        'dist': args.dist,
+        'size': args.size, 'lmin': args.lmin, 'lmax': args.lmax, 'alpha': args.alpha,
+        'window': args.window,
+        'batch_bytes': args.batch_bytes,
+        'seed': args.seed,
+        'blocks': blocks,
+        'bytes': nbytes,
+        'seconds': elapsed,
+        'blocks_per_s': blocks / elapsed,
+        'mb_per_s': nbytes / elapsed / 1e6,
+        'latency_ms': {name: percentile(values, p) * 1000
+                       for name, p in (('p50', 50), ('p99', 99), ('p999', 99.9))},
+        'server_peak_rss_kb': rss.peak,
+        'errors': errors,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='reverseTCPServer 压测：本机启动服务器，M 个客户端并发发块')
+    parser.add_argument('--modes', default='thread,asyncio', help='逗号分隔的服务器模式，逐个压测后对比')
+    parser.add_argument('--server-args', default='', help='额外传给服务器的参数，例如 "--workers 4"')
+    parser.add_argument('--clients', type=int, default=32, help='并发客户端数 M')
+    parser.add_argument('--blocks', type=int, default=2000, help='每个客户端发多少块')
+    parser.add_argument('--dist', choices=['fixed', 'uniform', 'pareto'], default='uniform',
+                        help='块长度分布：固定 / Lmin~Lmax 均匀 / 重尾（Pareto）')
+    parser.add_argument('--size', type=int, default=1024, help='fixed 分布的块长度')
+    parser.add_argument('--lmin', type=int, default=64, help='uniform/pareto 分布的最小块长度')
+    parser.add_argument('--lmax', type=int, default=65536, help='uniform/pareto 分布的最大块长度')
+    parser.add_argument('--alpha', type=float, default=1.2, help='pareto 分布的形状参数，越小尾巴越重')
+    parser.add_argument('--window', type=int, default=16, help='每个客户端的流水线窗口')
+    parser.add_argument('--batch-bytes', type=int, default=0, help='batchRequest 字节预算，0 表示逐块发送')
+    parser.add_argument('--seed', type=int, default=1, help='块长度和内容的随机种子')
+    parser.add_argument('--verify', action='store_true', help='逐块检查应答是否是正确的反转')
+    parser.add_argument('--output', default=os.path.join(RESULTS_DIR, 'bench_load.json'), help='结果写到这个 JSON 文件')
+    args = parser.parse_args()
+    if args.dist == 'fixed':
+        args.lmin = args.lmax = args.size
+    if not 1 <= args.lmin <= args.lmax <= PAYLOAD_SIZE:
+        parser.error(f'需要 1 <= Lmin <= Lmax <= {PAYLOAD_SIZE}')
+
+    # 随机字节按查表映射成字母，块内容可读，生成 4 MB 也只要一次 translate
+    letters = string.ascii_letters.encode()
+    table = bytes(letters[i % len(letters)] for i in range(256))
+    payload = random.Random(args.seed).randbytes(PAYLOAD_SIZE).translate(table)
+
+    runs = []
+    for mode in args.modes.split(','):
+        print(f"running mode={mode} clients={args.clients} blocks={args.blocks} dist={args.dist} ...")
+        runs.append(run_mode(mode, args, payload))
+
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump({'runs': runs}, f, indent=2)
+
+    # === 各模式对比 ===
+    print(f"{'mode':>8} {'blocks/s':>10} {'MB/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'p999 ms':>8} "
+          f"{'peak RSS MB':>12} {'errors':>6}")
+    for run in runs:
+        lat = run['latency_ms']
+        rss = f"{run['server_peak_rss_kb'] / 1024:.1f}" if run['server_peak_rss_kb'] else '-'
+        print(f"{run['mode']:>8} {run['blocks_per_s']:>10.0f} {run['mb_per_s']:>8.2f} {lat['p50']:>8.2f} "
+              f"{lat['p99']:>8.2f} {lat['p999']:>8.2f} {rss:>12} {len(run['errors']):>6}")
+    print(f"results written to {args.output}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+import time
+import zlib
+import socket
+import struct
+
+# === 报文类型 ===
+TYPE_INIT = 1     # Initialization：Type(2) + Block num(4)
+TYPE_AGREE = 2    # agree：Type(2)
+TYPE_REQUEST = 3  # reverseRequest：Type(2) + Length(4) + Data
+TYPE_ANSWER = 4   # reverseAnswer：Type(2) + Length(4) + Data
+TYPE_INIT_EX = 5  # 带功能协商的 Initialization：Type(2) + Block num(4) + Features(2)
+TYPE_AGREE_EX = 6 # 带功能协商的 agree：Type(2) + Features(2)，Features 是服务器同意启用的功能
+TYPE_BATCH_REQUEST = 7  # batchRequest：Type(2) + Length(4) + Count(4) + Count × (Length(4) + Data)
+TYPE_BATCH_ANSWER = 8   # batchAnswer：布局同 batchRequest，块内容是反转后的数据
+FLAG_COMPRESSED = 0x8000  # Type 的最高位：payload 是 Orig length(4) + zlib 数据，协商了 zlib 才会出现
+
+# === 可协商的功能（Features 位图） ===
+FEATURE_BATCH = 0x0001  # 一帧携带多个块
+FEATURE_ZLIB = 0x0002   # 帧 payload 可以 zlib 压缩，每帧单独决定
+FEATURE_SESSION = 0x0004  # 断点续传：Initialization 在 Features 后面带 Session ID(16) + 已收到块数(4)，
+                          # agree 在 Features 后面带从第几块开始续传(4)
+ZLIB_LEVEL_SHIFT = 12   # Features 的高 4 位是客户端希望的 zlib 级别（0~9），不是功能位，不参与协商
+ZLIB_LEVEL_MASK = 0xF000
+MIN_COMPRESS_SIZE = 64  # 比这还短的 payload 压缩不划算，直接原样发送
+
+# === 报文头部 ===
+FRAME_HEADER = struct.Struct('!HI')  # Type(2) + Length(4)，Initialization 的 Block num 也是同样布局
+TYPE_ONLY = struct.Struct('!H')      # 只有 Type 的报文（agree）
+FEATURES = struct.Struct('!H')       # 功能位图
+BATCH_COUNT = struct.Struct('!I')    # batch 帧里的块数
+BLOCK_LEN = struct.Struct('!I')      # batch 帧里每个块前面的长度
+ORIG_LEN = struct.Struct('!I')       # 压缩帧 payload 开头的原始长度
+SESSION_INFO = struct.Struct('!16sI')  # Initialization 里的 Session ID + 客户端已经收到并写好的块数
+RESUME_FROM = struct.Struct('!I')      # agree 里服务器确认的续传起点（块序号，从 0 开始）
+SESSION_ID_SIZE = 16
+
+DEFAULT_BUFFER_SIZE = 256 * 1024     # 接收缓冲区初始大小，一次 recv_into 能收下很多个小帧
+HAS_SENDMSG = hasattr(socket.socket, 'sendmsg')  # Windows 上没有 sendmsg，退回到拼接后 sendall
+
+# === 按帧读取，所有数据都收进同一块预分配的 bytearray ===
+class FrameReader:
+    def __init__(self, sock, size=DEFAULT_BUFFER_SIZE):
+        self.sock = sock
+        self.buf = bytearray(size)       # 预分配的接收缓冲区，反复使用
+        self.view = memoryview(self.buf)
+        self.start = 0                   # 还没被取走的数据起点
+        self.end = 0                     # 已经收到的数据终点
+        self.deadline = None             # time.monotonic() 的截止时间，None 表示不限时（socket 保持阻塞模式）
+
+    # === 保证缓冲区里至少有 n 个未取走的字节 ===
+    def _fill(self, n):
+        if self.end - self.start >= n:
+            return  # 数据已经够了，不需要系统调用
+
+        pending = self.end - self.start
+        if self.start + n > len(self.buf):
+            # 尾部空间不够放下这一帧：把剩余数据挪到开头，太小就换一块更大的缓冲区
+            if n > len(self.buf):
+                new_buf = bytearray(max(n, 2 * len(self.buf)))
+                new_buf[:pending] = self.view[self.start:self.end]
+                self.buf = new_buf
+                self.view = memoryview(new_buf)
+            else:
+                self.view[:pending] = self.view[self.start:self.end]
+            self.start = 0
+            self.end = pending
+
+        while self.end - self.start < n:
+            if self.deadline is not None:
+                # 截止时间是整段数据的，不是单次 recv 的：对方一点一点地发也会按时超时
+                remaining = self.deadline - time.monotonic()
+                if remaining <= 0:
+                    raise socket.timeout('timed out')
+                self.sock.settimeout(remaining)
+            # 一次把缓冲区剩余空间都交给内核，流水线时一次 recv_into 往往能收下多个帧
+            received = self.sock.recv_into(self.view[self.end:])
+            if received == 0:
+                raise ConnectionError('对方提前关闭了连接')
+            self.end += received
+
+    # === 取出 n 个字节，返回缓冲区上的 memoryview，不拷贝 ===
+    # 注意：返回的 memoryview 只在下一次读取之前有效
+    def read_exact(self, n):
+        self._fill(n)
+        data = self.view[self.start:self.start + n]
+        self.start += n
+        if self.start == self.end:
+            self.start = self.end = 0  # 缓冲区读空了，下次从头开始收
+        return data
+
+    # === 读只有 Type 的报文（agree） ===
+    def read_type(self):
+        return TYPE_ONLY.unpack(self.read_exact(TYPE_ONLY.size))[0]
+
+    # === 读 Type + Length 头部（Initialization 读出来的是 Type + Block num） ===
+    def read_header(self):
+        return FRAME_HEADER.unpack(self.read_exact(FRAME_HEADER.size))
+
+    # === 读一整帧：返回 (Type, payload 的 memoryview) ===
+    def read_frame(self):
+        msg_type, length = self.read_header()
+        return msg_type, self.read_exact(length)
+
+# === 把多个缓冲区一次写出去，sendmsg 没写完的部分再补发 ===
+def send_buffers(sock, buffers):
+    total = sum(len(b) for b in buffers)
+    if not HAS_SENDMSG:
+        sock.sendall(b''.join(buffers))  # 没有 sendmsg 的平台：拼成一个缓冲区，仍然只发一次
+        return
+
+    sent = sock.sendmsg(buffers)  # 聚集写：头部和数据一次系统调用发出
+    if sent == total:
+        return
+
+    # === 只发出去了一部分（发送缓冲区满或者被信号打断），剩下的逐个 sendall ===
+    for b in buffers:
+        if sent >= len(b):
+            sent -= len(b)  # 这个缓冲区已经完全发出
+            continue
+        sock.sendall(memoryview(b)[sent:])
+        sent = 0
+
+# === 发送一帧：Type + Length + payload ===
+def send_frame(sock, msg_type, payload):
+    send_buffers(sock, [FRAME_HEADER.pack(msg_type, len(payload)), payload])
+
+# === asyncio 模式下写一帧，头部和数据一起交给传输层 ===
+def write_frame(writer, msg_type, payload):
+    writer.writelines((FRAME_HEADER.pack(msg_type, len(payload)), payload))
+
+# === 把多个块打包成 batch 帧的 payload：Count + 每块的 Length + Data ===
+def pack_batch(blocks):
+    parts = [BATCH_COUNT.pack(len(blocks))]
+    for blk in blocks:
+        parts.append(BLOCK_LEN.pack(len(blk)))
+        parts.append(blk)
+    return b''.join(parts)  # 小块拼成一个缓冲区，整帧仍然只需一次 sendmsg
+
+# === 逐个取出 batch 帧里的块，返回 payload 上的 memoryview，不拷贝 ===
+def iter_batch(payload):
+    payload = memoryview(payload)
+    count = BATCH_COUNT.unpack_from(payload)[0]
+    pos = BATCH_COUNT.size
+    for _ in range(count):
+        length = BLOCK_LEN.unpack_from(payload, pos)[0]
+        pos += BLOCK_LEN.size
+        if pos + length > len(payload):
+            raise ValueError('batch 帧里的块长度超出了帧长度')
+        yield payload[pos:pos + length]
+        pos += length
+
+# === 从 Features 里取出 zlib 级别 ===
+def zlib_level(features):
+    return min(9, (features & ZLIB_LEVEL_MASK) >> ZLIB_LEVEL_SHIFT)
+
+# === 按帧决定是否压缩：压缩后确实更短才用，返回 (Type 要或上的标志, 线上发送的 payload) ===
+# level 为 None 表示没有协商压缩；已经压缩过或随机的数据压不小，原样发送
+def maybe_compress(payload, level):
+    if level is None or len(payload) < MIN_COMPRESS_SIZE:
+        return 0, payload
+    packed = zlib.compress(payload, level)
+    if ORIG_LEN.size + len(packed) >= len(payload):
+        return 0, payload
+    return FLAG_COMPRESSED, ORIG_LEN.pack(len(payload)) + packed
+
+# === 解压 zlib 数据，最多解出 orig_len 字节，和声明的长度不一致就报错（防止解压炸弹） ===
+def decompress_block(data, orig_len):
+    d = zlib.decompressobj()
+    try:
+        out = d.decompress(data, orig_len + 1)
+    except zlib.error as e:
+        raise ValueError(f'压缩数据损坏: {e}')
+    if len(out) != orig_len or not d.eof:
+        raise ValueError('解压后的长度与声明的不一致')
+    return out
+
+# === 解压整个压缩帧的 payload：Orig length(4) + zlib 数据 ===
+def decompress_payload(payload):
+    if len(payload) < ORIG_LEN.size:
+        raise ValueError('压缩帧太短')
+    return decompress_block(memoryview(payload)[ORIG_LEN.size:], ORIG_LEN.unpack_from(payload)[0])
@@ -0,0 +1,97 @@
+import json
+import socket
+import logging
+import itertools
+import threading
+
+# === 日志 ===
+LOG_FORMAT = '%(asctime)s %(levelname)s %(message)s'
+LOG_LEVELS = ['debug', 'info', 'warning', 'error']
+PREVIEW_BYTES = 64  # DEBUG 日志里块内容最多显示多少字节，大块不会刷屏
+
+# === 延迟直方图 ===
+LATENCY_BUCKETS = 32  # 第 i 个桶统计 [2^(i-1), 2^i) 微秒的延迟，最后一个桶包含所有更大的值
+
+# === 日志相关的命令行参数，服务器和客户端共用 ===
+def add_logging_args(parser):
+    parser.add_argument('--log-level', choices=LOG_LEVELS, default='warning',
+                        help='日志级别：debug 打印每个块（受 --log-sample 抽样），info 打印连接事件，'
+                             '默认 warning 只打印错误')
+    parser.add_argument('--log-sample', type=int, default=1,
+                        help='DEBUG 级别下每 N 个块只记录 1 个，1 表示全部记录')
+
+def setup_logging(args):
+    logging.basicConfig(level=args.log_level.upper(), format=LOG_FORMAT)
+
+# === 按 1/N 抽样的块日志开关 ===
+# DEBUG 没打开时直接返回 False，调用方连日志内容都不用格式化，热路径上只多一次判断
+class LogSampler:
+    def __init__(self, logger, every=1):
+        self.logger = logger
+        self.every = max(1, every)
+        self.counter = itertools.count()  # next() 在 GIL 下是原子的，多线程共用也不需要锁
+
+    def __call__(self):
+        if not self.logger.isEnabledFor(logging.DEBUG):
+            return False
+        return next(self.counter) % self.every == 0
+
+# === 块内容的预览：最多 PREVIEW_BYTES 字节，按 UTF-8 尽量解码 ===
+def preview(data):
+    text = bytes(data[:PREVIEW_BYTES]).decode('utf-8', errors='ignore')
+    return text if len(data) <= PREVIEW_BYTES else f"{text}...({len(data)} bytes)"
+
+# === 按 2 的幂分桶的延迟直方图，记录一次只是一次下标计算和加一 ===
+# 不是线程安全的，多线程共用时由调用方加锁
+class LatencyHistogram:
+    def __init__(self, counts=None):
+        self.counts = list(counts) if counts else [0] * LATENCY_BUCKETS
+
+    def add(self, seconds, n=1):
+        us = int(seconds * 1e6)
+        self.counts[min(us.bit_length(), LATENCY_BUCKETS - 1)] += n
+
+    def merge(self, counts):
+        for i, c in enumerate(counts):
+            self.counts[i] += c
+
+    def total(self):
+        return sum(self.counts)
+
+    # === 第 p 百分位所在桶的上界（微秒），没有数据时返回 0 ===
+    def percentile(self, p):
+        target = self.total() * p / 100
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if c and seen >= target:
+                return 1 << i
+        return 0
+
+    def summary(self):
+        return {f"p{p}_us": self.percentile(p) for p in (50, 99, 99.9)}
+
+    def __str__(self):
+        if not self.total():
+            return 'latency=-'
+        return ' '.join(f"{key}<={value}" for key, value in self.summary().items())
+
+# === 本地统计端口：每来一个连接就回一行 JSON 快照然后关闭，例如 nc 127.0.0.1 9100 ===
+def start_stats_server(snapshot, host, port):
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    s.bind((host, port))
+    s.listen(16)
+
+    def serve():
+        while True:
+            conn, _ = s.accept()
+            with conn:
+                try:
+                    conn.sendall(json.dumps(snapshot()).encode() + b'\n')
+                except OSError:
+                    pass  # 查询方提前断开，不影响服务
+
+    t = threading.Thread(target=serve, daemon=True)  # 守护线程，主程序退出时自动结束
+    t.start()
+    return s
@@ -1,72 +1,489 @@
-import socket
-import struct
-import sys
-import random
-
-# === 读取命令行参数 ===
-# 用法示例: python reverseTCPClient.py 127.0.0.1 12345 5 10
-server_ip = sys.argv[1]          # 读入第 1 个参数，服务器 IP
-server_port = int(sys.argv[2])   # 读入第 2 个参数，服务器端口，转 int
-Lmin = int(sys.argv[3])          # 从命令行读入第 3 个参数，块最小长度
-Lmax = int(sys.argv[4])          # 从命令行读入第 4 个参数，块最大长度
-
-# === 读取源文件 ===
-with open('source.txt', 'rb') as fin:  # 以二进制方式打开 source.txt
-    data = fin.read()                  # 读取整个文件内容到 data 变量
-
-# === 按 Lmin~Lmax 随机拆块 ===
-blocks = []  # 用列表保存所有拆出来的块
-i = 0        # 块拆分的当前位置
-while i < len(data):  # 循环直到拆完所有数据
-    blk_size = random.randint(Lmin, Lmax)  # 生成 Lmin~Lmax 范围内的随机块大小
-    blk = data[i:i+blk_size]               # 从当前位置切出该块
-    blocks.append(blk)                     # 把块加入列表
-    i += blk_size                          # 更新当前位置
-
-N = len(blocks)  # 总块数
-print(f"总共拆成 {N} 块")  # 打印拆块信息
-
-# === 建立 TCP 连接 ===
-s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)  # 创建 TCP socket
-s.connect((server_ip, server_port))  # 连接到服务器
-print(f"已连接服务器 {server_ip}:{server_port}")  # 打印连接成功
-
-# === 发送 Initialization 报文 ===
-s.sendall(struct.pack('!HI', 1, N))  # 使用网络字节序打包 Type=1 和块数量 N，发送给服务器
-agree_type = struct.unpack('!H', s.recv(2))[0]  # 接收服务器回复的 agree 报文（2 字节）
-print(f"收到 agree 报文: Type={agree_type}")  # 打印服务器回复
-
-# === 准备保存所有反转后块 ===
-all_reversed_blocks = []  # 用列表保存服务器返回的每个反转块
-
-# === 循环发送每块 + 接收返回块 ===
-for idx, blk in enumerate(blocks):  # 遍历每个块，带序号
-    # === 发送 reverseRequest 报文 ===
-    s.sendall(struct.pack('!H', 3))           # 先发 2 字节 Type=3，表示请求反转
-    s.sendall(struct.pack('!I', len(blk)))    # 再发 4 字节块长度
-    s.sendall(blk)                             # 再发块的实际内容
-
-    print(f"已发送 reverseRequest 块 {idx+1}: {blk.decode('utf-8', errors='ignore')}")  # 打印发送信息
-
-    # === 接收 reverseAnswer 报文 ===
-    recv_type = struct.unpack('!H', s.recv(2))[0]  # 收到服务器回复 Type=4
-    recv_len = struct.unpack('!I', s.recv(4))[0]   # 收到反转后块的长度
-
-    # === 收完整的反转块 ===
-    reversed_data = b''  # 初始化空字节串
-    while len(reversed_data) < recv_len:  # 循环直到收够指定长度
-        reversed_data += s.recv(recv_len - len(reversed_data))  # 分批接收
-
-    print(f"已收到 reverseAnswer 块 {idx+1}: {reversed_data.decode('utf-8', errors='ignore')}")  # 打印收到的反转块
-
-    # === 保存到列表 ===
-    all_reversed_blocks.append(reversed_data)  # 把收到的反转块加入列表
-
-# === 所有块收完后，客户端做块顺序反转后写文件 ===
-with open('result.txt', 'wb') as fout:  # 以二进制写模式打开 result.txt
-    for blk in reversed(all_reversed_blocks):  # 对块列表整体做顺序反转
-        fout.write(blk)                        # 按新顺序写入文件
-
-print("已写入 result.txt (顺序反转完成)")  # 提示写文件完成
-
-s.close()  # 关闭 TCP 连接
+import os
+import json
+import mmap
+import socket
+import random
+import threading
+import argparse
+import time
+import logging
+import itertools
+from collections import deque
+
+from framing import (FrameReader, send_frame, pack_batch, iter_batch, maybe_compress, decompress_payload,
+                     FRAME_HEADER, FEATURES, BATCH_COUNT, BLOCK_LEN, TYPE_INIT, TYPE_INIT_EX, TYPE_AGREE_EX,
+                     TYPE_REQUEST, TYPE_BATCH_REQUEST, TYPE_BATCH_ANSWER, FLAG_COMPRESSED, FEATURE_BATCH,
+                     FEATURE_ZLIB, ZLIB_LEVEL_SHIFT, FEATURE_SESSION, SESSION_INFO, RESUME_FROM, SESSION_ID_SIZE)
+from metrics import LatencyHistogram, LogSampler, add_logging_args, setup_logging, preview
+
+SOURCE_FILE = 'source.txt'  # 要发送的源文件
+RESULT_FILE = 'result.txt'  # 反转结果写到这里
+SESSION_FILE = RESULT_FILE + '.session'  # 断点续传的进度，传完后删除
+SESSION_SAVE_INTERVAL = 1.0  # 进度文件最多每隔多少秒写一次
+RETRY_DELAY = 1.0            # 断线后第 k 次重连前等 k * RETRY_DELAY 秒
+
+log = logging.getLogger('reverse.client')
+sample = LogSampler(log)  # 每块的 DEBUG 日志是否记录，main 里按 --log-sample 设置抽样间隔
+
+# === 读取命令行参数 ===
+# 用法示例: python reverseTCPClient.py 127.0.0.1 12345 5 10 [--window 32] [--stream]
+def parse_args():
+    parser = argparse.ArgumentParser(description='Reverse TCP client')
+    parser.add_argument('server_ip', help='服务器 IP')                        # 第 1 个参数，服务器 IP
+    parser.add_argument('server_port', type=int, help='服务器端口')           # 第 2 个参数，服务器端口
+    parser.add_argument('Lmin', type=int, help='块最小长度')                  # 第 3 个参数，块最小长度
+    parser.add_argument('Lmax', type=int, help='块最大长度')                  # 第 4 个参数，块最大长度
+    parser.add_argument('--window', type=int, default=1,
+                        help='同时在途的 reverseRequest 数量，1 表示停等')  # 流水线窗口大小
+    parser.add_argument('--batch-bytes', type=int, default=0,
+                        help='每个 batchRequest 的字节预算，0 表示每块单独发送')  # 小块合并发送
+    parser.add_argument('--stream', action='store_true',
+                        help='流式模式：mmap 源文件按需切块，应答直接按偏移写进 result.txt，内存只和窗口有关')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='流式模式切块用的随机种子，不指定时随机生成')
+    parser.add_argument('--connections', type=int, default=1,
+                        help='把源文件切成 K 段，用 K 条连接并行传输（隐含 --stream）')
+    parser.add_argument('--compress', choices=['none', 'zlib'], default='none',
+                        help='协商 payload 压缩：zlib 时每帧压得更小才压缩，服务器不支持时退回 none')
+    parser.add_argument('--zlib-level', type=int, default=6, choices=range(10), metavar='0-9',
+                        help='zlib 压缩级别，请求和应答两个方向都用这个级别')
+    parser.add_argument('--session', action='store_true',
+                        help='可续传的流式传输（隐含 --stream）：进度记在 result.txt.session，断线后自动重连续传')
+    parser.add_argument('--resume', action='store_true',
+                        help='从 result.txt.session 记录的进度继续上次中断的传输（隐含 --session）')
+    parser.add_argument('--retries', type=int, default=5, help='--session 时每条连接断线后最多重连几次')
+    add_logging_args(parser)
+    args = parser.parse_args()
+    if args.Lmin < 1 or args.Lmax < args.Lmin:
+        parser.error('需要 1 <= Lmin <= Lmax')
+    return args
+
+# === 按 Lmin~Lmax 随机拆块 ===
+def split_blocks(data, Lmin, Lmax):
+    blocks = []  # 用列表保存所有拆出来的块：(起始偏移, 块内容)
+    i = 0        # 块拆分的当前位置
+    while i < len(data):  # 循环直到拆完所有数据
+        blk_size = random.randint(Lmin, Lmax)  # 生成 Lmin~Lmax 范围内的随机块大小
+        blk = data[i:i+blk_size]               # 从当前位置切出该块
+        blocks.append((i, blk))                # 把块加入列表
+        i += blk_size                          # 更新当前位置
+    return blocks
+
+# === 流式模式：用同一个种子可以重复得到同样的块边界，不用把块列表存下来 ===
+def count_blocks(size, Lmin, Lmax, seed):
+    rng = random.Random(seed)
+    N = 0
+    i = 0
+    while i < size:
+        i += rng.randint(Lmin, Lmax)  # 只算块大小，不切数据
+        N += 1
+    return N
+
+def iter_blocks(view, start, end, Lmin, Lmax, seed):
+    rng = random.Random(seed)  # 和 count_blocks 用同一个种子，块边界完全一致
+    i = start
+    while i < end:
+        blk_size = rng.randint(Lmin, Lmax)
+        yield i, view[i:min(i + blk_size, end)]  # mmap 上的 memoryview，发送时才真正读盘；不跨出本段
+        i += blk_size
+
+# === 按偏移写入（没有 os.pwrite 的平台用 seek + write，只有收应答线程在写所以不需要加锁） ===
+def write_at(fout, data, pos):
+    if not hasattr(os, 'pwrite'):
+        fout.seek(pos)
+        fout.write(data)
+        return
+    view = memoryview(data)
+    while view:
+        written = os.pwrite(fout.fileno(), view, pos)
+        view = view[written:]
+        pos += written
+
+# === 按字节预算把连续的块分组，每组用一个 batchRequest 发送 ===
+def group_blocks(blocks, batch_bytes):
+    group = []               # 当前组里的块：(起始偏移, 块内容)
+    size = BATCH_COUNT.size  # 当前组打包后的 payload 大小
+    for offset, blk in blocks:
+        cost = BLOCK_LEN.size + len(blk)  # 每块多占 4 字节长度
+        if group and size + cost > batch_bytes:
+            yield group  # 再加这块就超预算了，先把当前组发出去
+            group, size = [], BATCH_COUNT.size
+        group.append((offset, blk))  # 单块超过预算时也单独成一组
+        size += cost
+    if group:
+        yield group
+
+# === 流水线发送 reverseRequest，最多 window 个请求同时在途 ===
+# blocks 依次给出 (起始偏移, 块内容)，共 N 块；每收到一个反转块就调用 on_answer(起始偏移, 反转块)，
+# 反转块是接收缓冲区上的 memoryview，只在回调里有效。
+# batch_bytes > 0 时按字节预算把多个块合成一个 batchRequest，一个 batch 帧占一个在途名额
+# latency 不为空时记录每块从发出请求到收到应答的时间；level 不为 None 时每帧压得更小就压缩
+def exchange_blocks(s, reader, blocks, N, window, on_answer, batch_bytes=0, latency=None, level=None):
+    slots = threading.Semaphore(window)     # 在途请求名额，发一帧占一个，收到应答还一个
+    pending = deque()                       # 已发出、还没收到应答的块的 (起始偏移, 发送时间)，最多 window 帧
+    errors = []                             # 收应答线程遇到的异常
+
+    # === 收应答的线程：服务器按请求顺序应答，应答里的第 k 个块就是第 k 块 ===
+    def recv_answers():
+        try:
+            idx = 0
+            while idx < N:
+                recv_type, data = reader.read_frame()  # Type + 长度 + 数据，收进复用的接收缓冲区
+                if recv_type & FLAG_COMPRESSED:
+                    recv_type &= ~FLAG_COMPRESSED
+                    data = decompress_payload(data)  # 压缩的应答先解压
+                # batchAnswer 里有多个反转块，reverseAnswer 只有一个
+                answer_blocks = iter_batch(data) if recv_type == TYPE_BATCH_ANSWER else (data,)
+                now = time.perf_counter()
+                for blk in answer_blocks:
+                    offset, sent_at = pending.popleft()
+                    on_answer(offset, blk)  # 交给调用方保存
+                    if latency is not None:
+                        latency.add(now - sent_at)
+                    if sample():
+                        log.debug("已收到 reverseAnswer 块 %d: %s", idx + 1, preview(blk))  # 抽样记录收到的反转块
+                    idx += 1
+                slots.release()  # 归还在途名额，发送方可以继续发
+        except Exception as e:
+            errors.append(e)
+            for _ in range(window):
+                slots.release()  # 唤醒可能正在等名额的发送方
+
+    t = threading.Thread(target=recv_answers)
+    t.start()
+
+    # === 循环发送，窗口满了就等应答 ===
+    try:
+        if batch_bytes > 0:
+            sent = 0  # 已发送的块数
+            for group in group_blocks(blocks, batch_bytes):
+                slots.acquire()  # 在途请求已满 window 个时阻塞
+                if errors:
+                    break  # 收应答出错，不再继续发
+
+                # === 发送 batchRequest 报文：Type=7 + 长度 + Count + 每块的长度和内容 ===
+                sent_at = time.perf_counter()
+                pending.extend((offset, sent_at) for offset, _ in group)  # 先登记偏移，应答可能很快就回来
+                flag, payload = maybe_compress(pack_batch([blk for _, blk in group]), level)
+                send_frame(s, TYPE_BATCH_REQUEST | flag, payload)
+                if sample():
+                    log.debug("已发送 batchRequest 块 %d~%d", sent + 1, sent + len(group))  # 抽样记录发送信息
+                sent += len(group)
+        else:
+            for idx, (offset, blk) in enumerate(blocks):  # 遍历每个块，带序号
+                slots.acquire()  # 在途请求已满 window 个时阻塞
+                if errors:
+                    break  # 收应答出错，不再继续发
+
+                # === 发送 reverseRequest 报文：Type=3 + 4 字节长度 + 块内容，一次 sendmsg 发出 ===
+                pending.append((offset, time.perf_counter()))
+                flag, payload = maybe_compress(blk, level)
+                send_frame(s, TYPE_REQUEST | flag, payload)
+
+                if sample():
+                    log.debug("已发送 reverseRequest 块 %d: %s", idx + 1, preview(blk))  # 抽样记录发送信息
+    except OSError:
+        try:
+            s.shutdown(socket.SHUT_RDWR)  # 发送失败，关掉连接让收应答线程退出
+        except OSError:
+            pass  # 连接已经断了
+        t.join()
+        raise
+
+    t.join()  # 等所有应答收完
+    if errors:
+        raise errors[0]
+
+# === 发送 Initialization，返回 (服务器同意启用的功能, 从第几块开始发) ===
+# 不需要额外功能时发旧的 Type=1，和只认 Type=1 的服务器保持兼容；
+# session 为 (Session ID, 已收到的块数) 时请求续传，服务器在 agree 里确认续传起点。
+# 发了 Type=5 却收到 Type=2 时返回 None：老服务器把 Type=5 当成 Type=1 处理，
+# 后面的 Features 会被它当成下一帧的开头，这条连接已经错位，只能重新连接
+def initialize(s, reader, N, features, session=None):
+    if session is not None:
+        features |= FEATURE_SESSION
+    if not features:
+        s.sendall(FRAME_HEADER.pack(TYPE_INIT, N))  # 使用网络字节序打包 Type=1 和块数量 N，发送给服务器
+    else:
+        message = FRAME_HEADER.pack(TYPE_INIT_EX, N) + FEATURES.pack(features)  # Type=5 + N + 想启用的功能
+        if session is not None:
+            message += SESSION_INFO.pack(*session)  # Session ID + 已经收到并写好的块数
+        s.sendall(message)
+
+    agree_type = reader.read_type()  # 接收服务器回复的 agree 报文
+    if features and agree_type != TYPE_AGREE_EX:
+        log.info("收到 agree 报文: Type=%d，服务器不支持功能协商", agree_type)
+        if session is not None:
+            raise ConnectionError('服务器不支持断点续传')
+        return None
+    accepted = 0
+    resume_from = 0
+    if agree_type == TYPE_AGREE_EX:
+        accepted = FEATURES.unpack(reader.read_exact(FEATURES.size))[0]  # 服务器同意启用的功能
+        if accepted & FEATURE_SESSION:
+            resume_from = RESUME_FROM.unpack(reader.read_exact(RESUME_FROM.size))[0]  # 续传起点
+    log.info("收到 agree 报文: Type=%d, Features=%#06x", agree_type, accepted)  # 记录服务器回复
+    if session is not None and not accepted & FEATURE_SESSION:
+        raise ConnectionError('服务器不支持断点续传')
+    return accepted, resume_from
+
+# === 建立连接并完成 Initialization / agree，返回 (socket, reader, 实际使用的 batch 预算, zlib 级别, 续传起点) ===
+def connect(args, N, session=None):
+    batch_bytes = args.batch_bytes
+    features = FEATURE_BATCH if batch_bytes > 0 else 0
+    if args.compress == 'zlib':
+        features |= FEATURE_ZLIB | args.zlib_level << ZLIB_LEVEL_SHIFT  # 高 4 位带上压缩级别
+    while True:
+        # === 建立 TCP 连接 ===
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)  # 创建 TCP socket
+        s.connect((args.server_ip, args.server_port))  # 连接到服务器
+        log.info("已连接服务器 %s:%d", args.server_ip, args.server_port)  # 记录连接成功
+
+        # === 发送 Initialization 报文，需要 batch 或压缩时协商 ===
+        reader = FrameReader(s)  # 预分配接收缓冲区，整条连接复用
+        try:
+            result = initialize(s, reader, N, features, session)
+        except BaseException:
+            s.close()
+            raise
+        if result is not None:
+            break
+        s.close()  # 老服务器：这条连接已经错位，换一条连接改发 Type=1
+        log.warning("服务器不支持功能协商，重新连接并使用 Type=1 Initialization")
+        features = 0
+    accepted, resume_from = result
+    if batch_bytes > 0 and not accepted & FEATURE_BATCH:
+        log.warning("服务器不支持 batch，改为逐块发送")
+        batch_bytes = 0
+    level = None
+    if args.compress == 'zlib':
+        if accepted & FEATURE_ZLIB:
+            level = args.zlib_level
+        else:
+            log.warning("服务器不支持 zlib 压缩，改为不压缩")
+    return s, reader, batch_bytes, level, resume_from
+
+# === 原来的方式：整个文件读进内存，收完所有块再顺序反转写文件 ===
+def run_in_memory(args):
+    # === 读取源文件 ===
+    with open(SOURCE_FILE, 'rb') as fin:  # 以二进制方式打开 source.txt
+        data = fin.read()                 # 读取整个文件内容到 data 变量
+
+    blocks = split_blocks(data, args.Lmin, args.Lmax)
+    N = len(blocks)  # 总块数
+    print(f"总共拆成 {N} 块")  # 打印拆块信息
+
+    s, reader, batch_bytes, level, _ = connect(args, N)
+
+    # === 发送所有块 + 接收返回块 ===
+    all_reversed_blocks = []  # 按块序号保存服务器返回的反转块
+    latency = LatencyHistogram()
+    exchange_blocks(s, reader, blocks, N, max(1, args.window),
+                    lambda offset, blk: all_reversed_blocks.append(bytes(blk)), batch_bytes, latency, level)
+
+    # === 所有块收完后，客户端做块顺序反转后写文件 ===
+    with open(RESULT_FILE, 'wb') as fout:  # 以二进制写模式打开 result.txt
+        for blk in reversed(all_reversed_blocks):  # 对块列表整体做顺序反转
+            fout.write(blk)                        # 按新顺序写入文件
+
+    print("已写入 result.txt (顺序反转完成)")  # 提示写文件完成
+    print(f"块延迟: {latency}")
+
+    s.close()  # 关闭 TCP 连接
+
+# === 把 [0, size) 切成 K 段连续区间，每段走一条连接 ===
+def split_ranges(size, K):
+    step = -(-size // K)  # 向上取整，最后一段可能短一些
+    return [(start, min(start + step, size)) for start in range(0, size, step)] if size else [(0, 0)]
+
+# === 断点续传的进度文件（JSON）：切块参数、每段的 Session ID 和已经写进 result.txt 的块数 ===
+# 应答按顺序到达，第 k 段已收到 n 块就说明这一段前 n 块都已经写好；进度只会比实际写入的少，
+# 续传时最多重发几块，反转块写回同样的位置，结果不变
+class SessionState:
+    def __init__(self, path, seed, Lmin, Lmax, size, ranges):
+        self.path = path
+        self.seed = seed
+        self.Lmin = Lmin
+        self.Lmax = Lmax
+        self.size = size
+        self.ranges = ranges
+        self.ids = [os.urandom(SESSION_ID_SIZE) for _ in ranges]  # 每段一个会话
+        self.received = [0] * len(ranges)
+        self.lock = threading.Lock()
+        self.saved_at = 0.0
+
+    # === 读出上次的进度；文件不存在、格式不对（旧版本或缺字段），或者切块参数、源文件大小对不上时返回 None ===
+    @classmethod
+    def load(cls, path, Lmin, Lmax, size, connections):
+        try:
+            with open(path) as f:
+                data = json.load(f)
+            if (data['Lmin'], data['Lmax'], data['size'], len(data['ranges'])) != (Lmin, Lmax, size, connections):
+                return None
+            state = cls(path, data['seed'], Lmin, Lmax, size, [tuple(r) for r in data['ranges']])
+            state.ids = [bytes.fromhex(sid) for sid in data['ids']]
+            state.received = list(data['received'])
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        if len(state.ids) != connections or len(state.received) != connections:
+            return None
+        return state
+
+    # === 第 k 段又收到并写好了 n 块；force 为假时按 SESSION_SAVE_INTERVAL 限制写文件的频率 ===
+    def advance(self, k, n, force=False):
+        with self.lock:
+            self.received[k] += n
+            if not force and time.monotonic() - self.saved_at < SESSION_SAVE_INTERVAL:
+                return
+            self.saved_at = time.monotonic()
+            data = {'seed': self.seed, 'Lmin': self.Lmin, 'Lmax': self.Lmax, 'size': self.size,
+                    'ranges': self.ranges, 'ids': [sid.hex() for sid in self.ids], 'received': self.received}
+            with open(self.path + '.tmp', 'w') as f:
+                json.dump(data, f)
+            os.replace(self.path + '.tmp', self.path)  # 先写临时文件再改名，中途被杀也不会留下半个文件
+
+    def save(self):
+        self.advance(0, 0, force=True)
+
+    def remove(self):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+# === 用一条连接处理 [start, end) 这一段，返回 (块数, 耗时)，块延迟记进 latency ===
+# state 不为空时是可续传的第 k 段：断线后最多重连 args.retries 次，从服务器确认的续传起点接着发
+def transfer_range(args, view, start, end, seed, fout, size, latency, state=None, k=0):
+    N = count_blocks(end - start, args.Lmin, args.Lmax, seed)  # 第一遍只算块数，Initialization 要用
+    begin = time.perf_counter()
+
+    def on_answer(offset, blk):
+        write_at(fout, blk, size - offset - len(blk))  # 反转块直接写到最终位置
+        if state is not None:
+            state.advance(k, 1)  # 先写块再记进度，进度不会超过实际写入
+
+    for attempt in itertools.count():
+        session = (state.ids[k], state.received[k]) if state is not None else None
+        try:
+            s, reader, batch_bytes, level, resume_from = connect(args, N, session)
+        except OSError:
+            if state is None or attempt >= args.retries:
+                raise
+            log.warning("第 %d 段连接失败，%.0f 秒后重连", k + 1, (attempt + 1) * RETRY_DELAY)
+            time.sleep((attempt + 1) * RETRY_DELAY)
+            continue
+
+        if state is not None:
+            state.received[k] = resume_from  # 以服务器确认的续传起点为准（不会超过自己收到的块数）
+            if resume_from:
+                log.warning("第 %d 段从第 %d 块续传", k + 1, resume_from + 1)
+        try:
+            blocks = itertools.islice(iter_blocks(view, start, end, args.Lmin, args.Lmax, seed), resume_from, None)
+            exchange_blocks(s, reader, blocks, N - resume_from,
+                            max(1, args.window), on_answer, batch_bytes, latency, level)
+            break
+        except OSError:
+            if state is None or attempt >= args.retries:
+                raise
+            log.warning("第 %d 段连接断开（已收到 %d/%d 块），%.0f 秒后重连",
+                        k + 1, state.received[k], N, (attempt + 1) * RETRY_DELAY)
+            time.sleep((attempt + 1) * RETRY_DELAY)
+        finally:
+            s.close()  # 关闭 TCP 连接
+            if state is not None:
+                state.save()
+    return N, time.perf_counter() - begin
+
+# === 流式模式：内存占用只和在途窗口有关，和文件大小无关 ===
+# 整个文件反转 = 块顺序反转 + 块内反转，所以偏移 offset、长度 L 的块反转后正好落在 size - offset - L。
+# 这个位置和块怎么切、走哪条连接都无关，所以 --connections K 时各段可以并行、各自写自己的位置
+def run_stream(args):
+    seed = args.seed if args.seed is not None else random.randrange(2 ** 32)
+    size = os.path.getsize(SOURCE_FILE)
+    ranges = split_ranges(size, max(1, args.connections))
+
+    # === 可续传：--resume 时沿用上次的种子、分段和进度，result.txt 里已经写好的部分保留 ===
+    state = None
+    if args.resume:
+        state = SessionState.load(SESSION_FILE, args.Lmin, args.Lmax, size, len(ranges))
+        if state is None or not os.path.exists(RESULT_FILE):
+            log.warning("没有可以续传的进度，重新开始传输")
+            state = None
+        else:
+            seed = state.seed
+            print(f"续传上次的传输：各段已收到 {state.received} 块")
+    if state is None and args.session:
+        state = SessionState(SESSION_FILE, seed, args.Lmin, args.Lmax, size, ranges)
+    resuming = state is not None and any(state.received)
+    print(f"源文件 {size} 字节，分成 {len(ranges)} 段并行传输 (seed={seed})")
+
+    with open(SOURCE_FILE, 'rb') as fin, open(RESULT_FILE, 'r+b' if resuming else 'wb') as fout:
+        fout.truncate(size)  # 预先把 result.txt 设成最终大小，之后按偏移写入
+        if state is not None:
+            state.save()  # 先把种子和 Session ID 记下来，第一块还没收到就被中断也能续传
+
+        # 空文件不能 mmap，直接用空的 bytes
+        mm = mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+        if size and hasattr(mm, 'madvise'):
+            mm.madvise(mmap.MADV_SEQUENTIAL)  # 顺序读：内核提前预读，读过的页可以尽早回收
+        view = memoryview(mm)
+        results = [None] * len(ranges)  # 每条连接的 (块数, 耗时)
+        latencies = [LatencyHistogram() for _ in ranges]  # 每条连接各记各的，结束后合并，不用加锁
+        errors = []
+
+        def worker(k, start, end):
+            try:
+                # 每条连接单独打开 result.txt：没有 os.pwrite 时各自 seek + write 互不干扰
+                with open(RESULT_FILE, 'r+b') as part_out:
+                    results[k] = transfer_range(args, view, start, end, seed + k, part_out, size, latencies[k],
+                                                state, k)
+            except Exception as e:
+                errors.append(e)
+
+        try:
+            begin = time.perf_counter()
+            threads = [threading.Thread(target=worker, args=(k, start, end))
+                       for k, (start, end) in enumerate(ranges)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            elapsed = time.perf_counter() - begin
+            if errors:
+                raise errors[0]
+        finally:
+            view.release()  # 先释放 memoryview，mmap 才能关闭
+            if size:
+                try:
+                    mm.close()
+                except BufferError:
+                    pass  # 出错退出时可能还有块的 memoryview 没被回收，留给垃圾回收去关
+
+    if state is not None:
+        state.remove()  # 全部传完，不再需要续传
+    print("已写入 result.txt (流式写入完成)")
+
+    # === 每条连接的吞吐 ===
+    print(f"{'连接':>4} {'字节范围':>25} {'块数':>10} {'耗时(s)':>9} {'MB/s':>9}")
+    for k, ((start, end), (N, seconds)) in enumerate(zip(ranges, results)):
+        print(f"{k+1:>4} {f'{start}~{end}':>25} {N:>10} {seconds:>9.3f} {(end - start) / seconds / 1e6:>9.2f}")
+    print(f"{'合计':>4} {f'0~{size}':>25} {sum(N for N, _ in results):>10} {elapsed:>9.3f} "
+          f"{size / elapsed / 1e6:>9.2f}")
+
+    latency = LatencyHistogram()
+    for one in latencies:
+        latency.merge(one.counts)
+    print(f"块延迟: {latency}")
+
+def main():
+    args = parse_args()
+    setup_logging(args)
+    sample.every = max(1, args.log_sample)
+    args.session = args.session or args.resume
+    if args.stream or args.connections > 1 or args.session:
+        run_stream(args)
+    else:
+        run_in_memory(args)
+
+if __name__ == '__main__':
+    main()
@@ -1,71 +1,958 @@
+import os
+import mmap
+import zlib
 import socket
-import struct
+import signal
 import threading
+import asyncio
+import argparse
+import time
+import queue
+import logging
+import tempfile
+import multiprocessing
+from collections import namedtuple, OrderedDict
+
+from framing import (FrameReader, send_frame, send_buffers, write_frame, pack_batch, iter_batch, maybe_compress,
+                     decompress_block, zlib_level, FRAME_HEADER, TYPE_ONLY, FEATURES, ORIG_LEN,
+                     TYPE_INIT_EX, TYPE_AGREE, TYPE_AGREE_EX, TYPE_REQUEST, TYPE_ANSWER, TYPE_BATCH_REQUEST,
+                     TYPE_BATCH_ANSWER, FLAG_COMPRESSED, FEATURE_BATCH, FEATURE_ZLIB, FEATURE_SESSION,
+                     SESSION_INFO, RESUME_FROM)
+from metrics import (LatencyHistogram, LogSampler, add_logging_args, setup_logging, preview,
+                     start_stats_server)
 
 # === 服务器监听的 IP 和端口 ===
 HOST = '0.0.0.0'  # 监听所有可用网卡地址
 PORT = 12345      # 服务器使用的 TCP 端口
+BACKLOG = 1024    # listen 队列长度，大量并发连接时避免 SYN 被丢
+MAX_CONNECTIONS = 1000  # 默认同时处理的最大连接数，超过的连接排队等待
+ANSWER_QUEUE_SIZE = 64  # 每个连接最多排队多少个待发送的 reverseAnswer
+SUPPORTED_FEATURES = FEATURE_BATCH | FEATURE_ZLIB | FEATURE_SESSION  # 服务器支持、可以被客户端协商启用的功能
+GRACE_PERIOD = 10.0  # 收到停止信号后，最多等多少秒让已有连接处理完
+ACCEPT_POLL_INTERVAL = 0.5  # 线程模式下 accept 最多阻塞多久就回来检查停止标志
+STATS_HOST = '127.0.0.1'  # 统计端口只对本机开放
+SPILL_THRESHOLD = 8 * 1024 * 1024  # reverseRequest 超过这个长度就不再整块放进内存，而是落到临时文件
+SPILL_SEGMENT = 256 * 1024         # 大块按这个大小分段接收和倒序发送，每个连接的内存只和它有关
+SESSION_TTL = 600.0  # 会话的连接断开后，已应答块数保留多少秒供客户端续传
+
+# === 每个连接的期限和限制 ===
+IDLE_TIMEOUT = 300.0   # 两帧之间（以及连上后等 Initialization）最多空闲多少秒
+READ_TIMEOUT = 60.0    # 收到帧头后，每 SPILL_SEGMENT 字节的数据最多等多少秒
+WRITE_TIMEOUT = 60.0   # 每 SPILL_SEGMENT 字节的应答最多花多少秒发出去（对方不读就会超时）
+MAX_PENDING_BYTES = 8 * 1024 * 1024     # 每个连接还没发出去的应答最多多少字节，超过就先不读新请求
+MAX_BLOCKS = 100_000_000                # Initialization 里 Block num 的上限
+MAX_FRAME_BYTES = 64 * 1024 * 1024      # 需要整帧放进内存的帧（batch、压缩帧解压后）最大多少字节
+MAX_INFLIGHT_BYTES = 256 * 1024 * 1024  # 整个进程已经收下、还没应答完的数据最多多少字节
+
+# === 大块落盘的配置：threshold 为 0 表示关闭，segment 是页大小的整数倍 ===
+SpillConfig = namedtuple('SpillConfig', ['threshold', 'segment'])
+
+# === 连接的期限和限制；overflow 为 'reject' 时超过 --max-conn 的连接直接断开，'queue' 时排队 ===
+Limits = namedtuple('Limits', ['idle_timeout', 'read_timeout', 'write_timeout', 'max_pending_bytes',
+                               'max_blocks', 'max_frame_bytes', 'overflow'])
+
+# === 超过限制被拒绝，reason 计入 rejected 统计 ===
+class Rejected(Exception):
+    def __init__(self, reason, message):
+        super().__init__(message)
+        self.reason = reason
+
+# === 按字节计数的额度（线程模式）：用量到上限时 acquire 等别人 release ===
+# 用量为 0 时总能拿到，单个超过上限的请求也不会永远卡住；limit 为 0 表示不限
+class ByteBudget:
+    def __init__(self, limit):
+        self.limit = limit
+        self.used = 0
+        self.cond = threading.Condition()
+
+    def acquire(self, n, timeout):
+        if not self.limit:
+            return True
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.used == 0 or self.used + n <= self.limit, timeout):
+                return False
+            self.used += n
+            return True
+
+    def release(self, n):
+        if not self.limit:
+            return
+        with self.cond:
+            self.used -= n
+            self.cond.notify_all()
+
+# === 同上，asyncio 模式用 ===
+class AsyncByteBudget:
+    def __init__(self, limit):
+        self.limit = limit
+        self.used = 0
+        self.cond = None  # 第一次用时再创建，保证属于正在运行的事件循环
+
+    async def acquire(self, n, timeout):
+        if not self.limit:
+            return True
+        if self.cond is None:
+            self.cond = asyncio.Condition()
+        async with self.cond:
+            try:
+                await asyncio.wait_for(self.cond.wait_for(lambda: self.used == 0 or self.used + n <= self.limit),
+                                       timeout)
+            except asyncio.TimeoutError:
+                return False
+            self.used += n
+            return True
+
+    async def release(self, n):
+        if not self.limit:
+            return
+        async with self.cond:
+            self.used -= n
+            self.cond.notify_all()
+
+# === 一帧数据的期限：每 segment 字节给 timeout 秒，大帧按比例放宽，慢慢挤牙膏的客户端仍会超时 ===
+def frame_timeout(timeout, length, segment):
+    return timeout * max(1, -(-length // segment))
+
+log = logging.getLogger('reverse.server')
+sample = LogSampler(log)  # 每块的 DEBUG 日志是否记录，main 里按 --log-sample 设置抽样间隔
+
+# === 连接和块的计数器（线程模式和 asyncio 模式共用） ===
+class ConnectionStats:
+    def __init__(self):
+        self.lock = threading.Lock()  # 线程模式下多个线程会同时更新计数
+        self.accepted = 0  # 累计 accept 的连接数
+        self.active = 0    # 当前正在处理的连接数
+        self.finished = 0  # 已经处理完并关闭的连接数
+        self.blocks = 0    # 已经应答的块数
+        self.bytes = 0     # 已经应答的块的总字节数
+        self.latency = LatencyHistogram()  # 每块从收到请求到应答发出的延迟
+        self.rejected = {}  # 因为超过限制被断开的连接数，按原因分
+        self.timeouts = {}  # 因为超时被断开的连接数，按阶段分（idle/read/write/busy）
+
+    def on_accept(self):
+        with self.lock:
+            self.accepted += 1
+
+    def on_start(self):
+        with self.lock:
+            self.active += 1
+
+    def on_finish(self):
+        with self.lock:
+            self.active -= 1
+            self.finished += 1
+
+    # === 一帧应答发出：count 个块共 nbytes 字节，batch 帧里的块共用同一个延迟 ===
+    def on_answer(self, count, nbytes, seconds):
+        with self.lock:
+            self.blocks += count
+            self.bytes += nbytes
+            self.latency.add(seconds, count)
+
+    def on_reject(self, reason):
+        with self.lock:
+            self.rejected[reason] = self.rejected.get(reason, 0) + 1
+
+    def on_timeout(self, phase):
+        with self.lock:
+            self.timeouts[phase] = self.timeouts.get(phase, 0) + 1
+
+    def as_dict(self):
+        with self.lock:
+            return {'accepted': self.accepted, 'active': self.active, 'finished': self.finished,
+                    'blocks': self.blocks, 'bytes': self.bytes, 'latency_us': list(self.latency.counts),
+                    'rejected': dict(self.rejected), 'timeouts': dict(self.timeouts)}
+
+    # === 统计端口返回的快照：计数 + 延迟百分位 ===
+    def snapshot(self):
+        counts = self.as_dict()
+        counts.update(LatencyHistogram(counts['latency_us']).summary())
+        return counts
+
+    # === 合并另一个进程交回来的计数（多进程模式退出时汇总） ===
+    def merge(self, counts):
+        with self.lock:
+            self.accepted += counts['accepted']
+            self.active += counts['active']
+            self.finished += counts['finished']
+            self.blocks += counts['blocks']
+            self.bytes += counts['bytes']
+            self.latency.merge(counts['latency_us'])
+            for key, value in counts['rejected'].items():
+                self.rejected[key] = self.rejected.get(key, 0) + value
+            for key, value in counts['timeouts'].items():
+                self.timeouts[key] = self.timeouts.get(key, 0) + value
+
+    def __str__(self):
+        with self.lock:
+            return (f"accepted={self.accepted} active={self.active} finished={self.finished} "
+                    f"blocks={self.blocks} bytes={self.bytes} {self.latency} "
+                    f"rejected={sum(self.rejected.values())} timeouts={sum(self.timeouts.values())}")
+
+# === 一个可续传的会话：客户端声明的总块数，以及已经应答了多少块 ===
+class Session:
+    def __init__(self, sid, block_num):
+        self.sid = sid
+        self.block_num = block_num
+        self.answered = 0              # 已经成功发出应答的块数，只由这个会话当前的连接更新
+        self.expires = float('inf')    # 有连接在用时不过期
+
+# === 会话表：连接断开后会话保留 ttl 秒，按过期时间先后排列，过期的从表头依次清掉 ===
+class SessionTable:
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.sessions = OrderedDict()  # Session ID -> Session
+
+    # === 客户端带着 Session ID 连上来：返回 (会话, 续传起点, 是否是已知会话) ===
+    # 服务器发出的应答可能还在路上就断了，所以续传起点取服务器记录和客户端实际收到的较小值；
+    # 会话不认识（过期、服务器重启、连到了另一个 worker）时反转本身是无状态的，按客户端收到的块数续传也是对的
+    def resume(self, sid, block_num, received):
+        now = time.monotonic()
+        with self.lock:
+            self._expire(now)
+            session = self.sessions.pop(sid, None)
+            known = session is not None and session.block_num == block_num
+            if not known:
+                session = Session(sid, block_num)
+                session.answered = min(received, block_num)
+            else:
+                session.answered = min(received, session.answered)
+            session.expires = float('inf')
+            self.sessions[sid] = session  # 放到表尾
+            return session, session.answered, known
+
+    # === 连接结束：会话开始计时，ttl 秒内没有续传就丢弃 ===
+    def release(self, session):
+        with self.lock:
+            session.expires = time.monotonic() + self.ttl
+            if self.sessions.get(session.sid) is session:
+                self.sessions.move_to_end(session.sid)
+
+    def _expire(self, now):
+        while self.sessions:
+            sid, session = next(iter(self.sessions.items()))
+            if session.expires > now:
+                break
+            del self.sessions[sid]
+
+    def __len__(self):
+        return len(self.sessions)
+
+# === 定时打印连接计数 ===
+def start_stats_reporter(stats, interval, name='Stats'):
+    def report():
+        while True:
+            time.sleep(interval)  # 每隔 interval 秒打印一次
+            print(f"[{name}] {stats}")
+
+    t = threading.Thread(target=report, daemon=True)  # 守护线程，主程序退出时自动结束
+    t.start()
+
+# === 功能协商：只同意服务器支持的那部分，返回 (同意的功能, zlib 级别) ===
+# 没有协商压缩时级别为 None，应答一律原样发送
+def negotiate(features):
+    accepted = features & SUPPORTED_FEATURES
+    return accepted, zlib_level(features) if accepted & FEATURE_ZLIB else None
+
+# === 压缩帧先取出 4 字节原始长度，返回 (去掉标志的 Type, 剩下的 zlib 数据长度, 原始长度) ===
+def split_compressed(recv_type, recv_len, orig_len_bytes):
+    if recv_len < ORIG_LEN.size:
+        raise ValueError('压缩帧太短')
+    return recv_type & ~FLAG_COMPRESSED, recv_len - ORIG_LEN.size, ORIG_LEN.unpack(orig_len_bytes)[0]
+
+# === agree 报文：旧客户端回 Type=2，协商过功能的客户端回 Type=6 + 同意的功能（+ 续传起点） ===
+def agree_message(init_type, features, resume_from=0):
+    if init_type == TYPE_INIT_EX:
+        message = TYPE_ONLY.pack(TYPE_AGREE_EX) + FEATURES.pack(features)
+        if features & FEATURE_SESSION:
+            message += RESUME_FROM.pack(resume_from)
+        return message
+    return TYPE_ONLY.pack(TYPE_AGREE)
+
+# === 反转 batch 帧里的每个块，返回 (块数, batchAnswer 的 payload) ===
+def reverse_batch(payload):
+    reversed_blocks = [blk[::-1].tobytes() for blk in iter_batch(payload)]  # 块顺序不变，各自反转
+    return len(reversed_blocks), pack_batch(reversed_blocks)
+
+# === 超过阈值的大块：边收边写进临时文件，收完后 mmap 映射，倒着分段读出来发送 ===
+# 整块反转 = 段顺序反转 + 段内反转，所以从文件末尾往前逐段反转发送，结果与 chunk[::-1] 一致
+# compressed 为真时收到的是 zlib 数据，边收边解压，每次最多解出 segment 字节，解压后的数据也不会在内存里堆积
+class SpilledBlock:
+    def __init__(self, length, compressed=False, segment=SPILL_SEGMENT):
+        self.length = length    # 解压后的块长度
+        self.segment = segment
+        self.inflater = zlib.decompressobj() if compressed else None
+        self.written = 0
+        self.file = tempfile.TemporaryFile()  # 关闭后自动删除
+        self.mm = None
+
+    def __len__(self):
+        return self.length
+
+    def write(self, data):
+        if self.inflater is None:
+            self._append(data)
+            return
+        data = self.inflater.decompress(data, self.segment)
+        while data:
+            self._append(data)
+            data = self.inflater.decompress(self.inflater.unconsumed_tail, self.segment)
+
+    def _append(self, data):
+        self.written += len(data)
+        if self.written > self.length:
+            raise ValueError('块的实际长度超过了声明的长度')
+        self.file.write(data)
+
+    # === 数据写完，映射成只读 mmap ===
+    def finish(self):
+        if self.written != self.length or (self.inflater is not None and not self.inflater.eof):
+            raise ValueError('块的实际长度与声明的不一致')
+        self.file.flush()
+        self.mm = mmap.mmap(self.file.fileno(), self.length, access=mmap.ACCESS_READ)
+
+    # === 从后往前逐段给出反转后的数据，每段最多 segment 字节 ===
+    # 段边界对齐到 segment 的整数倍，发完的段用 MADV_DONTNEED 还给内核，映射的页不会累积在 RSS 里
+    def reversed_segments(self, segment):
+        view = memoryview(self.mm)
+        try:
+            for start in range((self.length - 1) // segment * segment, -1, -segment):
+                end = min(start + segment, self.length)
+                yield view[start:end][::-1].tobytes()
+                if hasattr(mmap, 'MADV_DONTNEED'):
+                    self.mm.madvise(mmap.MADV_DONTNEED, start, end - start)
+        finally:
+            view.release()
+
+    def close(self):
+        if self.mm is not None:
+            self.mm.close()
+        self.file.close()
+
+# === 线程模式：把线上长度为 wire_len 的块从 reader 分段收进临时文件，块解压后长 length ===
+def spill_block(reader, wire_len, length, compressed, segment):
+    block = SpilledBlock(length, compressed, segment)
+    try:
+        remaining = wire_len
+        while remaining:
+            data = reader.read_exact(min(segment, remaining))  # 每次最多一段，接收缓冲区不会跟着块变大
+            block.write(data)
+            remaining -= len(data)
+        block.finish()
+    except BaseException:
+        block.close()
+        raise
+    return block
+
+# === asyncio 模式：同上，数据来自 StreamReader ===
+async def spill_block_async(reader, wire_len, length, compressed, segment):
+    block = SpilledBlock(length, compressed, segment)
+    try:
+        remaining = wire_len
+        while remaining:
+            data = await reader.readexactly(min(segment, remaining))
+            block.write(data)  # 写的是页缓存，一般不会阻塞事件循环太久
+            remaining -= len(data)
+        block.finish()
+    except BaseException:
+        block.close()
+        raise
+    return block
+
+# === 发送落盘大块的 reverseAnswer：头部里是整块长度，数据分段倒序发出，线程模式用 ===
+# 头部和第一段一起发出，避免只有 6 字节的头部单独成包、后面的数据被 Nagle 算法拖住
+def send_spilled(conn, msg_type, block, segment):
+    buffers = [FRAME_HEADER.pack(msg_type, len(block))]
+    for data in block.reversed_segments(segment):
+        buffers.append(data)
+        send_buffers(conn, buffers)
+        buffers = []
 
-# === 客户端处理函数 ===
-def handle_client(conn, addr):
-    print(f"Connected by {addr}")  # 打印新连接的客户端地址
+# === 发送 reverseAnswer 的线程（线程模式） ===
+# 读请求和写应答分开，客户端流水线发来的请求不用等前面的应答写完才被读取
+# level 不为 None 时按帧决定是否压缩，压缩在这个线程里做（zlib 会释放 GIL），不拖慢读请求。
+# 每个应答发完（或者连接坏了被丢弃）后归还它占的连接额度 pending 和全局额度 inflight
+def answer_writer(out, answers, stats, spill, level, session, limits, pending, inflight):
+    failed = False
+    while True:
+        item = answers.get()  # 阻塞等下一个待发送的应答
+        if item is None:
+            break  # 收到结束标记，所有应答都已发送
+
+        msg_type, payload, count, received_at, held, desc = item
+        try:
+            if failed:
+                if isinstance(payload, SpilledBlock):
+                    payload.close()
+                continue  # 连接已经坏了，只把队列清空，避免读线程卡在 put 上
+
+            nbytes = len(payload)
+            if isinstance(payload, SpilledBlock):
+                # === 落盘的大块：分段倒序发送（不压缩），每段各有 write_timeout，发完删除临时文件 ===
+                out.settimeout(limits.write_timeout)
+                try:
+                    send_spilled(out, msg_type, payload, spill.segment)
+                finally:
+                    payload.close()
+            else:
+                # === 发送应答报文：Type (2 bytes) + 长度 (4 bytes) + 数据，一次 sendmsg ===
+                flag, payload = maybe_compress(payload, level)
+                out.settimeout(frame_timeout(limits.write_timeout, len(payload), spill.segment))
+                send_frame(out, msg_type | flag, payload)
+            stats.on_answer(count, nbytes, time.perf_counter() - received_at)
+            if session is not None:
+                session.answered += count  # 只有这个线程更新，不需要加锁
+            if sample():
+                log.debug("Sent %s", desc)  # 抽样记录发送成功
+        except OSError as e:
+            if isinstance(e, TimeoutError):
+                stats.on_timeout('write')  # 对方长时间不读应答
+            log.warning("Error sending %s: %s", desc, e)
+            failed = True
+            try:
+                out.shutdown(socket.SHUT_RD)  # 让读线程的 recv 立即返回，尽快结束这个连接
+            except OSError:
+                pass
+        finally:
+            pending.release(held)
+            inflight.release(held)
+
+# === 客户端处理函数（线程模式） ===
+# 读和写各有各的期限：读用 conn（FrameReader 按截止时间设置超时），写用 dup 出来的 socket，超时互不影响
+def handle_client(conn, addr, stats, slots, spill, sessions, limits, inflight):
+    stats.on_start()  # 开始处理，active +1
+    log.info("Connected by %s", addr)  # 记录新连接的客户端地址
+
+    answers = queue.Queue(ANSWER_QUEUE_SIZE)  # 待发送的应答，队列满时读线程暂停读新请求
+    pending = ByteBudget(limits.max_pending_bytes)  # 这个连接还没发出去的应答字节数
+    writer = None
+    session = None
+    phase = 'idle'  # 当前在等什么，超时时按它计数
+    out = conn.dup()  # 发送线程专用，超时单独设置
 
     try:
-        # === 收 Initialization 报文 ===
-        data = conn.recv(6)  # 从连接中读取 6 字节 (2 bytes Type + 4 bytes Block num)
-        msg_type, block_num = struct.unpack('!HI', data)  # 使用网络字节序解包成 Type 和块数量
-        print(f"Received Initialization: Type={msg_type}, Block num={block_num}")  # 打印收到的信息
+        reader = FrameReader(conn)  # 预分配接收缓冲区，整条连接复用
+
+        # === 收 Initialization 报文（旧客户端 Type=1，需要协商功能的客户端 Type=5） ===
+        reader.deadline = time.monotonic() + limits.idle_timeout  # 连上之后迟迟不发 Initialization 也算空闲
+        msg_type, block_num = reader.read_header()  # 收满 6 字节 (2 bytes Type + 4 bytes Block num) 并解包
+        features, level = 0, None
+        answered = 0  # 已经处理的块数（一个 batch 帧算多个块），续传时从续传起点开始
+        if block_num > limits.max_blocks:
+            raise Rejected('block_num', f"Block num {block_num} exceeds limit {limits.max_blocks}")
+        if msg_type == TYPE_INIT_EX:
+            requested = FEATURES.unpack(reader.read_exact(FEATURES.size))[0]  # 再读 2 字节功能位图
+            features, level = negotiate(requested)
+            if requested & FEATURE_SESSION:
+                sid, received = SESSION_INFO.unpack(reader.read_exact(SESSION_INFO.size))  # Session ID + 已收到块数
+                session, answered, known = sessions.resume(sid, block_num, received)
+                log.info("Session %s from %s: %s, resume from block %d",
+                         sid.hex(), addr, 'resumed' if known else 'new', answered + 1)
+        log.info("Received Initialization from %s: Type=%d, Block num=%d", addr, msg_type, block_num)
+
+        writer = threading.Thread(target=answer_writer, args=(out, answers, stats, spill, level, session,
+                                                              limits, pending, inflight))
+        writer.start()
 
         # === 回复 agree 报文 ===
-        conn.sendall(struct.pack('!H', 2))  # 使用网络字节序打包 Type=2 并发送，表示同意
-        print("Sent agree: Type=2")  # 打印确认信息
+        conn.sendall(agree_message(msg_type, features, answered))  # 使用网络字节序打包 agree 并发送，表示同意
+        log.info("Sent agree to %s: Features=%#06x", addr, features)
+
+        # === 循环接收，直到客户端声明的块数都处理完 ===
+        while answered < block_num:
+            phase = 'idle'
+            reader.deadline = time.monotonic() + limits.idle_timeout
+            recv_type, recv_len = reader.read_header()  # 先收 Type + 长度
+            phase = 'read'
+            reader.deadline = time.monotonic() + frame_timeout(limits.read_timeout, recv_len, spill.segment)
+            orig_len = recv_len  # 块解压后的长度，没压缩时就是 Length
+            compressed = recv_type & FLAG_COMPRESSED
+            if compressed:
+                if level is None:
+                    raise ValueError('收到压缩帧，但没有协商压缩')
+                recv_type, recv_len, orig_len = split_compressed(recv_type, recv_len,
+                                                                 reader.read_exact(ORIG_LEN.size))
 
-        # === 循环接收每个块 ===
-        for idx in range(block_num):  # 根据客户端声明的块数循环处理
-            # === 收块的 Type ===
-            recv_type = struct.unpack('!H', conn.recv(2))[0]  # 先读 2 字节 Type 并解包
+            spilled = recv_type == TYPE_REQUEST and spill.threshold and max(recv_len, orig_len) > spill.threshold
+            if not spilled and max(recv_len, orig_len) > limits.max_frame_bytes:
+                raise Rejected('frame_size', f"frame of {max(recv_len, orig_len)} bytes exceeds limit "
+                                             f"{limits.max_frame_bytes}")
 
-            # === 收块的长度 ===
-            recv_len = struct.unpack('!I', conn.recv(4))[0]  # 再读 4 字节长度并解包
+            # === 先占额度再收数据：连接里积压的应答太多、或者整个进程收下的数据太多时，先不读 ===
+            held = spill.segment if spilled else orig_len
+            phase = 'busy'
+            if not inflight.acquire(held, limits.read_timeout):
+                raise socket.timeout('server in-flight byte limit reached')
+            if not pending.acquire(held, limits.write_timeout):
+                inflight.release(held)
+                raise socket.timeout('client is not reading its answers')
+            phase = 'read'
 
-            # === 收块的数据 ===
-            chunk = b''  # 初始化空字节串，存放接收的数据
-            while len(chunk) < recv_len:  # 循环，直到收够 recv_len 个字节
-                chunk += conn.recv(recv_len - len(chunk))  # 一次可能收不完，所以循环累加
+            try:  # 每个分支的最后一步都是把应答（连同额度）交给发送线程
+                if spilled:
+                    # === 超大的块：分段落到临时文件，由发送线程倒序分段发回，不在内存里拼整块 ===
+                    block = spill_block(reader, recv_len, orig_len, compressed, spill.segment)
+                    log.info("Spilled reverseRequest %d from %s to disk: Length=%d", answered + 1, addr, orig_len)
+                    answers.put((TYPE_ANSWER, block, 1, time.perf_counter(), held,
+                                 f"reverseAnswer {answered+1} (spilled)"))
+                    answered += 1
+                    continue
 
-            print(f"Received reverseRequest: Type={recv_type}, Length={recv_len}")  # 打印收到的块信息
-            print(f"Original chunk: {chunk.decode('utf-8', errors='ignore')}")  # 尝试以 UTF-8 解码原文，方便看内容
+                # === 收块的数据，是接收缓冲区上的 memoryview ===
+                chunk = reader.read_exact(recv_len)
+                if compressed:
+                    chunk = memoryview(decompress_block(chunk, orig_len))
+                received_at = time.perf_counter()  # 块延迟从整帧收齐开始算
 
-            # === 反转块内容 ===
-            reversed_chunk = chunk[::-1]  # 用切片语法把字节串反转
-            print(f"Reversed chunk: {reversed_chunk.decode('utf-8', errors='ignore')}")  # 打印反转后的结果
+                if recv_type == TYPE_BATCH_REQUEST and features & FEATURE_BATCH:
+                    # === batchRequest：一帧多个块，逐块反转后一起应答 ===
+                    count, answer = reverse_batch(chunk)
+                    if sample():
+                        log.debug("Received batchRequest: Count=%d, Length=%d", count, recv_len)
+                    answers.put((TYPE_BATCH_ANSWER, answer, count, received_at, held,
+                                 f"batchAnswer for blocks {answered+1}~{answered+count}"))
+                    answered += count
+                    continue
 
-            # === 发送 reverseAnswer 报文 ===
-            conn.sendall(struct.pack('!H', 4))  # 先发 Type=4 (2 bytes)，表示反转应答
-            conn.sendall(struct.pack('!I', len(reversed_chunk)))  # 再发长度 (4 bytes)
-            conn.sendall(reversed_chunk)  # 最后发反转后的实际数据
+                if recv_type != TYPE_REQUEST:
+                    raise ValueError(f"unexpected message type {recv_type}")
 
-            print(f"Sent reverseAnswer {idx+1}")  # 打印发送成功
+                # === 反转块内容 ===
+                reversed_chunk = chunk[::-1].tobytes()  # 反向切片后拷贝一次，缓冲区可以马上被下一帧复用
+                if sample():
+                    # 抽样记录收到的块，内容只显示开头一段
+                    log.debug("Received reverseRequest: Length=%d, Original chunk: %s, Reversed chunk: %s",
+                              recv_len, preview(chunk), preview(reversed_chunk))
+
+                # === 交给发送线程发 reverseAnswer，自己继续读下一个请求 ===
+                answers.put((TYPE_ANSWER, reversed_chunk, 1, received_at, held, f"reverseAnswer {answered+1}"))
+                answered += 1
+            except BaseException:
+                # 应答还没交给发送线程就出错了，额度由自己归还；交出去之后由发送线程归还
+                pending.release(held)
+                inflight.release(held)
+                raise
+
+    except socket.timeout as e:
+        stats.on_timeout(phase)
+        log.warning("Timed out (%s) handling client %s: %s", phase, addr, e)
+
+    except Rejected as e:
+        stats.on_reject(e.reason)
+        log.warning("Rejected client %s: %s", addr, e)
 
     except Exception as e:
-        print(f"Error handling client {addr}: {e}")  # 捕获异常并打印错误信息
+        log.warning("Error handling client %s: %s", addr, e)  # 捕获异常并记录错误信息
 
     finally:
+        if writer is not None:
+            answers.put(None)  # 通知发送线程：没有更多应答了
+            writer.join()  # 等已经排队的应答发完再关连接
+        if session is not None:
+            sessions.release(session)  # 会话开始计时，客户端断线后可以在 ttl 内续传
+        out.close()
         conn.close()  # 无论是否异常，都要关闭与客户端的连接
-        print(f"Connection with {addr} closed.")  # 打印连接关闭信息
+        stats.on_finish()  # active -1，finished +1
+        slots.release()  # 归还一个连接名额，accept 循环可以继续接新连接
+        log.info("Connection with %s closed. (%s)", addr, stats)  # 记录连接关闭信息和当前计数
+
+# === 客户端处理协程（asyncio 模式），协议和 handle_client 完全一致 ===
+# 读写期限用 wait_for；发送缓冲区的高水位设成 max_pending_bytes，drain 等到对方读走才继续读新请求
+async def handle_client_async(reader, writer, stats, slots, spill, sessions, limits, inflight):
+    addr = writer.get_extra_info('peername')  # 客户端地址
+    stats.on_accept()  # 已经被事件循环 accept
+
+    if limits.overflow == 'reject' and slots.locked():
+        stats.on_reject('connections')  # 连接数已满，直接断开，不排队
+        log.warning("Rejected client %s: connection limit reached", addr)
+        writer.close()
+        return
+
+    async with slots:  # 超过连接上限时在这里排队，不占线程
+        stats.on_start()
+        log.info("Connected by %s", addr)
+        session = None
+        phase = 'idle'  # 当前在等什么，超时时按它计数
+        if limits.max_pending_bytes:
+            writer.transport.set_write_buffer_limits(high=limits.max_pending_bytes)
+
+        async def drain(length):
+            await asyncio.wait_for(writer.drain(), frame_timeout(limits.write_timeout, length, spill.segment))
+
+        try:
+            # === 收 Initialization 报文 ===
+            # 连上之后迟迟不发 Initialization 也算空闲
+            data = await asyncio.wait_for(reader.readexactly(FRAME_HEADER.size), limits.idle_timeout)
+            msg_type, block_num = FRAME_HEADER.unpack(data)
+            features, level = 0, None
+            answered = 0
+            if block_num > limits.max_blocks:
+                raise Rejected('block_num', f"Block num {block_num} exceeds limit {limits.max_blocks}")
+            if msg_type == TYPE_INIT_EX:
+                requested = FEATURES.unpack(await asyncio.wait_for(reader.readexactly(FEATURES.size),
+                                                                   limits.read_timeout))[0]
+                features, level = negotiate(requested)
+                if requested & FEATURE_SESSION:
+                    sid, received = SESSION_INFO.unpack(await asyncio.wait_for(
+                        reader.readexactly(SESSION_INFO.size), limits.read_timeout))
+                    session, answered, known = sessions.resume(sid, block_num, received)
+                    log.info("Session %s from %s: %s, resume from block %d",
+                             sid.hex(), addr, 'resumed' if known else 'new', answered + 1)
+            log.info("Received Initialization from %s: Type=%d, Block num=%d", addr, msg_type, block_num)
+
+            # === 回复 agree 报文 ===
+            phase = 'write'
+            writer.write(agree_message(msg_type, features, answered))
+            await drain(0)
+            log.info("Sent agree to %s: Features=%#06x", addr, features)
+
+            # === 循环接收，直到客户端声明的块数都处理完 ===
+            while answered < block_num:
+                # === 收 Type + 长度 ===
+                phase = 'idle'
+                recv_type, recv_len = FRAME_HEADER.unpack(
+                    await asyncio.wait_for(reader.readexactly(FRAME_HEADER.size), limits.idle_timeout))
+                phase = 'read'
+                read_timeout = frame_timeout(limits.read_timeout, recv_len, spill.segment)
+                orig_len = recv_len  # 块解压后的长度，没压缩时就是 Length
+                compressed = recv_type & FLAG_COMPRESSED
+                if compressed:
+                    if level is None:
+                        raise ValueError('收到压缩帧，但没有协商压缩')
+                    recv_type, recv_len, orig_len = split_compressed(
+                        recv_type, recv_len, await asyncio.wait_for(reader.readexactly(ORIG_LEN.size), read_timeout))
+
+                spilled = recv_type == TYPE_REQUEST and spill.threshold and max(recv_len, orig_len) > spill.threshold
+                if not spilled and max(recv_len, orig_len) > limits.max_frame_bytes:
+                    raise Rejected('frame_size', f"frame of {max(recv_len, orig_len)} bytes exceeds limit "
+                                                 f"{limits.max_frame_bytes}")
+
+                # === 先占全局额度再收数据，整个进程收下的数据太多时先不读 ===
+                held = spill.segment if spilled else orig_len
+                phase = 'busy'
+                if not await inflight.acquire(held, limits.read_timeout):
+                    raise asyncio.TimeoutError()  # 记为 busy 超时
+                phase = 'read'
+
+                try:
+                    if spilled:
+                        # === 超大的块：分段落到临时文件，再倒序分段发回（不压缩） ===
+                        block = await asyncio.wait_for(
+                            spill_block_async(reader, recv_len, orig_len, compressed, spill.segment), read_timeout)
+                        received_at = time.perf_counter()
+                        log.info("Spilled reverseRequest %d from %s to disk: Length=%d", answered + 1, addr, orig_len)
+                        phase = 'write'
+                        try:
+                            buffers = [FRAME_HEADER.pack(TYPE_ANSWER, orig_len)]  # 头部和第一段一起写
+                            for data in block.reversed_segments(spill.segment):
+                                buffers.append(data)
+                                writer.writelines(buffers)
+                                buffers = []
+                                await drain(len(data))  # 每段都等发送缓冲区降下来，内存里最多积压一段
+                        finally:
+                            block.close()
+                        stats.on_answer(1, orig_len, time.perf_counter() - received_at)
+                        answered += 1
+                        if session is not None:
+                            session.answered = answered
+                        continue
+
+                    # === 收块的数据，readexactly 内部保证收满 ===
+                    chunk = await asyncio.wait_for(reader.readexactly(recv_len), read_timeout)
+                    if compressed:
+                        chunk = decompress_block(chunk, orig_len)
+                    received_at = time.perf_counter()  # 块延迟从整帧收齐开始算
+
+                    if recv_type == TYPE_BATCH_REQUEST and features & FEATURE_BATCH:
+                        # === batchRequest：一帧多个块，逐块反转后一起应答 ===
+                        count, answer = reverse_batch(chunk)
+                        flag, wire = maybe_compress(answer, level)
+                        phase = 'write'
+                        write_frame(writer, TYPE_BATCH_ANSWER | flag, wire)
+                        await drain(len(wire))
+                        stats.on_answer(count, len(answer), time.perf_counter() - received_at)
+                        if sample():
+                            log.debug("Sent batchAnswer for blocks %d~%d (Length=%d)",
+                                      answered + 1, answered + count, recv_len)
+                        answered += count
+                        if session is not None:
+                            session.answered = answered
+                        continue
+
+                    if recv_type != TYPE_REQUEST:
+                        raise ValueError(f"unexpected message type {recv_type}")
+
+                    # === 反转块内容 ===
+                    reversed_chunk = chunk[::-1]
+
+                    # === 发送 reverseAnswer 报文 ===
+                    # write 只是放进传输层缓冲区，drain 在缓冲区低于水位线时立即返回，
+                    # 所以客户端流水线发来的后续请求会继续被读取，不用等前面的应答真正发出去
+                    flag, wire = maybe_compress(reversed_chunk, level)  # 协商了压缩且压得小才压缩
+                    phase = 'write'
+                    write_frame(writer, TYPE_ANSWER | flag, wire)  # Type=4 + 长度 + 反转后的数据
+                    await drain(len(wire))  # 发送缓冲区过高时等待对方接收
+                    stats.on_answer(1, orig_len, time.perf_counter() - received_at)
+                finally:
+                    await inflight.release(held)
+
+                if sample():
+                    # 抽样记录收到的块，内容只显示开头一段
+                    log.debug("Sent reverseAnswer %d: Length=%d, Original chunk: %s, Reversed chunk: %s",
+                              answered + 1, recv_len, preview(chunk), preview(reversed_chunk))
+                answered += 1
+                if session is not None:
+                    session.answered = answered
+
+        except asyncio.TimeoutError:
+            stats.on_timeout(phase)
+            log.warning("Timed out (%s) handling client %s", phase, addr)
+
+        except Rejected as e:
+            stats.on_reject(e.reason)
+            log.warning("Rejected client %s: %s", addr, e)
+
+        except Exception as e:
+            log.warning("Error handling client %s: %s", addr, e)
+
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except Exception:
+                pass  # 对方已经断开，忽略关闭时的错误
+            if session is not None:
+                sessions.release(session)
+            stats.on_finish()
+            log.info("Connection with %s closed. (%s)", addr, stats)
+
+# === 创建监听 socket；多进程模式下每个 worker 各自 bind 同一个端口（SO_REUSEPORT），由内核分配连接 ===
+def make_listener(host, port, reuse_port=False):
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)  # 创建 TCP socket
+    s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)  # 重启时不用等 TIME_WAIT
+    if reuse_port:
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    s.bind((host, port))  # 绑定 IP 和端口
+    s.listen(BACKLOG)  # 开始监听，接收连接
+    return s
+
+# === SIGINT / SIGTERM 只触发 stop 回调，由服务循环自己停止接新连接并等已有连接处理完 ===
+def install_stop_handlers(stop):
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda signum, frame: stop())
+
+# === 线程模式：每个连接一个线程 ===
+def serve_threaded(listener, max_conn, stats, grace, spill, sessions, limits, inflight):
+    slots = threading.BoundedSemaphore(max_conn)  # 同时处理的连接数上限
+    stop = threading.Event()
+    install_stop_handlers(stop.set)
+    conns = set()  # 正在处理的连接，优雅退出超时后强制关闭
+    conns_lock = threading.Lock()
+
+    def run(conn, addr):
+        with conns_lock:
+            conns.add(conn)
+        try:
+            handle_client(conn, addr, stats, slots, spill, sessions, limits, inflight)
+        finally:
+            with conns_lock:
+                conns.discard(conn)
+
+    host, port = listener.getsockname()
+    print(f"Server listening on {host}:{port} (mode=thread, max_conn={max_conn})")  # 打印监听状态
+    listener.settimeout(ACCEPT_POLL_INTERVAL)  # accept 定期返回，检查是否要停止
+
+    queued = limits.overflow == 'queue'
+    while not stop.is_set():
+        if queued and not slots.acquire(timeout=ACCEPT_POLL_INTERVAL):
+            continue  # 名额用完时先不 accept，新连接留在内核队列里
+        try:
+            conn, addr = listener.accept()  # 等待新连接，返回连接和客户端地址
+        except socket.timeout:
+            if queued:
+                slots.release()
+            continue
+        conn.settimeout(None)  # 连接本身用阻塞模式
+        stats.on_accept()
+        if not queued and not slots.acquire(blocking=False):
+            stats.on_reject('connections')  # 名额用完，直接断开，不排队
+            log.warning("Rejected client %s: connection limit reached", addr)
+            conn.close()
+            continue
+        # === 为新客户端创建并启动线程 ===
+        t = threading.Thread(target=run, args=(conn, addr), daemon=True)  # 用线程处理新连接
+        t.start()  # 启动线程
+
+    # === 优雅退出：不再接新连接，最多等 grace 秒让已有连接处理完 ===
+    listener.close()
+    print(f"Server stopping, waiting up to {grace}s for active connections. ({stats})")
+    deadline = time.monotonic() + grace
+    while stats.active and time.monotonic() < deadline:
+        time.sleep(0.1)
+    with conns_lock:
+        for conn in list(conns):
+            try:
+                conn.shutdown(socket.SHUT_RDWR)  # 超时还没处理完的连接强制断开
+            except OSError:
+                pass
+    deadline = time.monotonic() + 1.0  # 给处理线程一点时间走完 finally，计数才准确
+    while stats.active and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+# === asyncio 模式：所有连接在一个事件循环里处理 ===
+async def serve_asyncio(listener, max_conn, stats, grace, spill, sessions, limits, inflight):
+    slots = asyncio.Semaphore(max_conn)  # 同时处理的连接数上限
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    install_stop_handlers(lambda: loop.call_soon_threadsafe(stop.set))
+    active = {}  # 正在处理连接的任务 -> 它的 writer
+
+    async def on_connect(reader, writer):
+        task = asyncio.current_task()
+        active[task] = writer
+        try:
+            await handle_client_async(reader, writer, stats, slots, spill, sessions, limits, inflight)
+        finally:
+            active.pop(task, None)
+
+    server = await asyncio.start_server(on_connect, sock=listener)
+    host, port = listener.getsockname()
+    print(f"Server listening on {host}:{port} (mode=asyncio, max_conn={max_conn})")
+    await stop.wait()
+
+    # === 优雅退出：不再接新连接，最多等 grace 秒让已有连接处理完 ===
+    server.close()
+    print(f"Server stopping, waiting up to {grace}s for active connections. ({stats})")
+    if active:
+        _, pending = await asyncio.wait(set(active), timeout=grace)
+        for task in pending:
+            active[task].transport.abort()  # 超时还没处理完的连接强制断开，协程在读写处出错后自己收尾
+        if pending:
+            await asyncio.wait(pending, timeout=1.0)
+
+# === 在当前进程里跑一个服务器，停止后返回它的连接计数 ===
+def run_server(args, reuse_port=False, name='Stats', stats_port=0):
+    stats = ConnectionStats()
+    if args.stats_interval > 0:
+        start_stats_reporter(stats, args.stats_interval, name)
+    if stats_port:
+        start_stats_server(stats.snapshot, STATS_HOST, stats_port)
+        print(f"[{name}] serving stats on {STATS_HOST}:{stats_port}")
+
+    spill = SpillConfig(args.spill_threshold, args.spill_segment)
+    sessions = SessionTable(args.session_ttl)  # 多进程模式下每个 worker 各有一张表
+    limits = Limits(args.idle_timeout, args.read_timeout, args.write_timeout, args.max_pending_bytes,
+                    args.max_blocks, args.max_frame_bytes, args.overflow)
+    listener = make_listener(args.host, args.port, reuse_port)
+    if args.mode == 'asyncio':
+        inflight = AsyncByteBudget(args.max_inflight_bytes)  # 整个进程共用一份额度
+        asyncio.run(serve_asyncio(listener, args.max_conn, stats, args.grace, spill, sessions, limits, inflight))
+    else:
+        inflight = ByteBudget(args.max_inflight_bytes)
+        serve_threaded(listener, args.max_conn, stats, args.grace, spill, sessions, limits, inflight)
+    return stats
+
+# === 多进程模式下每个 worker 进程的入口 ===
+def worker_main(k, args, results):
+    setup_logging(args)  # spawn 方式启动的子进程不会继承父进程的日志配置
+    sample.every = max(1, args.log_sample)
+    stats = run_server(args, reuse_port=True, name=f"Worker {k}",
+                       stats_port=args.stats_port + k if args.stats_port else 0)  # 每个 worker 一个统计端口
+    results.put((k, os.getpid(), stats.as_dict()))  # 把本进程的计数交给父进程汇总
+
+# === 多进程模式：N 个进程监听同一个端口，连接由内核在进程间分配，每个进程各有自己的 GIL ===
+def serve_workers(args):
+    results = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=worker_main, args=(k, args, results))
+               for k in range(args.workers)]
+    for w in workers:
+        w.start()
+    print(f"Started {args.workers} workers on {args.host}:{args.port} "
+          f"(pids: {', '.join(str(w.pid) for w in workers)})")
+
+    # === 父进程只负责转发停止信号，worker 自己优雅退出 ===
+    stop = threading.Event()
+    install_stop_handlers(stop.set)
+    while not stop.is_set() and any(w.is_alive() for w in workers):
+        stop.wait(0.5)
+    for w in workers:
+        if w.is_alive():
+            os.kill(w.pid, signal.SIGTERM)
+
+    # === 先把结果收完再 join，避免 worker 卡在往队列写数据上 ===
+    per_worker = []
+    for _ in workers:
+        try:
+            per_worker.append(results.get(timeout=args.grace + 5))
+        except queue.Empty:
+            break  # 有 worker 异常退出，没有交回计数
+    for w in workers:
+        w.join()
+
+    total = ConnectionStats()
+    for k, pid, counts in sorted(per_worker):
+        worker_stats = ConnectionStats()
+        worker_stats.merge(counts)
+        print(f"[Worker {k}] pid={pid} {worker_stats}")
+        total.merge(counts)
+    print(f"Server stopped. total {total} ({len(per_worker)}/{len(workers)} workers reported)")
 
 # === 服务器主函数 ===
 def main():
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:  # 创建 TCP socket
-        s.bind((HOST, PORT))  # 绑定 IP 和端口
-        s.listen()  # 开始监听，接收连接
-        print(f"Server listening on {HOST}:{PORT}")  # 打印监听状态
+    parser = argparse.ArgumentParser(description='Reverse TCP server')
+    parser.add_argument('--host', default=HOST, help='监听地址')
+    parser.add_argument('--port', type=int, default=PORT, help='监听端口')
+    parser.add_argument('--mode', choices=['thread', 'asyncio'], default='thread',
+                        help='thread: 每个连接一个线程；asyncio: 单线程事件循环')
+    parser.add_argument('--max-conn', type=int, default=MAX_CONNECTIONS,
+                        help='同时处理的最大连接数（多进程模式下是每个 worker 的上限）')
+    parser.add_argument('--overflow', choices=['queue', 'reject'], default='queue',
+                        help='超过 --max-conn 的连接：queue 排队等待，reject 直接断开并计入 rejected')
+    parser.add_argument('--stats-interval', type=float, default=0,
+                        help='每隔多少秒打印一次连接、块、字节计数和延迟百分位，0 表示不定时打印')
+    parser.add_argument('--stats-port', type=int, default=0,
+                        help='在 127.0.0.1 的这个端口上提供 JSON 统计快照，0 表示不开；'
+                             '多进程模式下第 k 个 worker 用 port+k')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='worker 进程数，大于 1 时用 SO_REUSEPORT 让多个进程监听同一个端口')
+    parser.add_argument('--grace', type=float, default=GRACE_PERIOD,
+                        help='收到 SIGINT/SIGTERM 后最多等多少秒让已有连接处理完')
+    parser.add_argument('--spill-threshold', type=int, default=SPILL_THRESHOLD,
+                        help='reverseRequest 超过多少字节就落到临时文件、分段倒序应答，0 表示关闭')
+    parser.add_argument('--spill-segment', type=int, default=SPILL_SEGMENT,
+                        help='大块分段收发的段大小（字节），会向上取整到内存页大小的整数倍')
+    parser.add_argument('--session-ttl', type=float, default=SESSION_TTL,
+                        help='会话断开后保留多少秒供客户端续传')
+    parser.add_argument('--idle-timeout', type=float, default=IDLE_TIMEOUT,
+                        help='两帧之间（以及连上后等 Initialization）最多空闲多少秒')
+    parser.add_argument('--read-timeout', type=float, default=READ_TIMEOUT,
+                        help='收到帧头后每个段（--spill-segment 字节）的数据最多等多少秒，大帧按段数放宽')
+    parser.add_argument('--write-timeout', type=float, default=WRITE_TIMEOUT,
+                        help='每个段的应答最多花多少秒发出去，客户端不读应答时会超时断开')
+    parser.add_argument('--max-pending-bytes', type=int, default=MAX_PENDING_BYTES,
+                        help='每个连接还没发出去的应答最多多少字节，超过就先不读新请求，0 表示不限')
+    parser.add_argument('--max-blocks', type=int, default=MAX_BLOCKS,
+                        help='Initialization 里 Block num 的上限，超过直接断开')
+    parser.add_argument('--max-frame-bytes', type=int, default=MAX_FRAME_BYTES,
+                        help='需要整帧放进内存的帧最大多少字节（解压后），超过直接断开')
+    parser.add_argument('--max-inflight-bytes', type=int, default=MAX_INFLIGHT_BYTES,
+                        help='整个进程（多进程模式下每个 worker）已收下还没应答完的数据最多多少字节，0 表示不限')
+    add_logging_args(parser)
+    args = parser.parse_args()
+    if min(args.idle_timeout, args.read_timeout, args.write_timeout) <= 0:
+        parser.error('--idle-timeout / --read-timeout / --write-timeout 必须大于 0')
+    args.spill_segment = max(1, -(-args.spill_segment // mmap.PAGESIZE)) * mmap.PAGESIZE  # madvise 要求按页对齐
+    setup_logging(args)
+    sample.every = max(1, args.log_sample)
 
-        while True:
-            conn, addr = s.accept()  # 阻塞等待新连接，返回连接和客户端地址
-            # === 为新客户端创建并启动线程 ===
-            t = threading.Thread(target=handle_client, args=(conn, addr))  # 用线程处理新连接
-            t.start()  # 启动线程
+    if args.workers > 1:
+        if not hasattr(socket, 'SO_REUSEPORT'):
+            parser.error('--workers 需要 SO_REUSEPORT（Linux / BSD / macOS）')
+        serve_workers(args)
+    else:
+        stats = run_server(args, stats_port=args.stats_port)
+        print(f"Server stopped. ({stats})")  # 退出时打印最终计数
 
 # === 程序入口 ===
 if __name__ == '__main__':
@@ -1,10 +1,16 @@
 import socket           # 导入 socket 库，做 UDP 通信
 import struct           # 用 struct 做数据包二进制封装和解析
+import os               # 取文件名
 import sys              # 用来接收命令行参数
-import random           # 生成随机数（生成 payload）
+import random           # 生成连接 ID
 import time             # 用来获取当前时间、计算 RTT
 import threading        # 用多线程收 ACK
-import pandas as pd     # 用 pandas 做 RTT 汇总分析
+import heapq            # 重传定时器按到期时间排成小顶堆
+import argparse         # 解析命令行参数
+
+from blocks import build_ack_index, build_seq_index, FileBlocks, RandomBlocks, wrap, unwrap  # ACK 号 / 起始字节 -> 块序号，收 ACK 时 O(1) 查找
+from rtt import RttEstimator  # SRTT / RTTVAR 算重传超时，顺便做 RTT 汇总统计
+from congestion import CONTROLLERS  # 拥塞控制：reno（慢启动 + AIMD）或 fixed（固定窗口）
 
 # ====== 协议头部（仿 TCP） ======
 # 定义数据包头部：
@@ -16,244 +22,386 @@ HEADER_SIZE = struct.calcsize(HEADER_FORMAT)#头部总共字节数
 FLAG_SYN = 0x01         # SYN 标志
 FLAG_ACK = 0x02         # ACK 标志
 FLAG_FIN = 0x04         # FIN 标志
-
-# ====== 从命令行读取参数 ======sys.argv 是Python 的系统参数列表
-server_ip = sys.argv[1]             # 服务端 IP
-server_port = int(sys.argv[2])      # 服务端端口
-total_packets = int(sys.argv[3])    # 总共要发多少个数据块
+FLAG_SR = 0x08          # SYN 里带上表示请求 Selective Repeat，SYN-ACK 里带上表示服务端同意
+FLAG_SACK = 0x10        # ACK 后面跟着 SACK 区间
+FLAG_RST = 0x20         # 服务端拒绝连接（会话表满了）
+SACK_RANGE = struct.Struct('!I I')  # 一个 SACK 区间：[起始字节, 结束字节 + 1)
+SACK_MAX_RANGES = 16                # 服务端一个 ACK 最多带多少个区间
+ACK_BUFFER = HEADER_SIZE + SACK_MAX_RANGES * SACK_RANGE.size  # 服务端发来的包最大多长，recvfrom 按这个收
+FILE_INFO = struct.Struct('!Q')     # 发文件时 SYN 的 payload：文件长度，后面跟 UTF-8 文件名
+MAX_NAME_BYTES = 255                # 文件名最多带多少字节，SYN 不会超过服务端的收包缓冲区
+
+MSS = 80                # 默认的最大 payload 长度（随机数据块 40~80 字节）；实际用握手协商出来的 mss，拥塞窗口按它增减
+UDP_MAX_PAYLOAD = 65507 # IPv4 下一个 UDP 包最多带多少字节
+IP_UDP_HEADERS = 28     # IPv4 头 20 字节 + UDP 头 8 字节
+DEFAULT_MTU = 1500      # 拿不到路径 MTU 时按以太网算
+IP_MTU = getattr(socket, 'IP_MTU', 14)  # Linux 的 IP_MTU 选项，Python 没有导出这个常量
+DUP_ACK_THRESHOLD = 3   # 连续收到这么多个重复 ACK 就快速重传，不等定时器
+LIMITED_TRANSMIT = 2    # 前两个重复 ACK 各允许多发一块新数据，窗口很小时也能凑够三个重复 ACK
+CONTROL_TIMEOUT = 0.3   # SYN / FIN 第一次等回应等多久（秒），之后每重发一次翻倍
+CONTROL_RETRIES = 6     # SYN / FIN 最多发几次（0.3 s 起翻倍，一共等约 19 s）
+FIN_WAIT = 1.0          # 收到 FIN-ACK 后等服务端 FIN 的初始时间，服务端会先等一会儿再发 FIN
+
+# ====== 从命令行读取参数 ======
+parser = argparse.ArgumentParser(description='UDP reliable transfer client')
+parser.add_argument('server_ip', help='服务端 IP')
+parser.add_argument('server_port', type=int, help='服务端端口')
+parser.add_argument('total_packets', type=int, nargs='?',
+                    help='总共要发多少个随机数据块；用 --file 时可以省略（要指定 mode 时写 0 占位）')
+parser.add_argument('mode', nargs='?', choices=['sr', 'gbn'], default='sr',
+                    help='重传方式：sr（Selective Repeat，服务端不支持时退回 gbn）或 gbn（Go-Back-N）')
+parser.add_argument('--cc', choices=sorted(CONTROLLERS), default='reno',
+                    help='拥塞控制：reno 慢启动 + AIMD + 快速重传；fixed 固定 5 块 / 400 字节窗口')
+parser.add_argument('--mss', default=None,
+                    help='请求的最大 payload 长度（字节），或者 auto 按到服务端的路径 MTU 算（本机回环可以到 64 KB）；'
+                         f'默认发文件时 auto，随机数据块时 {MSS}；最终取和服务端上限里小的那个')
+parser.add_argument('--file', help='发送这个文件（按 MSS 切块，边发边读），不再生成随机数据')
+parser.add_argument('--seed', type=int, help='随机数据块的种子，同一个种子每次发的块完全相同')
+parser.add_argument('--cwnd-log', help='把 cwnd / ssthresh 的变化写到这个 CSV 文件（时间,cwnd,ssthresh）')
+args = parser.parse_args()
+if args.total_packets is None and not args.file:
+    parser.error('需要 total_packets 或者 --file')
+server_ip = args.server_ip          # 服务端 IP
+server_port = args.server_port      # 服务端端口
+total_packets = args.total_packets  # 总共要发多少个数据块
+mode = args.mode
+
+conn_id = random.randint(1, 0xFFFFFFFF)  # 连接 ID：客户端发出的每个包都放在 ack 字段里，服务端按 (地址, 连接 ID) 区分连接
 
 # 创建 UDP socket
 client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)#创建一个基于 IPv4 的 UDP 套接字，是程序和网络之间收发包的接口。
 
-# === 1. 三次握手：发送 SYN ===
-# 封装 SYN 包（seq=0, ack=0, flags=SYN, len=0, timestamp=当前时间）
-handshake_pkt = struct.pack(HEADER_FORMAT, 0, 0, FLAG_SYN, 0, int(time.time() * 1000))#毫秒
-client.sendto(handshake_pkt, (server_ip, server_port))
-print("Sent: SYN")     # 输出提示
-
-# === 接收 SYN-ACK ===
-data, _ = client.recvfrom(1024)  # 接收服务端返回
-seq, ack, flags, pkt_len, ts = struct.unpack(HEADER_FORMAT, data[:HEADER_SIZE])#20
-# 判断是否是 SYN+ACK
-if not (flags & FLAG_SYN and flags & FLAG_ACK):
-    print("Handshake failed")
+# === 按到服务端的路径 MTU 算 mss：MTU 减去 IP/UDP 头和协议头；不是 Linux 时按以太网 MTU ===
+def path_mss():
+    mtu = DEFAULT_MTU
+    if sys.platform.startswith('linux'):
+        probe = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            probe.connect((server_ip, server_port))  # UDP connect 不发包，只是查好路由
+            mtu = probe.getsockopt(socket.IPPROTO_IP, IP_MTU)
+        except OSError:
+            pass
+        finally:
+            probe.close()
+    return min(mtu - IP_UDP_HEADERS, UDP_MAX_PAYLOAD) - HEADER_SIZE
+
+mss_arg = args.mss or ('auto' if args.file else str(MSS))
+requested_mss = path_mss() if mss_arg == 'auto' else int(mss_arg)
+if not 1 <= requested_mss <= UDP_MAX_PAYLOAD - HEADER_SIZE:
+    parser.error(f'mss 需要在 1~{UDP_MAX_PAYLOAD - HEADER_SIZE} 之间')
+
+# 发文件：SYN 里带上文件长度，服务端好预先分配好输出文件
+syn_info = b''
+if args.file:
+    syn_info = FILE_INFO.pack(os.path.getsize(args.file)) + os.path.basename(args.file).encode()[:MAX_NAME_BYTES]
+
+# === 发一个控制包（SYN / FIN）等对端回应，超时就重发，等待时间每次翻倍 ===
+# 路上丢包时不会卡死；match(flags) 为真的包才算回应，其他包（迟到的 ACK、复制出来的包）直接丢掉
+# send=False 时第一轮只等不发（包已经发过了）；重试用完返回 None，否则返回回应包的头
+def exchange(pkt, match, what, timeout=CONTROL_TIMEOUT, send=True):
+    for attempt in range(CONTROL_RETRIES):
+        if send or attempt:
+            client.sendto(pkt, (server_ip, server_port))
+            print(f"Sent: {what}" + (f" (retry {attempt})" if attempt else ''))
+        deadline = time.time() + timeout
+        while (remaining := deadline - time.time()) > 0:
+            client.settimeout(remaining)
+            try:
+                data, _ = client.recvfrom(ACK_BUFFER)
+            except socket.timeout:
+                break
+            header = struct.unpack(HEADER_FORMAT, data[:HEADER_SIZE])
+            if match(header[2]):
+                return header
+        timeout *= 2
+    return None
+
+# === 1. 三次握手：发送 SYN，等 SYN-ACK（或者 RST）===
+# 封装 SYN 包（seq=请求的 mss, ack=连接 ID, flags=SYN，要用 SR 时再带上 FLAG_SR, len=文件信息长度, timestamp=当前时间）
+# 服务端收到重复的 SYN 只会重发 SYN-ACK，所以 SYN-ACK 丢了可以放心重发
+syn_flags = FLAG_SYN | (FLAG_SR if mode == 'sr' else 0)
+handshake_pkt = struct.pack(HEADER_FORMAT, requested_mss, conn_id, syn_flags, len(syn_info), int(time.time() * 1000)) + syn_info#毫秒
+reply = exchange(handshake_pkt, lambda f: f & FLAG_RST or (f & FLAG_SYN and f & FLAG_ACK), "SYN")
+if reply is None:
+    print(f"Handshake failed (no SYN-ACK after {CONTROL_RETRIES} SYNs)")
     sys.exit(1)#非正常退出
-print(f"Received: SYN-ACK (ack={ack})")
+seq, ack, flags, pkt_len, ts = reply
+if flags & FLAG_RST:
+    print("Connection refused by server (session table full)")
+    sys.exit(1)
+selective = bool(flags & FLAG_SR)  # 服务端不认识 SR 时不会带回这个标志，退回 GBN
+# SYN-ACK 的 seq 是服务端同意的 mss（不超过它的收包缓冲区）；老服务端回 0，按默认的 MSS 发
+mss = min(requested_mss, seq) if seq else min(requested_mss, MSS)
+print(f"Received: SYN-ACK (ack={ack}, mode={'SR' if selective else 'GBN'}, mss={mss})")
 
 # === 2. 发送参数配置 ===
-window_size = 5            # GBN 窗口大小
+cwnd_log = open(args.cwnd_log, 'w') if args.cwnd_log else None
+cc = CONTROLLERS[args.cc](mss, cwnd_log)  # 拥塞控制器，决定窗口里还能不能再发一块
 base = 1                   # 滑动窗口 base，起点 1#
 next_seq_idx = 1           # 下一个要发的块序号
 
-# 生成要发送的所有数据块
-blocks = []                # 保存所有数据块：[(起始字节, 长度, payload)]
-start_byte = 1             # 当前块起始字节偏移
-for _ in range(total_packets):
-    payload_len = random.randint(40, 80)                  # 块长度随机 40~80
-    payload = bytes([random.randint(65, 90) for _ in range(payload_len)])  # 生成随机大写字母
-    blocks.append((start_byte, payload_len, payload))     # 保存块信息
-    start_byte += payload_len                             # 更新下一块的起始字节
-
-send_times = {}            # 保存每个块的发送时间（用于算 RTT）
-rtts = []                  # 保存所有 RTT
+# 要发送的数据块：[(起始字节, 长度, payload)]，都是发到哪一块才读出（生成）哪一块
+# 文件按 mss 切块；否则是 total_packets 个长度 mss/2~mss（默认 40~80）的随机大写字母块，只保留还没被确认的
+if args.file:
+    blocks = FileBlocks(args.file, mss)
+else:
+    blocks = RandomBlocks(total_packets, max(1, mss // 2), mss, args.seed)
+total_packets = len(blocks)
+ack_index = build_ack_index(blocks)  # 每块末尾对应的 ACK 号 -> 块序号
+seq_index = build_seq_index(blocks)  # 每块起始字节 -> 块序号，SACK 区间从这里定位
+
+# === 第 idx 块的起始字节；idx 超过最后一块时返回总字节数 + 1，两块之差就是中间的字节数 ===
+def byte_offset(idx):
+    return blocks.start(idx)
+
+send_times = {}            # 保存每个块最近一次的发送时间（用于算 RTT 和判断超时）
+retransmitted = set()      # 重传过的块序号，按 Karn 规则不拿它们的 ACK 算 RTT
 acked_seq = set()          # 已经确认的块序号#
 total_sent = 0             # 统计实际总发送的块数
+last_ack = 1               # 最近一次收到的 ACK 号，用来数重复 ACK
+dup_acks = 0               # 连续重复 ACK 的个数
+fast_retx = False          # 收 ACK 线程发现需要快速重传时置位，由发送循环处理
+recover = 0                # 快速重传 / 超时时已经发出的最后一块，base 越过它之前不再减窗
+fast_retx_count = 0        # 快速重传次数
 
 DEFAULT_TIMEOUT = 0.3      # 默认超时时间（秒）
-lock = threading.Lock()    # 用锁保护 base、acked_seq
+estimator = RttEstimator(initial_rto=DEFAULT_TIMEOUT)  # 没有 RTT 样本时先用默认超时
+lock = threading.Lock()    # 用锁保护 base、acked_seq、estimator
+acked = threading.Condition(lock)  # 收到 ACK 时唤醒发送循环，窗口一打开马上发
+timers = []                # 重传定时器小顶堆：(到期时间, 块序号, 发送时间)，发送时间对不上的是过期条目
 running = True             # 用来控制收 ACK 的线程
+ACK_POLL_INTERVAL = 0.2    # 收 ACK 线程最多阻塞多久就回来检查 running
 
 # === 3. 收 ACK 的线程 ===
 def recv_ack():
-    global base, running
+    global base, running, last_ack, dup_acks, fast_retx
     while running:
         try:
-            data, _ = client.recvfrom(1024)   # 阻塞收 ACK 包
+            data, _ = client.recvfrom(ACK_BUFFER)   # 阻塞收 ACK 包
             recv_time = time.time()           # 记录当前接收时间（用于算 RTT）
             seq, ack_num, flags, pkt_len, ts = struct.unpack(HEADER_FORMAT, data[:HEADER_SIZE])
+            window_start = byte_offset(base)  # 32 位的确认号 / SACK 区间按离它最近的字节号还原
+            ack_num = unwrap(ack_num, window_start)
 
-            if flags & FLAG_ACK:  # 判断包里带 ACK 标志
+            if flags & FLAG_ACK and not flags & FLAG_SYN:  # 判断包里带 ACK 标志（SYN-ACK 重发或被复制的那份不算）
+                # ack_num 表示累计确认到 ack_num - 1 字节，直接查出是哪一块的末尾，不用遍历 blocks，也不用占着锁
+                confirmed_idx = ack_index.get(ack_num)  # 不在块边界上的 ACK（例如 SYN-ACK 的 1）查不到
                 with lock:
-                    acked_byte = ack_num - 1  # ack_num 表示累计确认到哪一个字节，减 1 得到最后确认字节
-                    confirmed_idx = None  # 初始化blocks 列表中的索引
-                    # 遍历所有块找出哪块被这个 ACK 覆盖
-                    for i, (start_byte, length, _) in enumerate(blocks, start=1):
-                        end_byte = start_byte + length - 1
-                        if end_byte == acked_byte:
-                            confirmed_idx = i
-                            break
-                    # 如果找到这块且没确认过，说明是首次确认
-                    if confirmed_idx and confirmed_idx not in acked_seq:
-                        RTT = recv_time - send_times[confirmed_idx]  # 算 RTT
-                        rtts.append(RTT)  # 保存 RTT
+                    # 如果找到这块且没确认过，说明是首次确认（base 之前的块状态已经清掉了，不再算）
+                    if confirmed_idx and confirmed_idx >= base and confirmed_idx not in acked_seq:
                         acked_seq.add(confirmed_idx)  # 标记已确认
-                        s, l, _ = blocks[confirmed_idx - 1]
-                        print(f"Received: ACK {ack_num} (bytes up to {ack_num -1}) RTT = {RTT*1000:.2f} ms")
-
-                    # 如果当前确认块的下一个比 base 大，就滑动 base
+                        if confirmed_idx in retransmitted:
+                            # Karn 规则：分不清这个 ACK 是回应哪一次发送，不取样
+                            print(f"Received: ACK {ack_num} (bytes up to {ack_num -1}) RTT = - (retransmitted)")
+                        else:
+                            RTT = recv_time - send_times[confirmed_idx]  # 算 RTT
+                            estimator.sample(RTT)  # 更新 SRTT / RTTVAR / RTO
+                            print(f"Received: ACK {ack_num} (bytes up to {ack_num -1}) RTT = {RTT*1000:.2f} ms")
+
+                    # 如果当前确认块的下一个比 base 大，就滑动 base（累计确认，中间的块一起确认）
                     if confirmed_idx and confirmed_idx + 1 > base:
+                        acked_bytes = byte_offset(confirmed_idx + 1) - byte_offset(base)
+                        for idx in range(base, confirmed_idx + 1):
+                            # 累计确认过的块不会再用到，清掉它们的状态，发大文件时内存只和窗口大小有关
+                            send_times.pop(idx, None)
+                            acked_seq.discard(idx)
+                            retransmitted.discard(idx)
                         base = confirmed_idx + 1  # 更新 base
+                        blocks.release(base)
+                        dup_acks = 0
+                        if base > recover:
+                            cc.on_ack(acked_bytes)  # 正常确认：慢启动或加性增
+                        elif base < next_seq_idx:
+                            fast_retx = True  # 恢复期间的部分确认：新的 base 多半也丢了，马上重发
+                    elif ack_num == last_ack and base < next_seq_idx:
+                        # 重复 ACK：服务端收到了乱序的包，累计确认停在原地
+                        dup_acks += 1
+                        if dup_acks == DUP_ACK_THRESHOLD:
+                            fast_retx = True
+                    last_ack = ack_num
+
+                    # SR：SACK 区间里完整收到的块也标记已确认，超时后不再重发
+                    if selective and flags & FLAG_SACK:
+                        sack = data[HEADER_SIZE:HEADER_SIZE + pkt_len]
+                        for start, end in SACK_RANGE.iter_unpack(sack[:len(sack) // SACK_RANGE.size * SACK_RANGE.size]):
+                            start, end = unwrap(start, window_start), unwrap(end, window_start)
+                            idx = seq_index.get(start)  # 区间总是从某一块的起始字节开始
+                            while idx and idx <= total_packets and byte_offset(idx + 1) <= end:
+                                if idx >= base:  # 已经累计确认的块不用再记
+                                    acked_seq.add(idx)
+                                idx += 1
+
+                    acked.notify()  # 窗口可能打开了，唤醒发送循环
 
         except:
             continue  # 有异常就忽略继续收包
 
 # 启动收 ACK 线程
+client.settimeout(ACK_POLL_INTERVAL)  # recvfrom 定期返回，收 ACK 线程才能看到 running 变成 False
 ack_thread = threading.Thread(target=recv_ack)
 ack_thread.start()
 
-# === 4. 主循环：GBN 发送窗口 & 超时重传 ===
-while base <= total_packets:  # 只要还有块没被累计确认，就持续循环
-
-    # === 动态计算超时重传时间 ===
-    if rtts:  # 如果已经有 RTT 样本
-        avg_rtt = sum(rtts) / len(rtts)  # 计算平均 RTT
-        timeout = avg_rtt * 5  # 动态超时时间 = 平均 RTT × 5（经验值）
-        if timeout < 0.05:
-            timeout = 0.05  # 设置一个最小超时阈值
-    else:#未收到ACK
-        timeout = DEFAULT_TIMEOUT  # 如果没有 RTT 样本，就用默认值
-
-    with lock:  # base / next_seq_idx / acked_seq
-        curr_window_bytes = 0  # 当前窗口累计占用的字节数（控制单轮最大发包量）
-
-        # === 在窗口范围内尽可能发送新块 ===
-        while next_seq_idx < base + window_size and next_seq_idx <= total_packets:
-            start_byte, length, payload = blocks[next_seq_idx - 1]  # 当前块的首字节、长度、内容
-
-            if curr_window_bytes + length > 400:
-                break  # 如果本轮加上这块就超出 400 字节限制，就暂停发，等待下轮
-
-            # === 封装数据包头：DATA 包没有 flags（flags = 0） ===
-            header = struct.pack(
-                HEADER_FORMAT,
-                start_byte,  # seq: 当前块的起始字节偏移
-                0,  # ack: DATA 包不带确认号
-                0,  # flags: DATA
-                length,  # len: 这块的 payload 长度
-                int(time.time() * 1000)  # timestamp: 当前毫秒时间戳
-            )
-
-            # === 发送 DATA ===
-            client.sendto(header + payload, (server_ip, server_port))
-            send_times[next_seq_idx] = time.time()  # 记录发送时间，用于后续 RTT 计算
-            total_sent += 1  # 总发送次数 +1 （包含重传）
-
-            print(f"Sent: DATA {next_seq_idx} (byte {start_byte}~{start_byte + length - 1})")
-
-            curr_window_bytes += length  # 已用窗口字节累加
+# === 发送（或重发）第 idx 块并启动它的重传定时器，返回它的长度（调用方持有 lock） ===
+def send_block(idx, action="Sent"):
+    global total_sent
+    start_byte, length, payload = blocks[idx - 1]  # 当前块的首字节、长度、内容
+    # === 封装数据包头：DATA 包没有 flags（flags = 0） ===
+    header = struct.pack(
+        HEADER_FORMAT,
+        wrap(start_byte),  # seq: 当前块的起始字节偏移（低 32 位）
+        conn_id,  # ack: DATA 包不带确认号，放连接 ID
+        0,  # flags: DATA
+        length,  # len: 这块的 payload 长度
+        int(time.time() * 1000)  # timestamp: 当前毫秒时间戳
+    )
+    sent_at = time.time()
+    send_times[idx] = sent_at  # 记录发送时间，用于后续 RTT 计算（先记再发，ACK 可能比 sendto 返回还快）
+    heapq.heappush(timers, (sent_at + estimator.rto, idx, sent_at))  # 这一次发送的重传定时器
+    client.sendto(header + payload, (server_ip, server_port))
+    total_sent += 1  # 总发送次数 +1 （包含重传）
+    if action != "Sent":
+        retransmitted.add(idx)
+    print(f"{action}: DATA {idx} (byte {start_byte}~{start_byte + length - 1})")
+    return length
+
+# === 弹出所有已经到期的定时器，返回还需要重传的块（按序号排好）===
+# 已确认的块、或者后来又重发过的块（发送时间对不上），它们的旧定时器直接丢掉
+def expired_blocks(now):
+    expired = set()
+    while timers and timers[0][0] <= now:
+        _, idx, sent_at = heapq.heappop(timers)
+        if idx >= base and idx not in acked_seq and send_times.get(idx) == sent_at:
+            expired.add(idx)
+    return sorted(expired)
+
+transfer_start = time.time()  # 从发第一个数据块开始计时，算有效吞吐
+
+# === 4. 主循环：事件驱动的发送窗口 & 超时重传（GBN 回退重发，SR 只重发缺的块） ===
+# 没有固定的轮询间隔：ACK 到达时被 notify 唤醒，否则睡到最早的定时器到期
+with acked:
+    while base <= total_packets:  # 只要还有块没被累计确认，就持续循环
+
+        # === 快速重传：收到三个重复 ACK（或恢复期间的部分确认），不等定时器直接重发 base ===
+        if fast_retx:
+            fast_retx = False
+            if base > recover:  # 同一个窗口里的丢包只减一次窗
+                cc.on_loss(byte_offset(next_seq_idx) - byte_offset(base))
+                recover = next_seq_idx - 1
+                fast_retx_count += 1
+            print(f"Fast retransmit from {base} (cwnd={cc.cwnd:.0f})")
+            # SR 只重发 base 这一块（后面的服务端已经缓存了）；GBN 服务端丢掉了乱序包，base 之后的也要重发
+            for idx in (range(base, base + 1) if selective else range(base, next_seq_idx)):
+                if idx not in acked_seq:
+                    send_block(idx, "Fast resent")
+
+        # === 在拥塞窗口范围内尽可能发送新块 ===
+        # 重复 ACK 说明有包离开了网络，按个数放宽窗口（Limited Transmit），快速重传之后不再放宽
+        extra = mss * dup_acks if dup_acks < DUP_ACK_THRESHOLD else 0
+        extra = min(extra, mss * LIMITED_TRANSMIT)
+        while next_seq_idx <= total_packets:
+            in_flight = byte_offset(next_seq_idx) - byte_offset(base)  # base 到 next_seq_idx 之间的字节数
+            length = byte_offset(next_seq_idx + 1) - byte_offset(next_seq_idx)
+            if not cc.can_send(max(0, in_flight - extra), length, next_seq_idx - base):
+                break  # 加上这块就超出窗口，等 ACK 把窗口往前推
+            send_block(next_seq_idx)
             next_seq_idx += 1  # 块序号 +1，准备发下一块
 
-    time.sleep(timeout)  # 等待一轮超时，准备检查是否需要重发
-
-    # === 检查是否存在超时未确认的数据块 ===
-    earliest_timeout_idx = None  # 用来记录最早发生超时的块
-    curr_time = time.time()
-
-    for idx in range(base, next_seq_idx):  # 在窗口范围内从 base 开始检查
-        if idx in acked_seq:
-            continue  # 已经确认的不检查
-
-        send_time = send_times.get(idx)
-        if not send_time:
-            continue  # 前面的字节数超限break
-
-        if curr_time - send_time > timeout:  # 如果超时
-            earliest_timeout_idx = idx
-            break  # 找到就退出，只找最早的一个
-
-    # === 如果有超时：执行 GBN 回退重传 ===
-    if earliest_timeout_idx:
-        print(f"Detected timeout: earliest timeout idx = {earliest_timeout_idx}")
-        next_seq_idx = earliest_timeout_idx  # 从最早超时块重新开始发
-
-        with lock:  # 重新加锁保证一致性
-            curr_window_bytes = 0  # 本轮重新计数
-            while next_seq_idx < base + window_size and next_seq_idx <= total_packets:
-                if next_seq_idx in acked_seq:
-                    next_seq_idx += 1  # 如果这块已确认就跳过
-                    continue
-
-                start_byte, length, payload = blocks[next_seq_idx - 1]
-                if curr_window_bytes + length > 400:
-                    break  # 本轮累加超了，就等下一轮再发
-
-                # === 重发该块 ===
-                header = struct.pack(
-                    HEADER_FORMAT,
-                    start_byte,
-                    0,
-                    0,
-                    length,
-                    int(time.time() * 1000)
-                )
-                client.sendto(header + payload, (server_ip, server_port))
-                send_times[next_seq_idx] = time.time()  # 更新该块的新发送时间
-                total_sent += 1  # 总发送次数 +1
-
-                print(f"Resent: DATA {next_seq_idx} (byte {start_byte}~{start_byte + length - 1})")
-
-                curr_window_bytes += length  # 本轮已用窗口字节数累加
-                next_seq_idx += 1  # 块序号递增
+        # === 处理到期的重传定时器 ===
+        expired = expired_blocks(time.time())
+        if expired:
+            in_flight = byte_offset(next_seq_idx) - byte_offset(base)
+            if selective:
+                # === SR：每块各自计时，只重发到期且没被累计确认或 SACK 的块 ===
+                # 只有最老的未确认块超时才退避和减窗，否则窗口里每块各自到期会让 RTO 连翻好几倍
+                if expired[0] == base:
+                    estimator.backoff()
+                    cc.on_timeout(in_flight)
+                    recover = next_seq_idx - 1
+                for idx in expired:
+                    send_block(idx, "Resent")
+            else:
+                # === GBN：任何一块超时都从 base 开始，窗口里没确认的全部重发，它们的定时器一起重启 ===
+                print(f"Detected timeout: earliest timeout idx = {expired[0]}, go back to {base}")
+                estimator.backoff()  # 超时重传，RTO 翻倍
+                cc.on_timeout(in_flight)
+                recover = next_seq_idx - 1
+                for idx in range(base, next_seq_idx):
+                    if idx not in acked_seq:
+                        send_block(idx, "Resent")
+            continue  # 重发后马上再检查一遍窗口和定时器
+
+        # === 等 ACK 或者最早的定时器到期 ===
+        acked.wait(max(0.0, timers[0][0] - time.time()) if timers else None)
+
+transfer_time = time.time() - transfer_start  # 所有块都被确认的时刻
+total_bytes = byte_offset(total_packets + 1) - 1  # 所有块的 payload 总字节数（随机块生成完才知道）
+if cwnd_log:
+    cwnd_log.close()
+
+# === 停止收 ACK 线程 ===
+# 要在挥手之前停掉，否则 FIN-ACK / FIN 会被它收走，主线程一直等不到
+running = False         # 设置控制变量为 False，结束 while running
+ack_thread.join()       # 等收 ACK 线程退出
 
 # === 5. 四次挥手 ===
 # 主动发起 FIN，告诉服务端我要关闭连接
 fin_pkt = struct.pack(
     HEADER_FORMAT,
     0,                        # seq，此处用不到
-    0,                        # ack，此处用不到
+    conn_id,                  # ack：连接 ID
     FLAG_FIN,                 # 设置 FIN 标志位
     0,                        # 数据长度 0
     int(time.time() * 1000)   # 当前时间戳（毫秒）
 )
-client.sendto(fin_pkt, (server_ip, server_port))
-print("Sent: FIN")  # 输出提示：FIN 已发出
-
-# === 等服务端回 FIN-ACK ===
-while True:
-    data, _ = client.recvfrom(1024)  # 阻塞收包
-    seq, ack_num, flags, pkt_len, ts = struct.unpack(HEADER_FORMAT, data[:HEADER_SIZE])
-    # 如果收到的包同时带 ACK 和 FIN 标志，说明服务端确认关闭
-    if flags & FLAG_ACK and flags & FLAG_FIN:
-        print("Received: FIN-ACK")
-        break
-
-# === 等服务端最后发 FIN ===
-# 模拟 TCP 中最后一次 FIN 的对等交换
-while True:
-    data, _ = client.recvfrom(1024)  # 继续收包
-    seq, ack_num, flags, pkt_len, ts = struct.unpack(HEADER_FORMAT, data[:HEADER_SIZE])
-    # 如果收到服务端再次发的 FIN，表示服务端也要完全关闭
-    if flags & FLAG_FIN:
+
+# === 等服务端回 FIN-ACK（说明服务端确认关闭），没等到就重发 FIN ===
+if exchange(fin_pkt, lambda f: f & FLAG_ACK and f & FLAG_FIN, "FIN"):
+    print("Received: FIN-ACK")
+    # === 等服务端最后发 FIN ===
+    # 模拟 TCP 中最后一次 FIN 的对等交换；FIN 丢了就再发 FIN，服务端会再回 FIN-ACK 并重新安排 FIN
+    if exchange(fin_pkt, lambda f: f & FLAG_FIN and not f & FLAG_ACK, "FIN", FIN_WAIT, send=False):
         print("Received: FIN")
-        # 发最后一个 ACK，表示自己确认服务端的 FIN
+        # 发最后一个 ACK，表示自己确认服务端的 FIN（丢了也没关系，服务端空闲超时后会清掉会话）
         ack_pkt = struct.pack(
             HEADER_FORMAT,
-            0, 0,              # seq, ack 不用带实际值
+            0, conn_id,        # seq 不用带实际值，ack 放连接 ID
             FLAG_ACK,          # ACK 标志位
             0,                 # 数据长度 0
             int(time.time() * 1000)
         )
         client.sendto(ack_pkt, (server_ip, server_port))
         print("Sent: Last ACK")
-        break
-
-# === 停止收 ACK 线程 ===
-running = False         # 设置控制变量为 False，结束 while True
-ack_thread.join()       # 等收 ACK 线程退出
+    else:
+        print("Close: no FIN from server, giving up")
+else:
+    print("Close: no FIN-ACK from server, giving up")  # 数据已经全部被确认，照样打印统计
 
 # === 6. 汇总统计 ===
 # 计算丢包率：预期块数 / 实际总发块数
-loss_rate = (1 - (total_packets / total_sent)) * 100
+loss_rate = (1 - (total_packets / total_sent)) * 100 if total_sent else 0.0
+
 
-# 把所有 RTT 换成毫秒，用 pandas 做描述性统计
-rtt_series = pd.Series([r * 1000 for r in rtts])
+goodput = total_bytes / transfer_time / 1024  # 有效吞吐：只算一遍 payload，重传不算
 
 print("\n=== 汇总 ===")
+print(f"模式: {'SR' if selective else 'GBN'}")
+print(f"MSS: {mss} bytes (协议头开销 {HEADER_SIZE / (HEADER_SIZE + mss) * 100:.1f}%)")
+print(f"传输耗时: {transfer_time:.3f} s")
+print(f"发送次数: {total_sent} (重传 {total_sent - total_packets})")
+print(f"有效吞吐: {goodput:.2f} KB/s ({total_bytes / transfer_time / 1e6:.2f} MB/s)")
+print(f"拥塞控制: {cc.name}, 结束时 cwnd={cc.cwnd:.0f} bytes, ssthresh={cc.ssthresh:.0f} bytes, "
+      f"快速重传 {fast_retx_count} 次")
 print(f"丢包率: {loss_rate:.2f}%")             # 输出丢包率
-print(f"RTT Max: {rtt_series.max():.2f} ms")   # 最大 RTT
-print(f"RTT Min: {rtt_series.min():.2f} ms")   # 最小 RTT
-print(f"RTT Avg: {rtt_series.mean():.2f} ms")  # 平均 RTT
-print(f"RTT Std: {rtt_series.std():.2f} ms")   # RTT 标准差
+if estimator.count:  # RTT 统计是运行中累计的，不保存所有样本
+    print(f"RTT Max: {estimator.max*1000:.2f} ms")   # 最大 RTT
+    print(f"RTT Min: {estimator.min*1000:.2f} ms")   # 最小 RTT
+    print(f"RTT Avg: {estimator.mean*1000:.2f} ms")  # 平均 RTT
+    print(f"RTT Std: {estimator.std()*1000:.2f} ms")   # RTT 标准差
+    print(f"SRTT: {estimator.srtt*1000:.2f} ms")     # 平滑 RTT
+else:
+    print("RTT: 没有有效样本")
+print(f"RTO: {estimator.rto*1000:.2f} ms (退避 {estimator.backoffs} 次)")  # 结束时的重传超时
 
 # === 关闭 socket ===
 client.close()
+blocks.close()
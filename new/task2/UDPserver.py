@@ -1,11 +1,22 @@
+import os
+import mmap
 import socket
+import select
+import asyncio
 import struct
 import random
 import time
+import heapq
+import argparse
 import threading             # 用线程让 server 可停止
+from collections import OrderedDict
+
+from blocks import wrap, unwrap  # 协议头里的字节号只有 32 位，两端内部用不回绕的字节号
 
 # ====== 协议头格式 ======
 # 格式：seq(4字节) ack(4字节) flags(2字节) len(2字节) timestamp(8字节)
+# 客户端发出的包用不到 ack 字段，里面放 SYN 时选的连接 ID；SYN / SYN-ACK 的 seq 是请求 / 同意的 mss
+# seq / ack 是字节号的低 32 位，收到时按期望的下一个字节还原，超过 4 GB 的传输也不会认错
 HEADER_FORMAT = '!I I H H Q'
 HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
 
@@ -13,122 +24,458 @@ HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
 FLAG_SYN = 0x01    # SYN 标志位
 FLAG_ACK = 0x02    # ACK 标志位
 FLAG_FIN = 0x04    # FIN 标志位
+FLAG_SR = 0x08     # SYN 里带上表示请求 Selective Repeat，SYN-ACK 里带上表示同意
+FLAG_SACK = 0x10   # ACK 后面跟着 SACK 区间，len 是区间部分的字节数
+FLAG_RST = 0x20    # 拒绝连接（会话表满了）
+
+# ====== Selective Repeat ======
+SACK_RANGE = struct.Struct('!I I')  # 一个 SACK 区间：[起始字节, 结束字节 + 1)，已经收到但还接不上累计确认
+FILE_INFO = struct.Struct('!Q')     # 客户端发文件时 SYN 的 payload：文件长度，后面跟 UTF-8 文件名
+SACK_MAX_RANGES = 16                # 一个 ACK 最多带多少个区间，从离累计确认最近的开始
+REORDER_LIMIT = 64                  # 最多缓存多少个乱序包，满了再来的乱序包直接丢掉
+
+# ====== 会话表 ======
+MAX_SESSIONS = 10000     # 最多同时保存多少个连接的状态，满了新的 SYN 回 RST
+IDLE_TIMEOUT = 60.0      # 连接多少秒没有任何包就清掉它的状态
+FIN_DELAY = 0.5          # 回 FIN-ACK 之后过多久再发 FIN
+MAX_POLL_INTERVAL = 1.0  # 没有包的时候最多阻塞多久就回来处理到期的 FIN 和空闲连接
+RECV_BUFFER = 4 * 1024 * 1024  # socket 接收缓冲区，几千个连接同时发包时先排在内核里，少丢一些
+BURST_LIMIT = 256        # 线程模式一次最多连续收多少个包，之后先回去处理到期的定时动作
+SERVER_MODES = ['thread', 'asyncio']  # thread: 阻塞 recvfrom 循环；asyncio: DatagramProtocol + 定时回调
+MAX_MSS = 65507 - HEADER_SIZE  # 一个 UDP 包（IPv4）能带的最大 payload，本机回环可以用到这么大
+LEGACY_MSS = 80                # 客户端 SYN 里没带 mss（seq=0）时按原来的块大小
+
+# ====== 延迟 ACK ======
+ACK_EVERY = 2         # 每收到多少个按序包回一个累计 ACK
+ACK_DELAY = 0.01      # 按序包最多攒多久（秒）就回 ACK；要明显小于客户端的最小 RTO（50 ms）
+
+# === 一个连接（对端地址 + 连接 ID）的接收状态 ===
+class Session:
+    def __init__(self, addr, conn_id, sr, reorder_limit, mss=LEGACY_MSS):
+        self.addr = addr
+        self.conn_id = conn_id
+        self.sr = sr                           # 这个连接是否在用 SR（握手时协商）
+        self.reorder_limit = reorder_limit     # 乱序缓存上限（包数）
+        self.expected_seq = 1                  # 期望的下一个字节序号（累计确认）
+        self.reorder = {}                      # SR 乱序缓存：起始字节 -> 长度（内容已经写进输出文件，或者不需要保存）
+        self.last_seen = time.time()           # 最近一次收到这个连接的包的时间
+        self.mss = mss                         # 握手时协商的最大 payload 长度
+        self.unacked = 0                       # 收到了还没回 ACK 的按序包数
+        self.ack_due = None                    # 延迟 ACK 的发送时间，没有待发的 ACK 时是 None
+        self.path = None                       # 客户端发文件时的输出路径
+        self.file = None
+        self.out = None                        # 按 SYN 里的文件长度预先分配好的 mmap，收到的数据按字节号直接写进去
+
+    def open_output(self, path, size):
+        #创建输出文件并扩到 size 字节，映射进内存（空文件不能 mmap，也用不着）
+        self.path = path
+        self.file = open(path, 'w+b')
+        self.file.truncate(size)
+        if size:
+            self.out = mmap.mmap(self.file.fileno(), size)
+
+    def close_output(self):
+        #数据收完（或者连接被清掉）时关闭输出文件；可以重复调用
+        if self.file is None:
+            return
+        if self.out is not None:
+            self.out.close()
+            self.out = None
+        self.file.close()
+        self.file = None
+        print(f"[Server] Saved {self.expected_seq - 1} bytes to {self.path}")
+
+    def write(self, seq, payload):
+        #把 payload 写到输出文件里它的位置（字节号从 1 开始），超出 SYN 里长度的部分不写
+        if self.out is not None and seq + len(payload) - 1 <= len(self.out):
+            self.out[seq - 1:seq - 1 + len(payload)] = payload  # 字节号不回绕，超过 4 GB 的文件也写得对
+
+    def sack_ranges(self):
+        #把乱序缓存合并成连续区间，最多 SACK_MAX_RANGES 个
+        ranges = []
+        for seq in sorted(self.reorder):  # 缓存最多 reorder_limit 个，排序很便宜
+            end = seq + self.reorder[seq]
+            if ranges and ranges[-1][1] == seq:
+                ranges[-1][1] = end  # 和上一个区间首尾相接，合并
+            else:
+                ranges.append([seq, end])
+        return ranges[:SACK_MAX_RANGES]
+
+    def deliver(self, seq, payload):
+        #处理一个没被丢掉的数据包，按需推进 expected_seq，返回是否是按序到达
+        if seq == self.expected_seq:
+            self.write(seq, payload)
+            self.expected_seq += len(payload)
+            # SR：缓存里紧接着的乱序包一起交付（内容早就写好了，只推进 expected_seq）
+            while self.expected_seq in self.reorder:
+                self.expected_seq += self.reorder.pop(self.expected_seq)
+            return True
+        if self.sr and seq > self.expected_seq and seq not in self.reorder:
+            if len(self.reorder) < self.reorder_limit:
+                self.write(seq, payload)  # 乱序段直接写到文件里它该在的位置，缓存里只记长度
+                self.reorder[seq] = len(payload)  # 等前面缺的包到了再交付
+            else:
+                print(f"[Server] Reorder buffer full, dropped seq={seq}")
+        return False
 
 class UDPServer:
-    def __init__(self, host, port, drop_rate=0.2):
+    def __init__(self, host, port, drop_rate=0.2, selective=True, reorder_limit=REORDER_LIMIT,
+                 max_sessions=MAX_SESSIONS, idle_timeout=IDLE_TIMEOUT, mode='thread',
+                 ack_every=ACK_EVERY, ack_delay=ACK_DELAY, output_dir=None, max_mss=MAX_MSS):
         self.host = host
         self.port = port
         self.drop_rate = drop_rate             # 模拟丢包率
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)  # 创建 UDP socket
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECV_BUFFER)  # 内核可能按上限截断，不影响正确性
         self.sock.bind((self.host, self.port)) # 绑定地址和端口
-        self.expected_seq = 1                  # 期望的下一个字节序号（累计确认）
+        self.selective = selective             # 是否同意客户端请求的 Selective Repeat
+        self.reorder_limit = reorder_limit
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.ack_every = ack_every             # 1 表示每个包都马上回 ACK（原来的行为）
+        self.ack_delay = ack_delay
+        self.output_dir = output_dir           # 客户端发来的文件存到这里；None 表示收到的数据不保存
+        self.max_mss = max_mss                 # 握手时最多同意多大的 mss
+        self.recv_size = HEADER_SIZE + max_mss # recvfrom 的缓冲区：按最大的包收，大包不会被悄悄截断
+        self.sessions = OrderedDict()          # (对端地址, 连接 ID) -> Session，最久没有活动的在最前面
+        self.fins = []                         # 待发的 FIN：(发送时间, 对端地址, ack) 小顶堆
+        self.acks = []                         # 待发的延迟 ACK：(发送时间, 会话 key) 小顶堆，过期的条目弹出时跳过
+        self.stats = {'opened': 0, 'closed': 0, 'evicted': 0, 'rejected': 0, 'unknown': 0, 'peak': 0,
+                      'data': 0, 'acks': 0, 'polls': 0, 'recvs': 0, 'sends': 0}
+        self.mode = mode
+        self.loop = None                       # asyncio 模式的事件循环（在服务端线程里跑）
+        self.transport = None                  # asyncio 模式下发包走 transport
+        self.stopping = None                   # asyncio 模式的停止信号（asyncio.Event）
         self.running = True                    # 控制服务是否继续运行
 
+    def send(self, pkt, addr):
+        #发一个包：asyncio 模式走 transport（不会阻塞事件循环），线程模式直接 sendto
+        self.stats['sends'] += 1
+        if self.transport is not None:
+            self.transport.sendto(pkt, addr)
+            return
+        try:
+            self.sock.sendto(pkt, addr)
+        except BlockingIOError:
+            pass  # 发送缓冲区满了就当这个包丢了，对端会重传
+
     def pack_header(self, seq, ack, flags, data_len=0, timestamp=0):
         #封装协议头
-        return struct.pack(HEADER_FORMAT, seq, ack, flags, data_len, timestamp)
+        return struct.pack(HEADER_FORMAT, wrap(seq), wrap(ack), flags, data_len, timestamp)
 
     def unpack_header(self, data):
         #解析协议头
         return struct.unpack(HEADER_FORMAT, data[:HEADER_SIZE])
 
+    def poll_timeout(self, now):
+        #select 最多阻塞多久：下一个 FIN 或延迟 ACK 到期的时间，最长 MAX_POLL_INTERVAL
+        timeout = MAX_POLL_INTERVAL
+        for heap in (self.fins, self.acks):
+            if heap:
+                timeout = min(timeout, max(0.0, heap[0][0] - now))
+        return timeout
+
+    def send_due_fins(self, now):
+        #发出所有到期的延迟 FIN
+        while self.fins and self.fins[0][0] <= now:
+            _, addr, ack = heapq.heappop(self.fins)
+            self.send_fin(addr, ack)
+
+    def send_due_acks(self, now):
+        #发出所有到期的延迟 ACK
+        while self.acks and self.acks[0][0] <= now:
+            due, key = heapq.heappop(self.acks)
+            self.flush_ack(key, due)
+
+    def flush_ack(self, key, due):
+        #延迟 ACK 到期：连接还在、而且这期间没有因为别的原因回过 ACK，才真的发
+        session = self.sessions.get(key)
+        if session is not None and session.ack_due == due:
+            self.send_ack(session, int(time.time() * 1000))
+
+    def schedule_ack(self, session, now):
+        #ACK_DELAY 秒后回 ACK：和延迟 FIN 一样，asyncio 模式交给事件循环，线程模式放进定时堆
+        session.ack_due = now + self.ack_delay
+        key = (session.addr, session.conn_id)
+        if self.loop is not None:
+            self.loop.call_later(self.ack_delay, self.flush_ack, key, session.ack_due)
+        else:
+            heapq.heappush(self.acks, (session.ack_due, key))
+
+    def send_ack(self, session, now_ts):
+        #回复累计 ACK（或重复 ACK），SR 模式下带上已缓存的区间；攒着的按序包一起确认
+        ranges = session.sack_ranges() if session.sr else []
+        sack = b''.join(SACK_RANGE.pack(wrap(start), wrap(end)) for start, end in ranges)
+        ack_pkt = self.pack_header(
+            seq=0,
+            ack=session.expected_seq,
+            flags=FLAG_ACK | (FLAG_SACK if ranges else 0),
+            data_len=len(sack),
+            timestamp=now_ts
+        )
+        self.send(ack_pkt + sack, session.addr)
+        self.stats['acks'] += 1
+        session.unacked = 0
+        session.ack_due = None
+        print(f"[Server] Sent ACK, ack={session.expected_seq}"
+              + (f", SACK={ranges}" if ranges else ""))
+
+    def send_fin(self, addr, ack):
+        #挥手：服务端自己的 FIN
+        fin_pkt = self.pack_header(seq=0, ack=ack, flags=FLAG_FIN, timestamp=int(time.time() * 1000))
+        self.send(fin_pkt, addr)
+        print(f"[Server] Sent FIN to {addr}, ack={ack}")
+
+    def schedule_fin(self, addr, ack, now):
+        #FIN_DELAY 秒后发 FIN：asyncio 模式交给事件循环，线程模式放进定时堆，都不阻塞其他连接
+        if self.loop is not None:
+            self.loop.call_later(FIN_DELAY, self.send_fin, addr, ack)
+        else:
+            heapq.heappush(self.fins, (now + FIN_DELAY, addr, ack))
+
+    def evict_idle(self, now):
+        #清掉空闲太久的连接；有序字典按活动时间排好，只看最前面的，摊下来每个包 O(1)
+        while self.sessions:
+            key, session = next(iter(self.sessions.items()))
+            if now - session.last_seen < self.idle_timeout:
+                break
+            del self.sessions[key]
+            session.close_output()
+            self.stats['evicted'] += 1
+            print(f"[Server] Evicted idle session {key}")
+
+    def open_session(self, key, flags, addr, now_ts, requested_mss=0, info=b''):
+        #处理 SYN：新建连接状态，会话表满了回 RST；info 是发文件时的文件长度和文件名
+        session = self.sessions.get(key)
+        if session is not None:
+            # 同一个连接的 SYN 又来了：客户端没收到 SYN-ACK 重发了，或者路上被复制、被延迟了
+            # 只重发 SYN-ACK，不重置状态，否则已经收下的数据会被当成没收过
+            self.send_syn_ack(session, now_ts)
+            return
+        if len(self.sessions) >= self.max_sessions:
+            self.stats['rejected'] += 1
+            self.send(self.pack_header(seq=0, ack=0, flags=FLAG_RST, timestamp=now_ts), addr)
+            print(f"[Server] Session table full ({self.max_sessions}), sent RST to {addr}")
+            return
+        sr = bool(flags & FLAG_SR) and self.selective  # 客户端请求且本端允许才用 SR
+        mss = min(requested_mss or LEGACY_MSS, self.max_mss)  # 不超过本端的收包缓冲区
+        session = Session(addr, key[1], sr, self.reorder_limit, mss)
+        if self.output_dir is not None and len(info) >= FILE_INFO.size:
+            (size,) = FILE_INFO.unpack_from(info)
+            name = os.path.basename(info[FILE_INFO.size:].decode('utf-8', errors='replace')) or f"conn-{key[1]}"
+            try:
+                session.open_output(os.path.join(self.output_dir, name), size)
+            except OSError as e:
+                print(f"[Server] Cannot write {name}: {e}")  # 照样收，只是不保存
+        self.sessions[key] = session
+        self.stats['opened'] += 1
+        self.stats['peak'] = max(self.stats['peak'], len(self.sessions))
+        self.send_syn_ack(session, now_ts)
+        print(f"[Server] Handshake OK with {addr} (conn {key[1]}). Sent SYN-ACK, ack={session.expected_seq}, "
+              f"mode={'SR' if sr else 'GBN'}, mss={session.mss}")
+
+    def send_syn_ack(self, session, now_ts):
+        #回 SYN-ACK：seq 是商定的 mss，ack 是期望的下一个字节
+        syn_ack = self.pack_header(
+            seq=session.mss,
+            ack=session.expected_seq,
+            flags=FLAG_SYN | FLAG_ACK | (FLAG_SR if session.sr else 0),
+            timestamp=now_ts
+        )
+        self.send(syn_ack, session.addr)
+
     def handle_connection(self):
-        #主循环：处理握手、数据传输、四次挥手
-        print(f"[Server] UDP Server started on {self.host}:{self.port}")
+        #线程模式主循环：select 等到有包，再把非阻塞 socket 里排着的包一口气收完，顺带处理到期的定时动作
+        print(f"[Server] UDP Server started on {self.host}:{self.port} (mode=thread)")
+        self.sock.setblocking(False)
         while self.running:
             try:
-                data, addr = self.sock.recvfrom(1024)  # 收数据
-                if len(data) < HEADER_SIZE:#20，不合法
-                    continue
-
-                seq, ack_num, flags, data_len, ts = self.unpack_header(data)
-                now_ts = int(time.time() * 1000)  # 当前时间戳（毫秒）
-
-                # === 处理 SYN（握手第一步）===
-                if flags & FLAG_SYN:
-                    syn_ack = self.pack_header(
-                        seq=0,
-                        ack=self.expected_seq,
-                        flags=FLAG_SYN | FLAG_ACK,
-                        timestamp=now_ts
-                    )
-                    self.sock.sendto(syn_ack, addr)  # 回 SYN-ACK
-                    print(f"[Server] Handshake OK. Sent SYN-ACK, ack={self.expected_seq}")
-
-                # === 处理 FIN（挥手）===
-                elif flags & FLAG_FIN:
-                    # 回 FIN-ACK
-                    fin_ack = self.pack_header(
-                        seq=0,
-                        ack=self.expected_seq,
-                        flags=FLAG_ACK | FLAG_FIN,
-                        timestamp=now_ts
-                    )
-                    self.sock.sendto(fin_ack, addr)
-                    print(f"[Server] Sent FIN-ACK, ack={self.expected_seq}")
-
-                    time.sleep(0.5)  # 等一下再发 FIN
-                    fin_pkt = self.pack_header(
-                        seq=0,
-                        ack=self.expected_seq,
-                        flags=FLAG_FIN,
-                        timestamp=now_ts
-                    )
-                    self.sock.sendto(fin_pkt, addr)
-                    print(f"[Server] Sent FIN, ack={self.expected_seq}")
-
-                # === 处理数据包 ===
-                else:
-                    print(f"[Server] Received DATA seq={seq}, expected={self.expected_seq}, len={data_len}")
-
-                    # === 丢包模拟 ===
-                    if random.random() < self.drop_rate:
-                        print(f"[Server] Simulated packet drop (seq={seq})")
-                        continue  # 丢掉这个包，不回复 ACK
-
-                    # === 正确顺序 ===
-                    if seq == self.expected_seq:
-                        self.expected_seq += data_len
-                        print(f"[Server] In-order packet. Updated expected_seq={self.expected_seq}")
-                    else:
-                        print(f"[Server] Out-of-order! Expected {self.expected_seq} but got {seq}")
-
-                    # 回复 ACK（累计确认或重复 ACK）
-                    ack_pkt = self.pack_header(
-                        seq=0,
-                        ack=self.expected_seq,
-                        flags=FLAG_ACK,
-                        timestamp=now_ts
-                    )
-                    self.sock.sendto(ack_pkt, addr)
-                    print(f"[Server] Sent ACK, ack={self.expected_seq}")
-
+                self.stats['polls'] += 1
+                readable, _, _ = select.select([self.sock], [], [], self.poll_timeout(time.time()))
+                if readable:
+                    self.drain()
+                now = time.time()
+                self.send_due_acks(now)
+                self.send_due_fins(now)
+                self.evict_idle(now)
             except Exception as e:
-                print(f"[Server] Error: {e}")  # 有异常直接输出
+                if self.running:
+                    print(f"[Server] Error: {e}")  # 有异常直接输出
+
+    def drain(self):
+        #连续 recvfrom 直到 socket 空了（或者收满 BURST_LIMIT 个），一次 select 摊到一整批包上
+        for _ in range(BURST_LIMIT):
+            self.stats['recvs'] += 1
+            try:
+                data, addr = self.sock.recvfrom(self.recv_size)  # 收数据
+            except BlockingIOError:
+                return
+            self.handle_packet(data, addr, time.time())
+
+    def handle_packet(self, data, addr, now):
+        #处理一个收到的包：握手、数据传输、四次挥手；所有连接共用一个 socket，按 (地址, 连接 ID) 区分
+        if len(data) < HEADER_SIZE:#20，不合法
+            return
+
+        seq, conn_id, flags, data_len, ts = self.unpack_header(data)
+        now_ts = int(now * 1000)  # 当前时间戳（毫秒）
+        key = (addr, conn_id)
+
+        # === 处理 SYN（握手第一步）===
+        if flags & FLAG_SYN:
+            self.open_session(key, flags, addr, now_ts, seq, data[HEADER_SIZE:HEADER_SIZE + data_len])
+            return
+
+        session = self.sessions.get(key)
+        if session is None:
+            self.stats['unknown'] += 1  # 没握手或者已经被清掉的连接，直接忽略
+            return
+        session.last_seen = now
+        self.sessions.move_to_end(key)  # 最近活动的放到最后
+
+        # === 处理 FIN（挥手）===
+        if flags & FLAG_FIN:
+            # 回 FIN-ACK
+            fin_ack = self.pack_header(
+                seq=0,
+                ack=session.expected_seq,
+                flags=FLAG_ACK | FLAG_FIN,
+                timestamp=now_ts
+            )
+            self.send(fin_ack, addr)
+            session.unacked = 0
+            session.ack_due = None  # FIN-ACK 已经带上累计确认，攒着的 ACK 不用再发
+            session.close_output()  # 对端所有数据都被确认了才会发 FIN
+            print(f"[Server] Sent FIN-ACK to {addr}, ack={session.expected_seq}")
+            # 等一下再发 FIN
+            self.schedule_fin(addr, session.expected_seq, now)
+
+        # === 挥手的最后一个 ACK：连接结束，清掉状态 ===
+        elif flags & FLAG_ACK:
+            del self.sessions[key]
+            session.close_output()
+            self.stats['closed'] += 1
+            print(f"[Server] Connection with {addr} (conn {conn_id}) closed")
+
+        # === 处理数据包 ===
+        else:
+            seq = unwrap(seq, session.expected_seq)  # 32 位 seq -> 完整字节号
+            print(f"[Server] Received DATA seq={seq}, expected={session.expected_seq}, len={data_len}")
+
+            # === 丢包模拟 ===
+            if random.random() < self.drop_rate:
+                print(f"[Server] Simulated packet drop (seq={seq})")
+                return  # 丢掉这个包，不回复 ACK
+
+            self.stats['data'] += 1
+            had_gap = bool(session.reorder)
+
+            # === 正确顺序 ===
+            if session.deliver(seq, data[HEADER_SIZE:HEADER_SIZE + data_len]):
+                print(f"[Server] In-order packet. Updated expected_seq={session.expected_seq}")
+                if not had_gap:
+                    # 延迟 ACK：攒够 ack_every 个按序包，或者等 ack_delay 秒，先到哪个算哪个
+                    session.unacked += 1
+                    if session.unacked >= self.ack_every:
+                        self.send_ack(session, now_ts)
+                    elif session.ack_due is None:
+                        self.schedule_ack(session, now)
+                    return
+            else:
+                print(f"[Server] Out-of-order! Expected {session.expected_seq} but got {seq}")
+
+            # 乱序、重复，或者补上了缺口：马上回 ACK，发送方靠它做快速重传和 SACK
+            self.send_ack(session, now_ts)
+
+    def run_asyncio(self):
+        #asyncio 模式：在服务端线程里跑事件循环，直到 stop()
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_until_complete(self.serve())
+        finally:
+            self.loop.close()  # 还没到期的延迟 FIN 直接丢掉
+
+    async def serve(self):
+        #收包是 DatagramProtocol 回调，延迟 FIN 和空闲清理是定时回调，没有任何地方会 sleep
+        self.sock.setblocking(False)
+        self.transport, _ = await self.loop.create_datagram_endpoint(lambda: ServerProtocol(self), sock=self.sock)
+        self.loop.call_later(MAX_POLL_INTERVAL, self.evict_idle_periodically)
+        print(f"[Server] UDP Server started on {self.host}:{self.port} (mode=asyncio)")
+        try:
+            await self.stopping.wait()  # stop() 从别的线程 call_soon_threadsafe(stopping.set)
+        finally:
+            self.transport.close()  # 会把 self.sock 一起关掉
+            await asyncio.sleep(0)  # 让 transport 的关闭回调跑完
+
+    def evict_idle_periodically(self):
+        #每 MAX_POLL_INTERVAL 秒清一次空闲连接
+        self.evict_idle(time.time())
+        self.loop.call_later(MAX_POLL_INTERVAL, self.evict_idle_periodically)
 
     def start(self):
         #启动服务端线程"""
-        self.thread = threading.Thread(target=self.handle_connection)
+        target = self.handle_connection
+        if self.mode == 'asyncio':
+            self.loop = asyncio.new_event_loop()  # 在这里建好，stop() 马上调用也能找到它
+            self.stopping = asyncio.Event()
+            target = self.run_asyncio
+        self.thread = threading.Thread(target=target)
         self.thread.start()
 
     def stop(self):
         #停止服务端"""
         self.running = False
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.stopping.set)
+        self.thread.join()  # 线程模式的主循环最多 MAX_POLL_INTERVAL 秒就会检查一次 running
         self.sock.close()
-        self.thread.join()
-        print("[Server] Stopped.")
+        for session in self.sessions.values():
+            session.close_output()  # 没传完的文件也关掉，已经收到的部分留在里面
+        # 每个数据包摊到的 socket 调用：select + recvfrom + sendto（asyncio 模式的 select 在事件循环里，数不到）
+        calls = self.stats['polls'] + self.stats['recvs'] + self.stats['sends']
+        print(f"[Server] Stopped. sessions={len(self.sessions)} "
+              + ' '.join(f"{k}={v}" for k, v in self.stats.items())
+              + f" syscalls/pkt={calls / max(1, self.stats['data']):.2f}")
+
+# === asyncio 模式的收包回调：每个数据报直接交给 UDPServer.handle_packet ===
+class ServerProtocol(asyncio.DatagramProtocol):
+    def __init__(self, server):
+        self.server = server
+
+    def datagram_received(self, data, addr):
+        self.server.stats['recvs'] += 1
+        try:
+            self.server.handle_packet(data, addr, time.time())
+        except Exception as e:
+            print(f"[Server] Error: {e}")  # 和线程模式一样，一个坏包不影响其他连接
+
+    def error_received(self, exc):
+        print(f"[Server] Error: {exc}")  # 例如对端端口不可达（ICMP），忽略继续收
 
 # === 命令行执行入口 ===
 if __name__ == "__main__":
-    import sys
-    if len(sys.argv) < 2:
-        print("Usage: python udp_server.py <port> [drop_rate]")
-        sys.exit(1)
-
-    port = int(sys.argv[1])  # 端口
-    drop_rate = float(sys.argv[2]) if len(sys.argv) > 2 else 0.2  # 丢包率（可选参数）
+    parser = argparse.ArgumentParser(description='UDP reliable transfer server')
+    parser.add_argument('port', type=int, help='端口')
+    parser.add_argument('drop_rate', type=float, nargs='?', default=0.2, help='模拟丢包率（可选参数）')
+    parser.add_argument('--max-sessions', type=int, default=MAX_SESSIONS,
+                        help='最多同时保存多少个连接的状态，满了新的 SYN 回 RST')
+    parser.add_argument('--idle-timeout', type=float, default=IDLE_TIMEOUT,
+                        help='连接多少秒没有任何包就清掉它的状态')
+    parser.add_argument('--ack-every', type=int, default=ACK_EVERY,
+                        help='每收到多少个按序包回一个累计 ACK，1 表示每个包都回')
+    parser.add_argument('--ack-delay', type=float, default=ACK_DELAY * 1000,
+                        help='按序包最多攒多少毫秒就回 ACK')
+    parser.add_argument('--max-mss', type=int, default=MAX_MSS,
+                        help='握手时最多同意多大的 mss（字节），收包缓冲区按它分配')
+    parser.add_argument('--output-dir', help='客户端用 --file 发来的文件存到这个目录；不指定时收到的数据不保存')
+    parser.add_argument('--mode', choices=SERVER_MODES, default='thread',
+                        help='thread: 阻塞 recvfrom 循环；asyncio: 单线程事件循环，延迟 FIN 等定时动作都是回调')
+    args = parser.parse_args()
 
-    server = UDPServer("0.0.0.0", port, drop_rate)
+    server = UDPServer("0.0.0.0", args.port, args.drop_rate,
+                       max_sessions=args.max_sessions, idle_timeout=args.idle_timeout, mode=args.mode,
+                       ack_every=args.ack_every, ack_delay=args.ack_delay / 1000, output_dir=args.output_dir,
+                       max_mss=args.max_mss)
     server.start()
 
     try:
@@ -0,0 +1,70 @@
+import time
+import random
+import argparse
+
+from blocks import build_ack_index
+
+# === 按客户端的方式排好块的字节范围，payload 与查找无关，留空省得生成 ===
+def make_layout(n, rng):
+    blocks = []
+    start_byte = 1
+    for _ in range(n):
+        length = rng.randint(40, 80)
+        blocks.append((start_byte, length, b''))
+        start_byte += length
+    return blocks
+
+# === 服务端回的 ACK 序列：每块一个累计 ACK，按 dup_rate 夹杂重复 ACK（丢包时服务端重发的旧 ACK） ===
+def make_acks(blocks, dup_rate, rng):
+    acks = []
+    for start_byte, length, _ in blocks:
+        acks.append(start_byte + length)
+        if rng.random() < dup_rate:
+            acks.append(start_byte + length)
+    return acks
+
+# === 旧写法：每个 ACK 遍历 blocks，找末尾字节等于 ack_num - 1 的块 ===
+def old_lookup(blocks, ack_num):
+    acked_byte = ack_num - 1
+    for i, (start_byte, length, _) in enumerate(blocks, start=1):
+        if start_byte + length - 1 == acked_byte:
+            return i
+    return None
+
+# === 跑一遍 ACK 序列，返回每个 ACK 的平均耗时（秒） ===
+def per_ack(lookup, acks):
+    begin = time.perf_counter()
+    for ack_num in acks:
+        lookup(ack_num)
+    return (time.perf_counter() - begin) / len(acks)
+
+def main():
+    parser = argparse.ArgumentParser(description='recv_ack 查找的扩展性：逐块遍历 vs 预先建好的 ACK 号索引')
+    parser.add_argument('--sizes', default='1000,10000,100000,1000000', help='逗号分隔的块数 total_packets')
+    parser.add_argument('--dup-rate', type=float, default=0.2, help='重复 ACK 的比例（大约等于丢包率）')
+    parser.add_argument('--old-samples', type=int, default=200,
+                        help='旧写法只抽这么多个 ACK 计时，再乘以 ACK 总数估算整次传输（全跑是 O(n^2)）')
+    parser.add_argument('--seed', type=int, default=1, help='随机种子')
+    args = parser.parse_args()
+
+    print(f"{'packets':>9} {'acks':>9} {'index(ms)':>10} {'new us/ack':>11} {'new total(s)':>13} "
+          f"{'old us/ack':>11} {'old total(s)':>13} {'speedup':>9}")
+    for n in (int(x) for x in args.sizes.split(',')):
+        rng = random.Random(args.seed)
+        blocks = make_layout(n, rng)
+        acks = make_acks(blocks, args.dup_rate, rng)
+
+        begin = time.perf_counter()
+        ack_index = build_ack_index(blocks)
+        build = time.perf_counter() - begin
+        new = per_ack(ack_index.get, acks)
+
+        # 均匀抽样，平均扫描长度和整次传输一样（约 n/2）
+        step = max(1, len(acks) // args.old_samples)
+        old = per_ack(lambda ack_num: old_lookup(blocks, ack_num), acks[::step])
+
+        print(f"{n:>9} {len(acks):>9} {build * 1000:>10.1f} {new * 1e6:>11.3f} {new * len(acks) + build:>13.3f} "
+              f"{old * 1e6:>11.1f} {old * len(acks):>13.1f} {old / new:>9.0f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,209 @@
+import os
+import sys
+import time
+import random
+import shlex
+import signal
+import socket
+import struct
+import argparse
+import selectors
+import tempfile
+import subprocess
+
+from blocks import build_ack_index
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SERVER_SCRIPT = os.path.join(HERE, 'UDPserver.py')
+
+# ====== 和 UDPclient.py 相同的协议头和标志位 ======
+HEADER_FORMAT = '!I I H H Q'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+FLAG_SYN = 0x01
+FLAG_ACK = 0x02
+FLAG_FIN = 0x04
+FLAG_RST = 0x20
+
+TICK = 0.02          # 多久检查一次各条流的定时器（秒）
+SOCKET_BUFFER = 1 << 20  # 每条流 socket 的收发缓冲区
+
+# === 一条模拟的发送流：自己的 socket 和连接 ID，GBN 窗口 + 固定超时重传 ===
+# 和 UDPclient.py 不同，SYN 和 FIN 丢了也会重发：几千条流同时握手时本机 socket 缓冲区也可能溢出
+class Flow:
+    def __init__(self, server, blocks, ack_index, payload, window, rto):
+        self.server = server
+        self.blocks = blocks
+        self.ack_index = ack_index
+        self.payload = payload
+        self.window = window
+        self.rto = rto
+        self.conn_id = random.randint(1, 0xFFFFFFFF)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_BUFFER)
+        self.sock.setblocking(False)
+        self.state = 'syn'   # syn -> data -> fin -> fin_wait -> done；被拒绝时是 refused
+        self.base = 1
+        self.next_idx = 1
+        self.deadline = 0.0  # base 那一块（或者 SYN / FIN）的重传时间
+        self.sent = 0
+        self.data_done = None  # 所有数据都被确认的时刻
+
+    def send(self, seq, flags, payload=b''):
+        header = struct.pack(HEADER_FORMAT, seq, self.conn_id, flags, len(payload), 0)
+        try:
+            self.sock.sendto(header + payload, self.server)
+        except BlockingIOError:
+            pass  # 发送缓冲区满了就当丢包，靠重传
+        self.deadline = time.monotonic() + self.rto
+
+    def send_block(self, idx):
+        start_byte, length, _ = self.blocks[idx - 1]
+        self.send(start_byte, 0, self.payload[:length])
+        self.sent += 1
+
+    def fill_window(self):
+        while self.next_idx < self.base + self.window and self.next_idx <= len(self.blocks):
+            self.send_block(self.next_idx)
+            self.next_idx += 1
+
+    def on_packet(self, data):
+        if len(data) < HEADER_SIZE:
+            return
+        _, ack_num, flags, _, _ = struct.unpack(HEADER_FORMAT, data[:HEADER_SIZE])
+        if self.state == 'syn':
+            if flags & FLAG_RST:
+                self.state = 'refused'
+            elif flags & FLAG_SYN and flags & FLAG_ACK:
+                self.state = 'data'
+                self.fill_window()
+        elif self.state == 'data' and flags & FLAG_ACK:
+            confirmed = self.ack_index.get(ack_num)
+            if confirmed and confirmed >= self.base:
+                self.base = confirmed + 1
+                if self.base > len(self.blocks):
+                    self.data_done = time.monotonic()
+                    self.state = 'fin'
+                    self.send(0, FLAG_FIN)
+                else:
+                    self.deadline = time.monotonic() + self.rto
+                    self.fill_window()
+        elif self.state == 'fin' and flags & FLAG_FIN and flags & FLAG_ACK:
+            self.state = 'fin_wait'
+            self.deadline = time.monotonic() + self.rto + 1.0  # 服务端延迟一会儿才发 FIN
+        elif self.state in ('fin', 'fin_wait') and flags & FLAG_FIN and not flags & FLAG_ACK:
+            self.send(0, FLAG_ACK)  # 最后一个 ACK
+            self.state = 'done'
+
+    def on_timer(self, now):
+        if self.state in ('done', 'refused') or now < self.deadline:
+            return
+        if self.state == 'syn':
+            self.send(0, FLAG_SYN)
+        elif self.state == 'data':
+            for idx in range(self.base, self.next_idx):  # GBN：从 base 开始全部重发
+                self.send_block(idx)
+        else:
+            self.state = 'fin'
+            self.send(0, FLAG_FIN)  # FIN-ACK 或 FIN 丢了，重新挥手
+
+# === 跑一轮：起一个新的服务端，n 条流同时传，返回一条结果记录 ===
+def run_round(n, args, blocks, ack_index, payload):
+    port = args.port_base + n % 1000
+    log = tempfile.TemporaryFile()
+    server = subprocess.Popen([sys.executable, SERVER_SCRIPT, str(port), str(args.drop_rate),
+                               '--max-sessions', str(args.max_sessions), '--mode', args.server_mode]
+                              + shlex.split(args.server_args), stdout=log, stderr=subprocess.STDOUT)
+    time.sleep(0.5)  # 等服务端 bind 好
+    try:
+        sel = selectors.DefaultSelector()
+        flows = [Flow(('127.0.0.1', port), blocks, ack_index, payload, args.window, args.rto) for _ in range(n)]
+        begin = time.monotonic()
+        for flow in flows:
+            sel.register(flow.sock, selectors.EVENT_READ, flow)
+            flow.send(0, FLAG_SYN)
+
+        next_tick = begin + TICK
+        while any(f.state not in ('done', 'refused') for f in flows):
+            if time.monotonic() - begin > args.timeout:
+                break
+            for key, _ in sel.select(max(0.0, next_tick - time.monotonic())):
+                flow = key.data
+                while True:
+                    try:
+                        data = flow.sock.recv(2048)
+                    except BlockingIOError:
+                        break
+                    flow.on_packet(data)
+            now = time.monotonic()
+            if now >= next_tick:
+                for flow in flows:
+                    flow.on_timer(now)
+                next_tick = now + TICK
+        closed = time.monotonic() - begin
+        for flow in flows:
+            sel.unregister(flow.sock)
+            flow.sock.close()
+    finally:
+        time.sleep(0.5)  # 让服务端处理完排在缓冲区里的最后几个 ACK，会话统计才准确
+        server.send_signal(signal.SIGINT)  # 服务端 stop() 打印会话统计
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+            server.wait()
+
+    log.seek(max(0, os.fstat(log.fileno()).st_size - 4096))
+    stopped = [line for line in log.read().decode(errors='ignore').splitlines() if 'Stopped.' in line]
+    log.close()
+
+    completed = [f for f in flows if f.data_done]
+    data_time = max((f.data_done for f in completed), default=begin) - begin
+    sent = sum(f.sent for f in flows)
+    nbytes = len(completed) * (blocks[-1][0] + blocks[-1][1] - 1)
+    return {
+        'flows': n,
+        'completed': len(completed),
+        'refused': sum(f.state == 'refused' for f in flows),
+        'data_s': data_time,
+        'close_s': closed,
+        'kb_per_s': nbytes / data_time / 1024 if data_time else 0.0,
+        'pkts_per_s': sent / data_time if data_time else 0.0,
+        'retx': (sent - len(completed) * len(blocks)) / sent if sent else 0.0,
+        'server': stopped[-1].split('Stopped. ')[-1] if stopped else '-',
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='UDPServer 并发流压测：N 条发送流同时连同一个服务端 socket')
+    parser.add_argument('--flows', default='10,100,1000,3000', help='逗号分隔的并发流数 N')
+    parser.add_argument('--packets', type=int, default=100, help='每条流发多少个数据块')
+    parser.add_argument('--window', type=int, default=5, help='每条流的 GBN 窗口（块数）')
+    parser.add_argument('--rto', type=float, default=0.3, help='每条流的固定重传超时（秒）')
+    parser.add_argument('--drop-rate', type=float, default=0.0, help='服务端模拟丢包率')
+    parser.add_argument('--max-sessions', type=int, default=10000, help='服务端会话表上限')
+    parser.add_argument('--server-mode', choices=['thread', 'asyncio'], default='thread', help='服务端模式')
+    parser.add_argument('--server-args', default='', help='额外传给服务端的参数，例如 "--ack-every 1"')
+    parser.add_argument('--port-base', type=int, default=28000, help='服务端端口从这里开始')
+    parser.add_argument('--timeout', type=float, default=300, help='每轮最多跑多少秒')
+    parser.add_argument('--seed', type=int, default=1, help='块长度的随机种子')
+    args = parser.parse_args()
+
+    # 所有流的块长度相同（40~80 字节，和 UDPclient.py 一样），payload 从同一段字母里切
+    rng = random.Random(args.seed)
+    blocks = []
+    start_byte = 1
+    for _ in range(args.packets):
+        length = rng.randint(40, 80)
+        blocks.append((start_byte, length, None))
+        start_byte += length
+    ack_index = build_ack_index(blocks)
+    payload = b'A' * 80
+
+    print(f"{'flows':>6} {'done':>6} {'refused':>8} {'data(s)':>8} {'close(s)':>9} {'KB/s':>9} {'pkts/s':>9} "
+          f"{'retx':>6}  server")
+    for n in (int(x) for x in args.flows.split(',')):
+        r = run_round(n, args, blocks, ack_index, payload)
+        print(f"{r['flows']:>6} {r['completed']:>6} {r['refused']:>8} {r['data_s']:>8.2f} {r['close_s']:>9.2f} "
+              f"{r['kb_per_s']:>9.1f} {r['pkts_per_s']:>9.0f} {r['retx']:>6.3f}  {r['server']}")
+
+if __name__ == '__main__':
+    main()
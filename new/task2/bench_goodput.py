@@ -0,0 +1,79 @@
+import os
+import re
+import sys
+import time
+import socket
+import argparse
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SERVER_SCRIPT = os.path.join(HERE, 'UDPserver.py')
+CLIENT_SCRIPT = os.path.join(HERE, 'UDPclient.py')
+
+# === 客户端汇总里要取的几行 ===
+SUMMARY = {
+    'seconds': re.compile(r'传输耗时: ([\d.]+) s'),
+    'sent': re.compile(r'发送次数: (\d+)'),
+    'goodput': re.compile(r'有效吞吐: ([\d.]+) KB/s'),
+    'mode': re.compile(r'模式: (\w+)'),
+}
+
+# === 找一个空闲 UDP 端口给这一轮的服务端用 ===
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+# === 跑一次：新起一个服务端（各轮之间状态互不影响），客户端传完后解析它的汇总 ===
+def run_one(mode, cc, drop_rate, packets, timeout):
+    port = free_port()
+    server = subprocess.Popen([sys.executable, SERVER_SCRIPT, str(port), str(drop_rate)],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        time.sleep(0.3)  # 等服务端 bind 好
+        try:
+            proc = subprocess.run([sys.executable, CLIENT_SCRIPT, '127.0.0.1', str(port), str(packets), mode,
+                                   '--cc', cc], capture_output=True, text=True, timeout=timeout)
+        except subprocess.TimeoutExpired:
+            proc = None  # run 超时时已经杀掉了客户端
+    finally:
+        server.terminate()
+        server.wait()
+    if proc is None:
+        return None  # 超时：这一行记成 timeout，不影响后面几轮
+    if proc.returncode:
+        # 客户端中途崩溃时汇总可能已经打印了一部分，不能当成正常结果
+        raise RuntimeError(f"client exited with {proc.returncode} (mode={mode}, cc={cc}, drop={drop_rate}):\n"
+                           f"{proc.stderr.strip()}")
+    out = proc.stdout
+    result = {}
+    for key, pattern in SUMMARY.items():
+        m = pattern.search(out)
+        if not m:
+            raise RuntimeError(f"client output has no {key} line (mode={mode}, cc={cc}, drop={drop_rate})")
+        result[key] = m.group(1)
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description='SR / GBN、不同拥塞控制在不同丢包率下的有效吞吐对比')
+    parser.add_argument('--drop-rates', default='0,0.05,0.1,0.2', help='逗号分隔的服务端丢包率')
+    parser.add_argument('--packets', type=int, default=500, help='每次传多少个数据块')
+    parser.add_argument('--modes', default='gbn,sr', help='逗号分隔的模式')
+    parser.add_argument('--ccs', default='fixed,reno', help='逗号分隔的拥塞控制算法')
+    parser.add_argument('--timeout', type=float, default=600, help='单次传输最多等多少秒')
+    args = parser.parse_args()
+
+    print(f"{'drop':>6} {'mode':>5} {'cc':>6} {'time(s)':>9} {'sent':>7} {'retx ratio':>11} {'goodput KB/s':>13}")
+    for drop_rate in (float(x) for x in args.drop_rates.split(',')):
+        for mode in args.modes.split(','):
+            for cc in args.ccs.split(','):
+                r = run_one(mode, cc, drop_rate, args.packets, args.timeout)
+                if r is None:
+                    print(f"{drop_rate:>6.2f} {mode.upper():>5} {cc:>6} {'timeout':>9} {'-':>7} {'-':>11} {'-':>13}")
+                    continue
+                sent = int(r['sent'])
+                print(f"{drop_rate:>6.2f} {r['mode']:>5} {cc:>6} {float(r['seconds']):>9.3f} {sent:>7} "
+                      f"{(sent - args.packets) / sent:>11.3f} {float(r['goodput']):>13.2f}")
+
+if __name__ == '__main__':
+    main()
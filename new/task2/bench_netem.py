@@ -0,0 +1,123 @@
+import os
+import re
+import sys
+import time
+import signal
+import socket
+import argparse
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SERVER_SCRIPT = os.path.join(HERE, 'UDPserver.py')
+CLIENT_SCRIPT = os.path.join(HERE, 'UDPclient.py')
+RELAY_SCRIPT = os.path.join(HERE, 'netem.py')
+
+# === 内置的损伤场景：名字 -> (client->server 方向, server->client 方向)，格式见 netem.py ===
+SCENARIOS = {
+    'clean': ('', ''),
+    'delay': ('delay=20', 'delay=20'),
+    'jitter': ('delay=20,jitter=10', 'delay=20,jitter=10'),
+    'reorder': ('reorder=0.05,reorder_delay=5', 'reorder=0.05,reorder_delay=5'),
+    'dup': ('dup=0.05', 'dup=0.05'),
+    'rate': ('rate=2000,queue=50', ''),
+    'loss': ('loss=0.02', 'loss=0.02'),
+    'burst': ('ge_p=0.01,ge_r=0.3', 'ge_p=0.01,ge_r=0.3'),
+}
+
+# === 客户端汇总里要取的几行 ===
+SUMMARY = {
+    'seconds': re.compile(r'传输耗时: ([\d.]+) s'),
+    'sent': re.compile(r'发送次数: (\d+)'),
+    'goodput': re.compile(r'有效吞吐: ([\d.]+) KB/s'),
+    'mode': re.compile(r'模式: (\w+)'),
+}
+RELAY_STATS = re.compile(r'(\w+)=(\d+)')
+
+# === 找一个空闲 UDP 端口 ===
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def stop(proc, sig=signal.SIGINT):
+    #让进程自己打印统计后退出，10 秒还没退就杀掉
+    proc.send_signal(sig)
+    try:
+        return proc.communicate(timeout=10)[0] or ''
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        return proc.communicate()[0] or ''
+
+# === 跑一次：服务端不丢包，所有损伤都由代理加；客户端连代理的端口，传完后解析汇总和代理的统计 ===
+def run_one(scenario, mode, cc, args):
+    up, down = SCENARIOS[scenario]
+    server_port, relay_port = free_port(), free_port()
+    server = subprocess.Popen([sys.executable, SERVER_SCRIPT, str(server_port), '0'],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    relay = subprocess.Popen([sys.executable, RELAY_SCRIPT, str(relay_port), '127.0.0.1', str(server_port),
+                              '--up', up, '--down', down, '--seed', str(args.seed)],
+                             stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    result = {'scenario': scenario, 'mode': mode, 'cc': cc}
+    try:
+        time.sleep(0.3)  # 等服务端和代理 bind 好
+        begin = time.monotonic()
+        try:
+            proc = subprocess.run([sys.executable, CLIENT_SCRIPT, '127.0.0.1', str(relay_port), str(args.packets), mode,
+                                   '--cc', cc, '--mss', str(args.mss), '--seed', str(args.seed)],
+                                  capture_output=True, text=True, timeout=args.timeout)
+        except subprocess.TimeoutExpired:
+            proc = None
+        result['wall'] = time.monotonic() - begin  # 从握手到挥手结束，包括 SYN / FIN 的重发
+    finally:
+        relay_out = stop(relay)
+        stop(server, signal.SIGTERM)
+
+    stopped = [line for line in relay_out.splitlines() if 'Stopped.' in line]
+    result['relay'] = dict((k, int(v)) for k, v in RELAY_STATS.findall(stopped[-1].split('| down:')[0])) if stopped else {}
+    if proc is None:
+        return result  # 超时的一行只有墙钟时间
+    if proc.returncode:
+        # 客户端中途崩溃时汇总可能已经打印了一部分，不能当成正常结果
+        raise RuntimeError(f"client exited with {proc.returncode} (scenario={scenario}, mode={mode}, cc={cc}):\n"
+                           f"{proc.stderr.strip()}")
+    out = proc.stdout
+    for key, pattern in SUMMARY.items():
+        m = pattern.search(out)
+        if not m:
+            raise RuntimeError(f"client output has no {key} line (scenario={scenario}, mode={mode}, cc={cc})")
+        result[key] = m.group(1)
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description='经过 netem.py 代理，在延迟、抖动、乱序、复制、限速、丢包等场景下对比 SR / GBN 和拥塞控制')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                        help=f"逗号分隔的场景，可选：{', '.join(SCENARIOS)}")
+    parser.add_argument('--modes', default='gbn,sr', help='逗号分隔的模式')
+    parser.add_argument('--ccs', default='fixed,reno', help='逗号分隔的拥塞控制算法')
+    parser.add_argument('--packets', type=int, default=500, help='每次传多少个数据块')
+    parser.add_argument('--mss', type=int, default=80, help='客户端请求的 mss')
+    parser.add_argument('--seed', type=int, default=1, help='数据块和代理损伤的随机种子，同一个种子每次结果可复现')
+    parser.add_argument('--timeout', type=float, default=300, help='单次传输最多等多少秒')
+    args = parser.parse_args()
+    for scenario in args.scenarios.split(','):
+        if scenario not in SCENARIOS:
+            parser.error(f"unknown scenario '{scenario}'")
+
+    print(f"{'scenario':>9} {'mode':>5} {'cc':>6} {'time(s)':>9} {'wall(s)':>9} {'sent':>7} {'retx ratio':>11} "
+          f"{'goodput KB/s':>13} {'up lost':>8}")
+    for scenario in args.scenarios.split(','):
+        for mode in args.modes.split(','):
+            for cc in args.ccs.split(','):
+                r = run_one(scenario, mode, cc, args)
+                relay = r['relay']
+                lost = relay.get('lost', 0) + relay.get('burst_lost', 0) + relay.get('queue_drops', 0)
+                if 'sent' not in r:
+                    print(f"{scenario:>9} {mode:>5} {cc:>6} {'timeout':>9} {r['wall']:>9.2f} {'-':>7} {'-':>11} "
+                          f"{'-':>13} {lost:>8}")
+                    continue
+                sent = int(r['sent'])
+                print(f"{scenario:>9} {r['mode']:>5} {cc:>6} {float(r['seconds']):>9.3f} {r['wall']:>9.2f} {sent:>7} "
+                      f"{(sent - args.packets) / sent:>11.3f} {float(r['goodput']):>13.2f} {lost:>8}")
+
+if __name__ == '__main__':
+    main()
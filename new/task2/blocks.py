@@ -0,0 +1,145 @@
+import os
+import mmap
+import random
+
+# === 数据块的字节范围：blocks 里第 i 块（从 1 开始）是 (起始字节, 长度, payload)，字节从 1 开始连续编号 ===
+
+UPPERCASE = bytes(65 + i % 26 for i in range(256))  # 随机字节 -> 大写字母的查表，一次 translate 转完整块
+
+# === 协议头里的 seq / ack / SACK 区间只有 32 位：发出去时取低 32 位，收到时还原成离参照字节号最近的完整字节号 ===
+# 两端在内部都用不回绕的字节号，只要未确认的数据少于 2 GB，超过 4 GB 的传输也不会认错
+SEQ_BITS = 32
+SEQ_MOD = 1 << SEQ_BITS
+
+def wrap(byte):
+    return byte % SEQ_MOD
+
+def unwrap(value, near):
+    #value 是 32 位的序号，near 是接收方当前的参照字节号（期望的下一个字节 / 发送窗口的 base）
+    return near + (value - near + SEQ_MOD // 2) % SEQ_MOD - SEQ_MOD // 2
+
+# === ACK 号 -> 块序号的索引 ===
+# 服务端的 ACK 号是累计确认到的下一个字节，按块推进，所以总落在某一块的末尾 + 1 上：
+# 查到的就是被这个 ACK 完全确认的最后一块，它之前的块也都确认了（一个 ACK 可以一次覆盖多块）
+def build_ack_index(blocks):
+    if isinstance(blocks, FileBlocks):
+        return FileIndex(blocks, at_end=True)
+    if isinstance(blocks, RandomBlocks):
+        return blocks.ends  # 只有还没确认的块，随生成和确认一起更新
+    return {start_byte + length: i for i, (start_byte, length, _) in enumerate(blocks, start=1)}
+
+# === 起始字节 -> 块序号的索引，SR 模式下按 SACK 区间的起点定位块 ===
+def build_seq_index(blocks):
+    if isinstance(blocks, FileBlocks):
+        return FileIndex(blocks, at_end=False)
+    if isinstance(blocks, RandomBlocks):
+        return blocks.starts
+    return {start_byte: i for i, (start_byte, _, _) in enumerate(blocks, start=1)}
+
+# === 要发送的文件：按 mss 切块，块 i 是 ((i-1)*mss+1, 长度, payload)，只有最后一块可能短一些 ===
+# 用起来和 [(起始字节, 长度, payload)] 列表一样，但 payload 在取这一块时才从 mmap 里切出来，
+# 大文件也不用整个读进内存；块边界是算出来的，不用存
+class FileBlocks:
+    def __init__(self, path, mss):
+        self.file = open(path, 'rb')
+        self.size = os.fstat(self.file.fileno()).st_size
+        self.mss = mss
+        # 空文件不能 mmap，反正也没有块可取
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else b''
+
+    def __len__(self):
+        return (self.size + self.mss - 1) // self.mss
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        offset = i * self.mss
+        length = min(self.mss, self.size - offset)
+        return offset + 1, length, self.data[offset:offset + length]
+
+    def start(self, idx):
+        #第 idx 块（从 1 开始）的起始字节；idx 超过最后一块时是总字节数 + 1
+        return min((idx - 1) * self.mss, self.size) + 1
+
+    def release(self, idx):
+        #idx 之前的块都确认了；块是从文件里现读的，没有要释放的
+        pass
+
+    def close(self):
+        if self.size:
+            self.data.close()
+        self.file.close()
+
+# === FileBlocks 的 ACK 号 / 起始字节 -> 块序号，和 build_*_index 返回的字典一样用 get 查，直接算不用建表 ===
+class FileIndex:
+    def __init__(self, blocks, at_end):
+        self.blocks = blocks
+        self.at_end = at_end  # True：按块末尾 + 1 查（ACK 号）；False：按起始字节查（SACK 区间起点）
+
+    def get(self, byte, default=None):
+        count = len(self.blocks)
+        if self.at_end and byte == self.blocks.size + 1 and count:
+            return count  # 最后一块可能不满 mss
+        q, r = divmod(byte - 1, self.blocks.mss)
+        if r:
+            return default
+        if self.at_end:
+            return q if 1 <= q < count else default  # 除了最后一块都是满的
+        return q + 1 if q < count else default
+
+# === 随机大写字母数据块：长度 min_len~max_len，发到哪一块才生成哪一块 ===
+# 用起来和 FileBlocks 一样；只保存生成了但还没被累计确认的块，块数再多，开始发送前也不用等，内存也只和窗口有关
+class RandomBlocks:
+    def __init__(self, count, min_len, max_len, seed=None):
+        self.count = count
+        self.min_len = min_len
+        self.max_len = max_len
+        self.rng = random.Random(seed)  # 同一个种子生成完全相同的块
+        self.live = {}                   # 块序号 -> (起始字节, 长度, payload)
+        self.ends = {}                   # 块末尾 + 1 -> 块序号，就是 ACK 索引
+        self.starts = {}                 # 起始字节 -> 块序号，就是 SACK 索引
+        self.generated = 0               # 已经生成到第几块
+        self.first = 1                   # 最早一块还没释放的块
+        self.next_start = 1              # 下一块的起始字节
+
+    def __len__(self):
+        return self.count
+
+    def generate(self, idx):
+        #按顺序生成到第 idx 块（块的起始字节取决于前面所有块的长度，只能依次生成）
+        while self.generated < min(idx, self.count):
+            self.generated += 1
+            length = self.rng.randint(self.min_len, self.max_len)
+            payload = self.rng.randbytes(length).translate(UPPERCASE)  # 整块一次生成，不用每个字节调一次 randint
+            self.live[self.generated] = (self.next_start, length, payload)
+            self.starts[self.next_start] = self.generated
+            self.next_start += length
+            self.ends[self.next_start] = self.generated
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self.count
+        if not 0 <= i < self.count:
+            raise IndexError(i)
+        self.generate(i + 1)
+        return self.live[i + 1]  # 已经释放的块取不到（KeyError）
+
+    def start(self, idx):
+        #第 idx 块（从 1 开始）的起始字节；idx 超过最后一块时是总字节数 + 1
+        self.generate(idx - 1)
+        if idx > self.generated:
+            return self.next_start
+        return self.live[idx][0]
+
+    def release(self, idx):
+        #idx 之前的块都被累计确认了，不会再发，丢掉
+        for old in range(self.first, min(idx, self.generated + 1)):
+            start, length, _ = self.live.pop(old)
+            del self.starts[start]
+            del self.ends[start + length]
+        self.first = max(self.first, idx)
+
+    def close(self):
+        pass
@@ -0,0 +1,86 @@
+import time
+
+# ====== 拥塞控制 ======
+INITIAL_WINDOW = 4         # 初始 cwnd（MSS 个数）
+INITIAL_SSTHRESH = 64 * 1024  # 初始慢启动阈值（字节），第一次丢包前一直慢启动；mss 很大时至少 INITIAL_SSTHRESH_SEGMENTS 个 MSS
+INITIAL_SSTHRESH_SEGMENTS = 16
+MIN_SSTHRESH = 2           # 丢包后 ssthresh 至少这么多个 MSS
+FIXED_WINDOW_BYTES = 400   # 固定窗口：最多这么多字节未确认（mss 不是 80 时按 FIXED_WINDOW_BLOCKS 个 MSS 算）
+FIXED_WINDOW_BLOCKS = 5    # 固定窗口：最多这么多块未确认
+
+# === 所有控制器的共同接口：发送方按 can_send 决定能不能再发一块，在确认 / 丢包 / 超时时通知它 ===
+# cwnd 每次变化都往 trace（CSV 文件对象，可以为 None）里写一行：时间,cwnd,ssthresh，方便画图
+class CongestionControl:
+    name = None
+
+    def __init__(self, mss, trace=None):
+        self.mss = mss
+        self.trace = trace
+        self.start = time.time()
+        self.cwnd = 0
+        self.ssthresh = 0
+        if trace:
+            trace.write('time,cwnd,ssthresh\n')
+
+    def log(self):
+        if self.trace:
+            self.trace.write(f"{time.time() - self.start:.6f},{self.cwnd:.0f},{self.ssthresh:.0f}\n")
+
+    def can_send(self, in_flight, length, count):
+        # in_flight：已发出未确认的字节数，count：未确认的块数；窗口空的时候至少能发一块
+        return in_flight == 0 or in_flight + length <= self.cwnd
+
+    def on_ack(self, acked_bytes):
+        pass  # 有新数据被累计确认
+
+    def on_loss(self, in_flight):
+        pass  # 三个重复 ACK，快速重传
+
+    def on_timeout(self, in_flight):
+        pass  # 重传定时器超时
+
+# === 固定窗口：原来的 5 块 / 400 字节，不随网络情况变化 ===
+class FixedWindow(CongestionControl):
+    name = 'fixed'
+
+    def __init__(self, mss, trace=None, window_bytes=None, window_blocks=FIXED_WINDOW_BLOCKS):
+        super().__init__(mss, trace)
+        self.cwnd = window_bytes or max(FIXED_WINDOW_BYTES, window_blocks * mss)
+        self.ssthresh = self.cwnd
+        self.window_blocks = window_blocks
+        self.log()
+
+    def can_send(self, in_flight, length, count):
+        return count < self.window_blocks and super().can_send(in_flight, length, count)
+
+# === 慢启动 + AIMD（Reno 的窗口规则，按字节计） ===
+# 慢启动：每确认一段数据 cwnd 增加 min(确认字节数, MSS)，每个 RTT 大约翻倍；
+# 超过 ssthresh 后拥塞避免：每个 RTT 大约增加一个 MSS；
+# 快速重传：ssthresh = cwnd 减半，cwnd 降到 ssthresh；超时：ssthresh 减半，cwnd 回到 1 个 MSS 重新慢启动
+class Reno(CongestionControl):
+    name = 'reno'
+
+    def __init__(self, mss, trace=None):
+        super().__init__(mss, trace)
+        self.cwnd = INITIAL_WINDOW * mss
+        self.ssthresh = max(INITIAL_SSTHRESH, INITIAL_SSTHRESH_SEGMENTS * mss)
+        self.log()
+
+    def on_ack(self, acked_bytes):
+        if self.cwnd < self.ssthresh:
+            self.cwnd += min(acked_bytes, self.mss)  # 慢启动
+        else:
+            self.cwnd += self.mss * acked_bytes / self.cwnd  # 拥塞避免：加性增
+        self.log()
+
+    def on_loss(self, in_flight):
+        self.ssthresh = max(in_flight / 2, MIN_SSTHRESH * self.mss)  # 乘性减
+        self.cwnd = self.ssthresh
+        self.log()
+
+    def on_timeout(self, in_flight):
+        self.ssthresh = max(in_flight / 2, MIN_SSTHRESH * self.mss)
+        self.cwnd = self.mss  # 超时说明 ACK 时钟断了，从 1 个 MSS 重新慢启动
+        self.log()
+
+CONTROLLERS = {cls.name: cls for cls in (Reno, FixedWindow)}
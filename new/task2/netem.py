@@ -0,0 +1,236 @@
+import time
+import heapq
+import random
+import socket
+import argparse
+import itertools
+import selectors
+import threading
+
+# ====== 网络损伤代理 ======
+# 在本机 UDPclient.py 和 UDPServer 之间转发 UDP 包，两个方向各自按配置丢包、延迟、抖动、乱序、复制、限速
+# 客户端连代理的端口；代理给每个客户端地址开一个上游 socket，服务端看到的还是一个客户端一个地址
+RECV_SIZE = 65535              # 一个 UDP 包最大的长度，大 mss 的包也不会被截断
+RECV_BUFFER = 4 * 1024 * 1024  # 监听 socket 的接收缓冲区
+IP_UDP_HEADERS = 28            # 限速时每个包额外算上 IPv4 + UDP 头
+MAX_POLL_INTERVAL = 1.0        # 没有包也没有到期的包时最多阻塞多久就回来检查 running
+IDLE_TIMEOUT = 60.0            # 客户端多久没有包就关掉它的上游 socket
+
+# === 一个方向的损伤配置，格式 "delay=20,jitter=5,loss=0.01"，没写的项都是 0（不损伤） ===
+# delay / jitter / reorder_delay 单位毫秒，rate 单位 kbit/s，queue 是限速队列最多排多少个包
+# 丢包：loss 是独立丢包的概率；ge_p / ge_r 是 Gilbert-Elliott 模型里 好->坏 / 坏->好 的转移概率，
+#       坏状态下按 ge_bad 丢包、好状态下按 ge_good 丢包，平均丢包率约为 ge_p / (ge_p + ge_r) * ge_bad
+IMPAIRMENT_KEYS = {
+    'delay': 0.0,          # 固定单向延迟
+    'jitter': 0.0,         # 每个包的延迟在 delay ± jitter 里均匀取（抖动本身也会造成乱序）
+    'loss': 0.0,           # 独立丢包概率
+    'ge_p': 0.0,           # Gilbert-Elliott：好状态 -> 坏状态的概率（每个包一次）
+    'ge_r': 1.0,           # Gilbert-Elliott：坏状态 -> 好状态的概率
+    'ge_bad': 1.0,         # 坏状态下的丢包概率
+    'ge_good': 0.0,        # 好状态下的丢包概率
+    'dup': 0.0,            # 复制一份的概率
+    'reorder': 0.0,        # 额外多延迟 reorder_delay 的概率，后面的包会超过它
+    'reorder_delay': 10.0, # 被乱序的包多延迟多久
+    'rate': 0.0,           # 带宽上限，0 表示不限速
+    'queue': 100,          # 限速时队列里最多排多少个包，满了再来的直接丢（drop-tail）
+}
+
+def parse_impairment(spec):
+    #"key=value,..." -> 配置字典，没写的项取默认值
+    config = dict(IMPAIRMENT_KEYS)
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        key, _, value = item.partition('=')
+        if key not in config:
+            raise ValueError(f"unknown impairment '{key}', expected one of: {', '.join(IMPAIRMENT_KEYS)}")
+        config[key] = float(value)
+    return config
+
+# === 一个方向（client->server 或 server->client）的损伤：决定每个包丢不丢、送几份、什么时候送到 ===
+# 每个方向有自己的随机数发生器，同一个种子下第 n 个包的命运总是一样的，另一个方向的包怎么交错都不影响
+class Direction:
+    def __init__(self, name, config, seed):
+        self.name = name
+        self.config = config
+        self.rng = random.Random(seed)
+        self.bad = False          # Gilbert-Elliott 当前是不是坏状态
+        self.link_free = 0.0      # 限速链路什么时候发完已经排队的包
+        self.queue = []           # 限速队列里每个包发完的时间（小顶堆），用来算队列长度
+        self.stats = {'packets': 0, 'bytes': 0, 'lost': 0, 'burst_lost': 0, 'queue_drops': 0,
+                      'duplicated': 0, 'reordered': 0}
+
+    def lose(self):
+        #独立丢包 + Gilbert-Elliott 丢包，每个包都推进一次状态，丢包与否和包的大小无关
+        c = self.config
+        if c['ge_p']:
+            self.bad = self.rng.random() >= c['ge_r'] if self.bad else self.rng.random() < c['ge_p']
+            if self.rng.random() < (c['ge_bad'] if self.bad else c['ge_good']):
+                self.stats['burst_lost'] += 1
+                return True
+        if c['loss'] and self.rng.random() < c['loss']:
+            self.stats['lost'] += 1
+            return True
+        return False
+
+    def admit(self, size, now):
+        #一个包进来，返回它（和复制出来的那份）到达对端的时间；空列表表示丢了
+        c = self.config
+        self.stats['packets'] += 1
+        self.stats['bytes'] += size
+        if self.lose():
+            return []
+        copies = 1
+        if c['dup'] and self.rng.random() < c['dup']:
+            copies = 2
+            self.stats['duplicated'] += 1
+
+        arrivals = []
+        for _ in range(copies):
+            sent = now
+            if c['rate']:
+                # 限速：按比特数排队发送；队列满了丢掉
+                while self.queue and self.queue[0] <= now:
+                    heapq.heappop(self.queue)
+                if len(self.queue) >= c['queue']:
+                    self.stats['queue_drops'] += 1
+                    continue
+                self.link_free = max(self.link_free, now) + (size + IP_UDP_HEADERS) * 8 / (c['rate'] * 1000)
+                heapq.heappush(self.queue, self.link_free)
+                sent = self.link_free
+            delay = c['delay']
+            if c['jitter']:
+                delay += self.rng.uniform(-c['jitter'], c['jitter'])
+            if c['reorder'] and self.rng.random() < c['reorder']:
+                delay += c['reorder_delay']
+                self.stats['reordered'] += 1
+            arrivals.append(sent + max(0.0, delay) / 1000)
+        return arrivals
+
+    def summary(self):
+        return f"{self.name}: " + ' '.join(f"{k}={v}" for k, v in self.stats.items())
+
+# === 代理本身：一个线程里的 selector 循环，到达时间没到的包放在定时堆里 ===
+class Relay:
+    def __init__(self, listen_port, server, up, down, seed=1, host='127.0.0.1', idle_timeout=IDLE_TIMEOUT):
+        self.server = server                      # (服务端 IP, 端口)
+        self.up = Direction('up', up, seed * 2)   # 客户端 -> 服务端
+        self.down = Direction('down', down, seed * 2 + 1)  # 服务端 -> 客户端
+        self.idle_timeout = idle_timeout
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)  # 客户端连的 socket
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECV_BUFFER)
+        self.sock.bind((host, listen_port))
+        self.sock.setblocking(False)
+        self.sel = selectors.DefaultSelector()
+        self.sel.register(self.sock, selectors.EVENT_READ, None)  # data 是 None 表示从客户端来的
+        self.upstreams = {}                       # 客户端地址 -> [上游 socket, 最近一次活动时间]
+        self.pending = []                         # (到达时间, 序号, socket, 包, 目的地址) 小顶堆
+        self.counter = itertools.count()          # 到达时间相同时按进来的先后送
+        self.running = True
+
+    def upstream_for(self, addr, now):
+        #客户端地址对应的上游 socket，第一次见到这个地址时新建
+        entry = self.upstreams.get(addr)
+        if entry is None:
+            up_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            up_sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECV_BUFFER)
+            up_sock.setblocking(False)
+            up_sock.bind(('0.0.0.0', 0))
+            self.sel.register(up_sock, selectors.EVENT_READ, addr)  # data 是这个上游 socket 对应的客户端地址
+            entry = self.upstreams[addr] = [up_sock, now]
+            print(f"[Relay] New client {addr}")
+        entry[1] = now
+        return entry[0]
+
+    def evict_idle(self, now):
+        #关掉空闲太久的客户端的上游 socket
+        for addr, (up_sock, last_seen) in list(self.upstreams.items()):
+            if now - last_seen >= self.idle_timeout:
+                self.sel.unregister(up_sock)
+                up_sock.close()
+                del self.upstreams[addr]
+
+    def schedule(self, direction, data, now, sock, dest):
+        for arrival in direction.admit(len(data), now):
+            heapq.heappush(self.pending, (arrival, next(self.counter), sock, data, dest))
+
+    def drain(self, sock, client_addr, now):
+        #把 socket 里排着的包都收出来，交给对应方向决定命运
+        while True:
+            try:
+                data, addr = sock.recvfrom(RECV_SIZE)
+            except (BlockingIOError, ConnectionError):
+                return  # 收空了；ICMP 端口不可达之类的错误也忽略
+            if client_addr is None:
+                self.schedule(self.up, data, now, self.upstream_for(addr, now), self.server)
+            else:
+                self.upstreams[client_addr][1] = now
+                self.schedule(self.down, data, now, self.sock, client_addr)
+
+    def deliver_due(self, now):
+        #送出所有到达时间已到的包
+        while self.pending and self.pending[0][0] <= now:
+            _, _, sock, data, dest = heapq.heappop(self.pending)
+            try:
+                sock.sendto(data, dest)
+            except OSError:
+                pass  # 发送缓冲区满了或者对端不在了，当作丢了
+
+    def run(self):
+        print(f"[Relay] {self.sock.getsockname()} -> {self.server}")
+        print(f"[Relay] up: {self.up.config}")
+        print(f"[Relay] down: {self.down.config}")
+        last_evict = time.monotonic()
+        while self.running:
+            now = time.monotonic()
+            timeout = MAX_POLL_INTERVAL
+            if self.pending:
+                timeout = min(timeout, max(0.0, self.pending[0][0] - now))
+            for key, _ in self.sel.select(timeout):
+                self.drain(key.fileobj, key.data, time.monotonic())
+            now = time.monotonic()
+            self.deliver_due(now)
+            if now - last_evict >= MAX_POLL_INTERVAL:
+                self.evict_idle(now)
+                last_evict = now
+
+    def start(self):
+        #在后台线程里转发
+        self.thread = threading.Thread(target=self.run)
+        self.thread.start()
+
+    def stop(self):
+        #停止转发，打印两个方向的统计
+        self.running = False
+        self.thread.join()  # 循环最多 MAX_POLL_INTERVAL 秒就会检查一次 running
+        for up_sock, _ in self.upstreams.values():
+            up_sock.close()
+        self.sock.close()
+        print(f"[Relay] Stopped. {self.up.summary()} | {self.down.summary()}")
+
+# === 命令行执行入口 ===
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='UDP 网络损伤代理：客户端连这个端口，包按配置损伤后转给服务端')
+    parser.add_argument('listen_port', type=int, help='代理监听的端口（客户端连这里）')
+    parser.add_argument('server_ip', help='服务端 IP')
+    parser.add_argument('server_port', type=int, help='服务端端口')
+    parser.add_argument('--up', default='', help='客户端 -> 服务端方向的损伤，例如 "delay=20,jitter=5,loss=0.01"；'
+                                                 f"可用的项：{', '.join(IMPAIRMENT_KEYS)}")
+    parser.add_argument('--down', default='', help='服务端 -> 客户端方向的损伤，格式同 --up')
+    parser.add_argument('--both', default='', help='两个方向共用的损伤，--up / --down 里写了的项覆盖它')
+    parser.add_argument('--seed', type=int, default=1, help='随机种子，同一个种子每次损伤的包完全相同')
+    parser.add_argument('--host', default='127.0.0.1', help='代理监听的地址')
+    args = parser.parse_args()
+
+    try:
+        up = parse_impairment(','.join((args.both, args.up)))
+        down = parse_impairment(','.join((args.both, args.down)))
+    except ValueError as e:
+        parser.error(str(e))
+
+    relay = Relay(args.listen_port, (args.server_ip, args.server_port), up, down, args.seed, args.host)
+    relay.start()
+
+    try:
+        while True:
+            time.sleep(1)  # 主线程阻塞，保持代理活着
+    except KeyboardInterrupt:
+        relay.stop()  # Ctrl+C 时关闭
@@ -0,0 +1,53 @@
+import math
+
+# ====== 重传超时（RTO）估计，按 RFC 6298 ======
+RTT_ALPHA = 1 / 8      # SRTT 的平滑系数
+RTT_BETA = 1 / 4       # RTTVAR 的平滑系数
+RTT_K = 4              # RTO = SRTT + K × RTTVAR
+CLOCK_GRANULARITY = 0.001  # 时钟粒度（秒），RTTVAR 很小时 RTO 至少比 SRTT 多这么多
+INITIAL_RTO = 0.3      # 还没有 RTT 样本时的 RTO（秒）
+MIN_RTO = 0.05         # RTO 下限（秒），本机 RTT 只有零点几毫秒，太小会频繁误重传
+MAX_RTO = 60.0         # RTO 上限（秒），连续退避时不会无限增长
+
+# === 平滑 RTT + RTT 方差算 RTO，每个样本 O(1)，只保存几个数 ===
+# 调用方负责 Karn 规则：重传过的块，它的 ACK 分不清对应哪一次发送，不要拿来 sample
+class RttEstimator:
+    def __init__(self, initial_rto=INITIAL_RTO, min_rto=MIN_RTO, max_rto=MAX_RTO):
+        self.min_rto = min_rto
+        self.max_rto = max_rto
+        self.rto = initial_rto
+        self.srtt = None     # 平滑 RTT，第一个样本之前为 None
+        self.rttvar = None   # RTT 平均偏差
+        self.backoffs = 0    # 累计退避次数
+        # === 汇总用的运行统计（Welford 算法），不用保存所有样本 ===
+        self.count = 0
+        self.min = math.inf
+        self.max = 0.0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def sample(self, rtt):
+        #用一个有效的 RTT 样本（秒）更新 SRTT / RTTVAR / RTO，退避随之清除
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = (1 - RTT_BETA) * self.rttvar + RTT_BETA * abs(self.srtt - rtt)  # 先用旧的 SRTT
+            self.srtt = (1 - RTT_ALPHA) * self.srtt + RTT_ALPHA * rtt
+        self.rto = min(self.max_rto, max(self.min_rto, self.srtt + max(CLOCK_GRANULARITY, RTT_K * self.rttvar)))
+
+        self.count += 1
+        self.min = min(self.min, rtt)
+        self.max = max(self.max, rtt)
+        delta = rtt - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (rtt - self.mean)
+
+    def backoff(self):
+        #发生超时重传：RTO 翻倍（指数退避），直到下一个有效样本
+        self.rto = min(self.max_rto, self.rto * 2)
+        self.backoffs += 1
+
+    def std(self):
+        #样本标准差，和 pandas 的 std 一致（n - 1）
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0.0
@@ -29,28 +29,26 @@ window_size = 5
 base = 1
 next_seq = 1
 
-blocks = []
-blocks_bytes = []
+# 数据块发到哪个才生成哪个，确认过的就删掉：seq -> (起始字节, 结束字节, payload)
+UPPERCASE = bytes(65 + i % 26 for i in range(256))  # 随机字节 -> 大写字母
+blocks = {}
 start = 1
-for _ in range(total_packets):
-    payload_len = random.randint(40, 80)
-    payload = bytes([random.randint(65, 90) for _ in range(payload_len)])
-    blocks.append(payload)
-    end = start + payload_len - 1
-    blocks_bytes.append((start, end))
-    start = end + 1
 
 send_times = {}
-rtts = []
-acked_seq = set()   # ✅ 新增：记录收到 ACK 的唯一序号
+rtt_count = 0
+rtt_sum = 0.0
+rtt_sq_sum = 0.0
+rtt_max = 0.0
+rtt_min = float('inf')
+acked_count = 0   # 收到 ACK 的唯一序号个数
 
 DEFAULT_TIMEOUT = 0.3
 
 # === GBN 主循环 ===
 while base <= total_packets:
     # 动态超时计算
-    if rtts:
-        avg_rtt = sum(rtts) / len(rtts)
+    if rtt_count:
+        avg_rtt = rtt_sum / rtt_count
         timeout = avg_rtt * 5
         if timeout < 0.05:
             timeout = 0.05
@@ -60,12 +58,15 @@ while base <= total_packets:
 
     # 发送窗口内数据块
     while next_seq < base + window_size and next_seq <= total_packets:
-        payload = blocks[next_seq - 1]
+        payload_len = random.randint(40, 80)
+        payload = random.randbytes(payload_len).translate(UPPERCASE)
+        blocks[next_seq] = (start, start + payload_len - 1, payload)
+        start += payload_len
         header = struct.pack('!I B B H', next_seq, 3, 0, len(payload))
         client.sendto(header + payload, (server_ip, server_port))
         send_times[next_seq] = time.time()
 
-        start_byte, end_byte = blocks_bytes[next_seq - 1]
+        start_byte, end_byte, _ = blocks[next_seq]
         print(f"Sent: DATA {next_seq} （第 {start_byte}~{end_byte} 字节）")
 
         next_seq += 1
@@ -75,35 +76,42 @@ while base <= total_packets:
         recv_time = time.time()
         seq, pkt_type, flags, _, hh, mm, ss = struct.unpack('!I B B H H H H', data)
 
-        if pkt_type == 4:
+        if pkt_type == 4 and seq >= base:  # 已经确认过的块不会再有 ACK 的作用，它们的数据也删掉了
             RTT = recv_time - send_times[seq]
-            rtts.append(RTT)
+            rtt_count += 1
+            rtt_sum += RTT
+            rtt_sq_sum += RTT * RTT
+            rtt_max = max(rtt_max, RTT)
+            rtt_min = min(rtt_min, RTT)
 
-            acked_seq.add(seq)  # ✅ 新增：去重记录
+            acked_count += 1
 
-            start_byte, end_byte = blocks_bytes[seq - 1]
+            start_byte, end_byte, _ = blocks[seq]
             print(f"Received: ACK {seq} （第 {start_byte}~{end_byte} 字节）RTT = {RTT*1000:.2f} ms, ServerTime: {hh:02}:{mm:02}:{ss:02}")
 
+            for done in range(base, seq + 1):
+                del blocks[done]
+                del send_times[done]
             base = seq + 1
 
     except socket.timeout:
         print(f"Timeout, retransmitting window [{base} ~ {next_seq - 1}]")
         for seq in range(base, next_seq):
-            payload = blocks[seq - 1]
+            start_byte, end_byte, payload = blocks[seq]
             header = struct.pack('!I B B H', seq, 3, 0, len(payload))
             client.sendto(header + payload, (server_ip, server_port))
             send_times[seq] = time.time()
 
-            start_byte, end_byte = blocks_bytes[seq - 1]
             print(f"重传第 {seq} 个 （第 {start_byte}~{end_byte} 字节）")
 
 # === 统计汇总 ===
-loss_rate = (total_packets - len(acked_seq)) / total_packets
+loss_rate = (total_packets - acked_count) / total_packets
+rtt_avg = rtt_sum / rtt_count
 print("\n=== 传输完成 ===")
 print(f"丢包率: {loss_rate*100:.2f}%")
-print(f"RTT max: {max(rtts)*1000:.2f} ms")
-print(f"RTT min: {min(rtts)*1000:.2f} ms")
-print(f"RTT avg: {sum(rtts)/len(rtts)*1000:.2f} ms")
-print(f"RTT std: {((sum([(r - sum(rtts)/len(rtts))**2 for r in rtts])/len(rtts))**0.5)*1000:.2f} ms")
+print(f"RTT max: {rtt_max*1000:.2f} ms")
+print(f"RTT min: {rtt_min*1000:.2f} ms")
+print(f"RTT avg: {rtt_avg*1000:.2f} ms")
+print(f"RTT std: {max(0.0, rtt_sq_sum / rtt_count - rtt_avg ** 2) ** 0.5 * 1000:.2f} ms")
 
 client.close()